@@ -3,8 +3,9 @@
 视频解析API服务
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 import logging
+import time
 from typing import Dict, Any
 
 # 设置日志
@@ -16,9 +17,67 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from core.parser import parse_video_url
+from core.deadline import clamp_timeout
+from core.admission import AdmissionRejected, ThreadLane, create_default_controller
+from core.ratelimit import RateLimitExceeded, client_identity, create_default_limiter
 
 app = Flask(__name__)
 
+# 准入控制：解析请求限制并发并短暂排队，饱和时快速拒绝
+admission_controller = create_default_controller(ThreadLane)
+admission_controller.add_rule('POST', r'^/api/parse$', 'interactive')
+
+# 客户端限流：按令牌或 IP 限制每分钟请求数和每日配额
+rate_limiter = create_default_limiter()
+rate_limiter.add_rule('POST', r'^/api/parse$', 'parse')
+
+@app.before_request
+def limit_client():
+    """客户端超过限流或配额时返回 429"""
+    policy = rate_limiter.classify(request.method, request.path)
+    if policy is None:
+        return None
+    identity, multiplier = client_identity(request.headers, request.remote_addr)
+    try:
+        rate_limiter.check(policy, identity, multiplier)
+    except RateLimitExceeded as e:
+        response = jsonify({
+            'success': False,
+            'error': f"{str(e)}，请 {e.retry_after} 秒后重试"
+        })
+        response.status_code = e.status_code
+        response.headers['Retry-After'] = str(e.retry_after)
+        response.headers['X-RateLimit-Limit'] = str(e.limit)
+        return response
+    return None
+
+@app.before_request
+def admit_request():
+    """按通道获取执行名额，通道饱和时返回 429/503"""
+    lane = admission_controller.classify(request.method, request.path)
+    if lane is None:
+        return None
+    try:
+        lane.acquire()
+    except AdmissionRejected as e:
+        response = jsonify({
+            'success': False,
+            'error': f"服务繁忙，请 {e.retry_after} 秒后重试"
+        })
+        response.status_code = e.status_code
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    g.admission = (lane, time.monotonic())
+    return None
+
+@app.teardown_request
+def release_admission(error=None):
+    """请求结束时归还执行名额"""
+    admission = g.pop('admission', None)
+    if admission is not None:
+        lane, start = admission
+        lane.release(time.monotonic() - start)
+
 @app.route('/api/parse', methods=['POST'])
 def parse_video():
     """解析视频API接口"""
@@ -40,7 +99,7 @@ def parse_video():
 
         # 解析视频
         logger.info(f"解析视频URL: {url}")
-        result = parse_video_url(url)
+        result = parse_video_url(url, clamp_timeout(data.get('timeout')))
 
         # 添加免责声明
         if result.get('success') and result.get('downloadable'):
@@ -116,6 +175,22 @@ def get_supported_platforms():
         'platforms': platforms
     })
 
+@app.route('/api/admission/stats', methods=['GET'])
+def get_admission_stats():
+    """获取各准入通道的并发、排队和拒绝统计"""
+    return jsonify({
+        'success': True,
+        'lanes': admission_controller.stats()
+    })
+
+@app.route('/api/ratelimit/stats', methods=['GET'])
+def get_rate_limit_stats():
+    """获取各限流策略的上限、放行和拒绝统计"""
+    return jsonify({
+        'success': True,
+        'stats': rate_limiter.stats()
+    })
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
@@ -141,4 +216,5 @@ def internal_error(error):
     }), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # 调试模式会启用重载器和交互式调试器，仅在显式设置 FLASK_DEBUG=1 时开启
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+准入控制模块
+
+按请求类型划分通道（lane），每个通道限制同时执行的请求数，
+超出部分在有界队列中短暂等待；队列已满或等待超时时立即拒绝，
+并根据近期处理耗时给出 Retry-After。交互式解析与批量/AI 请求
+使用独立的通道，批量任务再多也不会占用交互式请求的并发额度。
+
+ThreadLane 用于多线程服务（Flask），AsyncLane 用于 asyncio 服务（FastAPI）。
+"""
+
+import asyncio
+import math
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Pattern, Tuple
+
+# 交互式通道：单个视频解析
+INTERACTIVE_LIMIT = int(os.environ.get('ADMISSION_INTERACTIVE_LIMIT', 16))
+INTERACTIVE_QUEUE = int(os.environ.get('ADMISSION_INTERACTIVE_QUEUE', 32))
+INTERACTIVE_MAX_WAIT = float(os.environ.get('ADMISSION_INTERACTIVE_MAX_WAIT', 2.0))
+
+# 批量通道：批量分析、AI 生成等耗时请求
+BULK_LIMIT = int(os.environ.get('ADMISSION_BULK_LIMIT', 4))
+BULK_QUEUE = int(os.environ.get('ADMISSION_BULK_QUEUE', 8))
+BULK_MAX_WAIT = float(os.environ.get('ADMISSION_BULK_MAX_WAIT', 1.0))
+
+# 媒体通道：媒体代理的流式传输（播放期间持续占用名额）
+MEDIA_LIMIT = int(os.environ.get('ADMISSION_MEDIA_LIMIT', 64))
+MEDIA_QUEUE = int(os.environ.get('ADMISSION_MEDIA_QUEUE', 64))
+MEDIA_MAX_WAIT = float(os.environ.get('ADMISSION_MEDIA_MAX_WAIT', 2.0))
+
+# Retry-After 的取值范围（秒）
+RETRY_AFTER_MIN = 1
+RETRY_AFTER_MAX = 30
+
+# 处理耗时的指数滑动平均系数
+SERVICE_TIME_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """通道饱和，请求被拒绝"""
+
+    def __init__(self, lane: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"通道 '{lane}' 已饱和（{reason}）")
+        self.lane = lane
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Lane(ABC):
+    """通道的公共部分：配置、统计和 Retry-After 估算"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float,
+                 reject_status: int = 503):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait
+        self.reject_status = reject_status
+        self.in_flight = 0
+        self.service_time = 1.0
+        self._stats = {'admitted': 0, 'queued': 0, 'rejected_full': 0, 'rejected_timeout': 0}
+
+    @property
+    @abstractmethod
+    def waiting(self) -> int:
+        """排队等待的请求数"""
+        pass
+
+    def retry_after(self) -> int:
+        """排在队尾的请求大约需要等待多久才能得到执行机会"""
+        estimate = self.service_time * (self.waiting + 1) / self.limit
+        return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, math.ceil(estimate))))
+
+    def _rejected(self, reason: str) -> AdmissionRejected:
+        self._stats['rejected_full' if reason == 'queue_full' else 'rejected_timeout'] += 1
+        return AdmissionRejected(self.name, self.reject_status, self.retry_after(), reason)
+
+    def _record_service_time(self, elapsed: float):
+        self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({
+            'limit': self.limit,
+            'queue_size': self.queue_size,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'service_time': round(self.service_time, 3),
+        })
+        return stats
+
+
+class ThreadLane(_Lane):
+    """多线程服务使用的通道"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._condition = threading.Condition()
+        self._waiting = 0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def acquire(self):
+        """获取执行名额，通道饱和时抛出 AdmissionRejected"""
+        with self._condition:
+            if self.in_flight < self.limit and not self._waiting:
+                self.in_flight += 1
+                self._stats['admitted'] += 1
+                return
+            if self._waiting >= self.queue_size:
+                raise self._rejected('queue_full')
+
+            self._waiting += 1
+            self._stats['queued'] += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        # 超时与唤醒同时发生时把唤醒传给下一个等待者
+                        self._condition.notify()
+                        raise self._rejected('timeout')
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self.in_flight += 1
+            self._stats['admitted'] += 1
+
+    def release(self, elapsed: float):
+        """归还执行名额，elapsed 为本次处理耗时"""
+        with self._condition:
+            self.in_flight -= 1
+            self._record_service_time(elapsed)
+            self._condition.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return super().stats()
+
+
+class AsyncLane(_Lane):
+    """asyncio 服务使用的通道，名额按排队顺序直接移交给等待者"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """获取执行名额，通道饱和时抛出 AdmissionRejected"""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self._stats['admitted'] += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            raise self._rejected('queue_full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._stats['queued'] += 1
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            # 超时与移交同时发生时名额已属于本请求，转交给下一个等待者
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            else:
+                self._discard(waiter)
+            raise self._rejected('timeout')
+        except asyncio.CancelledError:
+            # 客户端断开；若名额恰好已移交，需要归还
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()
+            else:
+                self._discard(waiter)
+            raise
+        self._stats['admitted'] += 1
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _hand_over(self):
+        """把名额交给下一个仍在等待的请求，没有等待者时减少在途数"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def release(self, elapsed: float):
+        """归还执行名额，elapsed 为本次处理耗时"""
+        self._record_service_time(elapsed)
+        self._hand_over()
+
+
+class AdmissionController:
+    """按方法和路径把请求分配到通道，未匹配的请求不受限制"""
+
+    def __init__(self):
+        self.lanes: Dict[str, _Lane] = {}
+        self._rules: List[Tuple[Optional[str], Pattern, str]] = []
+
+    def add_lane(self, lane: _Lane):
+        self.lanes[lane.name] = lane
+
+    def add_rule(self, method: Optional[str], path_pattern: str, lane_name: str):
+        """method 为 None 时匹配所有方法；按添加顺序匹配，先匹配的规则生效"""
+        self._rules.append((method, re.compile(path_pattern), lane_name))
+
+    def classify(self, method: str, path: str) -> Optional[_Lane]:
+        for rule_method, pattern, lane_name in self._rules:
+            if (rule_method is None or rule_method == method) and pattern.match(path):
+                return self.lanes[lane_name]
+        return None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+
+def create_default_controller(lane_class) -> AdmissionController:
+    """创建包含 interactive 和 bulk 两个通道的控制器（规则由各应用添加）
+
+    交互式通道饱和时返回 503（服务端过载），批量通道饱和时返回 429（请客户端降低提交速度）。
+    """
+    controller = AdmissionController()
+    controller.add_lane(lane_class('interactive', INTERACTIVE_LIMIT, INTERACTIVE_QUEUE,
+                                   INTERACTIVE_MAX_WAIT, reject_status=503))
+    controller.add_lane(lane_class('bulk', BULK_LIMIT, BULK_QUEUE, BULK_MAX_WAIT,
+                                   reject_status=429))
+    return controller
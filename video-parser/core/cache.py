@@ -0,0 +1,603 @@
+# -*- coding: utf-8 -*-
+"""
+缓存后端模块
+
+提供统一的缓存后端接口及三种实现：
+- memory://                进程内 LRU，单进程部署使用
+- sqlite:///path/cache.db  同一主机的多个 worker 进程共享
+- redis://[:password@]host:port/db  多容器共享，使用 Redis 协议
+
+缓存值统一序列化为带一字节格式头的 JSON（较大的值用 zlib 压缩），
+各后端只保存字节串；计数器（incr）以十进制数字字节串保存。
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, unquote
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库
+    orjson = None
+
+# 缓存地址，默认使用进程内缓存
+CACHE_URL = os.environ.get('VIDEO_CACHE_URL', 'memory://')
+
+# 共享缓存中的键前缀，多个应用共用一个 Redis 时用于区分
+CACHE_KEY_PREFIX = os.environ.get('VIDEO_CACHE_PREFIX', 'vp:')
+
+# 进程内缓存条目上限
+MEMORY_CACHE_MAX_ENTRIES = 4096
+
+# SQLite 缓存条目上限，每写入 SQLITE_CACHE_PRUNE_INTERVAL 次清理一次
+SQLITE_CACHE_MAX_ENTRIES = 100000
+SQLITE_CACHE_PRUNE_INTERVAL = 500
+
+# Redis 连接参数
+REDIS_SOCKET_TIMEOUT = 1.0
+REDIS_POOL_SIZE = 16
+# Redis 不可用时暂停访问的时间（秒），避免每个请求都等待连接超时
+REDIS_RETRY_INTERVAL = 5.0
+
+# 超过该长度（字节）的值压缩后保存
+COMPRESS_THRESHOLD = 1024
+
+# 序列化格式头
+_FORMAT_JSON = b'j'
+_FORMAT_ZLIB = b'z'
+
+
+def encode_value(value: Any) -> bytes:
+    """序列化缓存值"""
+    if orjson is not None:
+        data = orjson.dumps(value)
+    else:
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(data) > COMPRESS_THRESHOLD:
+        # 压缩级别 1 的压缩率已足够，解压速度与级别无关
+        compressed = zlib.compress(data, 1)
+        if len(compressed) < len(data):
+            return _FORMAT_ZLIB + compressed
+    return _FORMAT_JSON + data
+
+
+def decode_value(data: bytes) -> Any:
+    """反序列化缓存值，格式无法识别时抛出 ValueError"""
+    header, body = data[:1], data[1:]
+    if header == _FORMAT_ZLIB:
+        body = zlib.decompress(body)
+    elif header != _FORMAT_JSON:
+        raise ValueError(f"未知的缓存值格式: {header!r}")
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+class CacheBackend(ABC):
+    """缓存后端接口，值为已序列化的字节串"""
+
+    # 是否在多个进程之间共享
+    shared = False
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """后端名称"""
+        pass
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """读取未过期的值，不存在时返回 None"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float):
+        """写入值，ttl 秒后过期"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        """删除值"""
+        pass
+
+    @abstractmethod
+    def clear(self, prefix: str = ''):
+        """删除以 prefix 开头的全部键"""
+        pass
+
+    @abstractmethod
+    def incr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        """原子地给计数器加 amount 并返回新值；计数器不存在时从 0 开始并在 ttl 秒后过期
+        （已存在时不延长过期时间）。后端不可用时返回 None"""
+        pass
+
+    def close(self):
+        """释放连接等资源"""
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """进程内 LRU 缓存"""
+
+    def __init__(self, max_entries: int = MEMORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return 'memory'
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def incr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                entry = (now + ttl, b'0')
+            value = int(entry[1]) + amount
+            self._entries[key] = (entry[0], str(value).encode('ascii'))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self, prefix: str = ''):
+        with self._lock:
+            if not prefix:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """SQLite 缓存，同一主机上的多个 worker 进程共享（WAL 模式，读写互不阻塞）
+
+    数据库被锁定、磁盘错误等访问失败时读取视为未命中、写入被丢弃，不影响调用方。
+    """
+
+    shared = True
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at);
+    """
+
+    def __init__(self, path: str, max_entries: int = SQLITE_CACHE_MAX_ENTRIES,
+                 busy_timeout_ms: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.busy_timeout_ms = busy_timeout_ms
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        return 'sqlite'
+
+    def _failed(self, e: Exception):
+        self.errors += 1
+        print(f"SQLite 缓存访问失败: {str(e)}")
+
+    def _connection(self) -> sqlite3.Connection:
+        # 连接不能跨 fork 复用，进程变化时重新打开
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                                   check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            conn.executescript(self._SCHEMA)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+                ).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            self._failed(e)
+            return None
+        return bytes(row[0]) if row else None
+
+    def set(self, key: str, value: bytes, ttl: float):
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, sqlite3.Binary(value), time.time() + ttl)
+                )
+                self._writes += 1
+                if self._writes % SQLITE_CACHE_PRUNE_INTERVAL == 0:
+                    self._prune(conn)
+        except (sqlite3.Error, OSError) as e:
+            self._failed(e)
+
+    def _prune(self, conn: sqlite3.Connection):
+        """删除过期条目，超出上限时删除最早过期的条目（需持有锁）"""
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                'DELETE FROM cache WHERE key IN '
+                '(SELECT key FROM cache ORDER BY expires_at LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def delete(self, key: str):
+        try:
+            with self._lock:
+                self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        except (sqlite3.Error, OSError) as e:
+            self._failed(e)
+
+    def incr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                # IMMEDIATE 事务先取得写锁，其他进程的读改写要等待本事务提交
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = conn.execute(
+                        'SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?', (key, now)
+                    ).fetchone()
+                    value = (int(bytes(row[0])) if row else 0) + amount
+                    conn.execute(
+                        'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                        (key, sqlite3.Binary(str(value).encode('ascii')), row[1] if row else now + ttl)
+                    )
+                    conn.execute('COMMIT')
+                except Exception:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    raise
+        except (sqlite3.Error, OSError) as e:
+            self._failed(e)
+            return None
+        return value
+
+    def clear(self, prefix: str = ''):
+        try:
+            with self._lock:
+                conn = self._connection()
+                if prefix:
+                    # 按主键范围删除，'\U0010ffff' 是 UTF-8 编码下最大的字符
+                    conn.execute('DELETE FROM cache WHERE key >= ? AND key < ?',
+                                 (prefix, prefix + '\U0010ffff'))
+                else:
+                    conn.execute('DELETE FROM cache')
+        except (sqlite3.Error, OSError) as e:
+            self._failed(e)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class RedisError(Exception):
+    """Redis 返回的错误"""
+    pass
+
+
+class _RedisConnection:
+    """单个 Redis 连接，按 RESP2 协议收发命令"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        self.pid = os.getpid()
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('utf-8')
+            elif not isinstance(arg, bytes):
+                arg = str(arg).encode('ascii')
+            parts.append(b'$%d\r\n' % len(arg))
+            parts.append(arg)
+            parts.append(b'\r\n')
+        return b''.join(parts)
+
+    def _read_reply(self) -> Any:
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Redis 连接已断开")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(payload.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Redis 连接已断开")
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"无法识别的 Redis 响应: {line[:32]!r}")
+
+    def execute(self, *args) -> Any:
+        self.sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """Redis 协议缓存，多个容器共享
+
+    内置最小的 RESP2 客户端，不依赖 redis 包；兼容 Redis、KeyDB、Valkey 等实现。
+    Redis 不可用时读取视为未命中、写入被丢弃，并在 REDIS_RETRY_INTERVAL 秒内不再尝试连接。
+    """
+
+    shared = True
+
+    def __init__(self, url: str, key_prefix: str = CACHE_KEY_PREFIX,
+                 timeout: float = REDIS_SOCKET_TIMEOUT, pool_size: int = REDIS_POOL_SIZE):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        path = parsed.path.strip('/')
+        self.db = int(path) if path.isdigit() else 0
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._pool: List[_RedisConnection] = []
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        return 'redis'
+
+    def _connect(self) -> _RedisConnection:
+        conn = _RedisConnection(self.host, self.port, self.timeout)
+        try:
+            if self.password:
+                if self.username:
+                    conn.execute('AUTH', self.username, self.password)
+                else:
+                    conn.execute('AUTH', self.password)
+            if self.db:
+                conn.execute('SELECT', self.db)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _acquire(self) -> _RedisConnection:
+        with self._lock:
+            while self._pool:
+                conn = self._pool.pop()
+                # 连接不能跨 fork 复用
+                if conn.pid == os.getpid():
+                    return conn
+        return self._connect()
+
+    def _release(self, conn: _RedisConnection):
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    def execute(self, *args) -> Any:
+        """执行一条命令；连接失败时抛出 OSError/ConnectionError"""
+        conn = self._acquire()
+        try:
+            reply = conn.execute(*args)
+        except RedisError:
+            self._release(conn)
+            raise
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn)
+        return reply
+
+    def _safe_execute(self, *args) -> Any:
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            return self.execute(*args)
+        except (OSError, RedisError, ValueError) as e:
+            # ValueError 来自无法解析的响应，连接已被关闭，不影响后续请求
+            self.errors += 1
+            if isinstance(e, OSError):
+                self._down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+            print(f"Redis 缓存访问失败: {str(e)}")
+            return None
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._safe_execute('GET', self.key_prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._safe_execute('SET', self.key_prefix + key, value, 'PX', max(1, int(ttl * 1000)))
+
+    def delete(self, key: str):
+        self._safe_execute('DEL', self.key_prefix + key)
+
+    def incr(self, key: str, amount: int, ttl: float) -> Optional[int]:
+        key = self.key_prefix + key
+        # 先以 NX 创建带过期时间的计数器，避免 INCRBY 创建出永不过期的键
+        if self._safe_execute('SET', key, 0, 'PX', max(1, int(ttl * 1000)), 'NX') is None \
+                and time.monotonic() < self._down_until:
+            return None
+        return self._safe_execute('INCRBY', key, amount)
+
+    def clear(self, prefix: str = ''):
+        # 用 SCAN 分批删除，避免 KEYS 阻塞服务端
+        pattern = self.key_prefix + prefix.replace('\\', '\\\\').replace('*', '\\*') \
+            .replace('?', '\\?').replace('[', '\\[') + '*'
+        cursor = b'0'
+        while True:
+            reply = self._safe_execute('SCAN', cursor, 'MATCH', pattern, 'COUNT', 500)
+            if not reply:
+                return
+            cursor, keys = reply
+            if keys:
+                self._safe_execute('DEL', *keys)
+            if cursor == b'0':
+                return
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, []
+        for conn in pool:
+            conn.close()
+
+
+def create_cache_backend(url: str) -> CacheBackend:
+    """根据缓存地址创建后端"""
+    scheme = urlparse(url).scheme.lower()
+    if scheme in ('', 'memory'):
+        return MemoryCacheBackend()
+    if scheme == 'sqlite':
+        # sqlite:///relative/path.db 或 sqlite:////absolute/path.db
+        path = url.split('://', 1)[1]
+        path = path[1:] if path.startswith('/') else path
+        return SQLiteCacheBackend(path or 'cache.db')
+    if scheme in ('redis', 'rediss'):
+        if scheme == 'rediss':
+            raise ValueError("暂不支持 TLS 连接的 Redis（rediss://）")
+        return RedisCacheBackend(url)
+    raise ValueError(f"不支持的缓存地址: {url}")
+
+
+class Cache:
+    """缓存的命名空间视图：负责序列化、过期时间和命中统计"""
+
+    def __init__(self, backend: CacheBackend, namespace: str, ttl: float):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    def _key(self, key: str) -> str:
+        return f'{self.namespace}:{key}'
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存值，未命中时返回 None"""
+        data = self.backend.get(self._key(key))
+        if data is None:
+            self._count('misses')
+            return None
+        try:
+            value = decode_value(data)
+        except (ValueError, zlib.error) as e:
+            # 旧格式或损坏的条目视为未命中
+            print(f"缓存值解码失败: {str(e)}")
+            self._count('errors')
+            self._count('misses')
+            return None
+        self._count('hits')
+        return value
+
+    def contains(self, key: str) -> bool:
+        """是否存在未过期的条目（不解码，也不计入命中统计）"""
+        return self.backend.get(self._key(key)) is not None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存值"""
+        self.backend.set(self._key(key), encode_value(value), self.ttl if ttl is None else ttl)
+        self._count('stores')
+
+    def delete(self, key: str):
+        self.backend.delete(self._key(key))
+
+    def clear(self):
+        """清空本命名空间"""
+        self.backend.clear(f'{self.namespace}:')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['backend'] = self.backend.name
+        stats['ttl'] = self.ttl
+        return stats
+
+
+# 单例模式，同一进程内的各类缓存共用一个后端（连接池）
+_cache_backend = None
+_cache_backend_lock = threading.Lock()
+
+
+def get_cache_backend() -> CacheBackend:
+    """获取全局缓存后端实例（由 VIDEO_CACHE_URL 指定）"""
+    global _cache_backend
+    if _cache_backend is None:
+        with _cache_backend_lock:
+            if _cache_backend is None:
+                _cache_backend = create_cache_backend(CACHE_URL)
+    return _cache_backend
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+视频链接规范化：统一视频ID、去除跟踪参数、生成规范键
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+# B站 AV/BV 互转参数（2024 年起的 64 位 aid 算法，纯本地计算）
+_BV_TABLE = 'FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf'
+_BV_INDEX = {c: i for i, c in enumerate(_BV_TABLE)}
+_BV_XOR = 23442827791579
+_BV_MASK = (1 << 51) - 1
+_BV_MAX_AID = 1 << 51
+_BV_BASE = 58
+
+_BV_PATTERN = re.compile(r'(?<![a-zA-Z0-9])[bB][vV](1[a-zA-Z0-9]{9})(?![a-zA-Z0-9])')
+_AV_PATTERN = re.compile(r'(?<![a-zA-Z0-9])[aA][vV](\d+)(?!\d)')
+_YOUTUBE_ID = re.compile(r'^[a-zA-Z0-9_-]{11}$')
+
+# 不影响视频内容的跟踪/分享参数
+TRACKING_PARAMS = {
+    'spm_id_from', 'from_spmid', 'vd_source', 'share_source', 'share_medium', 'share_plat',
+    'share_session_id', 'share_tag', 'share_from', 'share_times', 'unique_k', 'bbid', 'ts',
+    'timestamp', 'buvid', 'mid', 'up_id', 'is_story_h5', 'seid', 'from', 'plat_id',
+    'previous_page', 'enter_from', 'enter_method', 'utm_source', 'utm_medium', 'utm_campaign',
+    'utm_term', 'utm_content', 'si', 'feature', 'pp', 'ab_channel', 'app', 'source_ve_path',
+    'u_code', 'did', 'iid', 'with_sec_did', 'sec_uid', 'region', 'checksum', 'object_id',
+}
+TRACKING_PREFIXES = ('utm_', 'share_')
+
+
+def av_to_bv(aid: int) -> str:
+    """AV号转BV号"""
+    if aid <= 0 or aid >= _BV_MAX_AID:
+        raise ValueError(f"AV号超出范围: {aid}")
+    chars = list('BV1000000000')
+    value = (_BV_MAX_AID | aid) ^ _BV_XOR
+    index = len(chars) - 1
+    while value > 0:
+        chars[index] = _BV_TABLE[value % _BV_BASE]
+        value //= _BV_BASE
+        index -= 1
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+    return ''.join(chars)
+
+
+def bv_to_av(bvid: str) -> int:
+    """BV号转AV号"""
+    if len(bvid) != 12 or bvid[:3].upper() != 'BV1':
+        raise ValueError(f"无效的BV号: {bvid}")
+    chars = list('BV' + bvid[2:])
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+    value = 0
+    for c in chars[3:]:
+        if c not in _BV_INDEX:
+            raise ValueError(f"无效的BV号: {bvid}")
+        value = value * _BV_BASE + _BV_INDEX[c]
+    return (value & _BV_MASK) ^ _BV_XOR
+
+
+def strip_tracking_params(url: str) -> str:
+    """去除跟踪/分享参数和片段标识，保留其余查询参数的原有顺序"""
+    parsed = urlparse(url)
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith(TRACKING_PREFIXES)
+    ]
+    return parsed._replace(query=urlencode(query), fragment='').geturl()
+
+
+@dataclass(frozen=True)
+class CanonicalVideo:
+    """规范化后的视频标识"""
+    platform: str
+    video_id: str
+    url: str            # 规范链接
+    page: int = 1       # B站分P
+
+    @property
+    def key(self) -> str:
+        """规范键，如 bilibili:BV17x411w7KC、bilibili:BV17x411w7KC:p2、youtube:dQw4w9WgXcQ"""
+        suffix = f':p{self.page}' if self.page > 1 else ''
+        return f'{self.platform}:{self.video_id}{suffix}'
+
+
+def _bilibili(url: str, query: dict) -> Optional[CanonicalVideo]:
+    bv_match = _BV_PATTERN.search(url)
+    if bv_match:
+        bvid = 'BV' + bv_match.group(1)
+    else:
+        av_match = _AV_PATTERN.search(url)
+        if not av_match:
+            return None
+        try:
+            bvid = av_to_bv(int(av_match.group(1)))
+        except ValueError:
+            return None
+
+    try:
+        page = max(1, int(query.get('p', 1)))
+    except ValueError:
+        page = 1
+    canonical_url = f'https://www.bilibili.com/video/{bvid}'
+    if page > 1:
+        canonical_url += f'?p={page}'
+    return CanonicalVideo('bilibili', bvid, canonical_url, page)
+
+
+def _douyin(parsed, query: dict) -> Optional[CanonicalVideo]:
+    match = re.search(r'/(?:video|note|share/video)/(\d+)', parsed.path)
+    video_id = match.group(1) if match else query.get('modal_id') or query.get('vid')
+    if not video_id or not video_id.isdigit():
+        return None
+    return CanonicalVideo('douyin', video_id, f'https://www.douyin.com/video/{video_id}')
+
+
+def _youtube(parsed, query: dict) -> Optional[CanonicalVideo]:
+    host = parsed.netloc.lower()
+    if host.endswith('youtu.be'):
+        video_id = parsed.path.strip('/').split('/')[0]
+    elif parsed.path == '/watch':
+        video_id = query.get('v', '')
+    else:
+        match = re.match(r'/(?:embed|v|shorts|live)/([^/?#]+)', parsed.path)
+        video_id = match.group(1) if match else ''
+    if not _YOUTUBE_ID.match(video_id):
+        return None
+    return CanonicalVideo('youtube', video_id, f'https://www.youtube.com/watch?v={video_id}')
+
+
+def canonicalize(url: str) -> Optional[CanonicalVideo]:
+    """不访问网络地把视频链接规范化；无法识别或需要跳转解析的短链接返回 None
+
+    支持完整链接、不带协议的链接，以及单独的 av/BV 号。
+    """
+    url = (url or '').strip()
+    if not url:
+        return None
+
+    # 单独的 av/BV 号
+    if re.fullmatch(r'[bB][vV]1[a-zA-Z0-9]{9}|[aA][vV]\d+', url):
+        return _bilibili(url, {})
+
+    if not re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*://', url):
+        url = 'https://' + url
+    parsed = urlparse(url)
+    host = parsed.netloc.lower().split(':')[0]
+    query = dict(parse_qsl(parsed.query))
+
+    if host.endswith('bilibili.com'):
+        return _bilibili(parsed.path, query)
+    if host.endswith('douyin.com') and host != 'v.douyin.com' or host.endswith('iesdouyin.com'):
+        return _douyin(parsed, query)
+    if host.endswith('youtube.com') or host.endswith('youtu.be') or host.endswith('youtube-nocookie.com'):
+        return _youtube(parsed, query)
+    return None
+
+
+def canonical_key(url: str) -> Optional[str]:
+    """视频链接的规范键，无法本地识别时返回 None"""
+    video = canonicalize(url)
+    return video.key if video else None
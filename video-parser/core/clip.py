@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+片段截取模块
+
+从 DASH 音视频流中截取一个时间段：读取所选视频表示和音频表示的 sidx 分段索引，
+找出覆盖该时间段的分段，只按字节范围下载这些分段，再把音视频合并为一个
+分片 MP4（不重新编码）。两小时的视频截取 30 秒只需下载几 MB。
+
+截取不重新编码，起止时间会扩展到分段边界（分段以关键帧开始），
+实际范围通过 ClipResult.start / ClipResult.end 返回。
+
+合并在当前线程中逐个分段写入临时文件（较小时留在内存中），不在进程间传递媒体数据，
+合并结果也不整体驻留内存。
+"""
+
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Tuple
+
+from .media import fetch_range, get_segment_index_loader, parse_byte_range
+from .mp4 import FragmentedTrack, SegmentIndex, SegmentReference, write_merged_tracks
+from .parser import MediaRepresentation, VideoMetadata
+
+# 单次截取的最大时长（秒）
+CLIP_MAX_DURATION = float(os.environ.get('CLIP_MAX_DURATION', 300))
+
+# 单次截取最多下载的字节数（音视频合计）
+CLIP_MAX_BYTES = int(os.environ.get('CLIP_MAX_BYTES', 200 * 1024 * 1024))
+
+# 合并结果超过该字节数时写入磁盘临时文件
+CLIP_SPOOL_MAX_MEMORY = int(os.environ.get('CLIP_SPOOL_MAX_MEMORY', 8 * 1024 * 1024))
+
+
+class ClipError(Exception):
+    """截取参数无效或视频不支持截取"""
+    pass
+
+
+@dataclass
+class ClipResult:
+    """截取结果，file 为定位到开头的合并结果，由调用方读取后关闭"""
+    file: BinaryIO
+    size: int
+    start: float  # 实际开始时间（秒，分段边界）
+    end: float    # 实际结束时间（秒，分段边界）
+    video: Optional[str] = None  # 使用的视频表示 ID
+    audio: Optional[str] = None  # 使用的音频表示 ID
+
+
+def choose_representations(metadata: VideoMetadata, quality: Optional[str] = None
+                           ) -> Tuple[Optional[MediaRepresentation], Optional[MediaRepresentation]]:
+    """选择视频表示和音频表示
+
+    quality 为表示 ID（如 "80.avc1"）或清晰度（如 "80"）；未指定时选择分辨率最高的视频，
+    同分辨率下优先 AVC（兼容性最好）。音频选择码率最高的。只考虑带分段索引的表示。
+    """
+    usable = [item for item in metadata.representations if item.initialization and item.index_range]
+    videos = [item for item in usable if item.kind == 'video']
+    audios = [item for item in usable if item.kind == 'audio']
+
+    if quality:
+        videos = [item for item in videos if quality in (item.id, item.id.split('.')[0])]
+        if not videos:
+            raise ClipError(f"没有清晰度为 {quality} 的视频流")
+
+    video = max(videos, key=lambda item: ((item.height or 0), item.codecs.startswith('avc'), item.bandwidth),
+                default=None)
+    audio = max(audios, key=lambda item: item.bandwidth, default=None)
+    if video is None and audio is None:
+        raise ClipError("该视频没有带分段索引的 DASH 音视频流，无法截取片段")
+    return video, audio
+
+
+def covering_segments(index: SegmentIndex, start: float, end: float) -> List[SegmentReference]:
+    """与 [start, end) 有重叠的连续分段"""
+    return [segment for segment in index.segments
+            if segment.start < end and segment.start + segment.duration > start]
+
+
+def _read_track(representation: MediaRepresentation, segments: List[SegmentReference]) -> FragmentedTrack:
+    """读取一个表示的初始化段和给定的分段"""
+    init_start, init_end = parse_byte_range(representation.initialization)
+    init = fetch_range(representation.url, init_start, init_end)
+    # 分段在文件中是连续的，一次范围请求读取全部
+    media = fetch_range(representation.url, segments[0].offset, segments[-1].end_offset)
+    return FragmentedTrack(init=init, media=media, media_offset=segments[0].offset)
+
+
+def extract_clip(metadata: VideoMetadata, start: float, end: float,
+                 quality: Optional[str] = None) -> ClipResult:
+    """截取 [start, end) 秒的片段，返回合并后的分片 MP4
+
+    参数无效时抛出 ClipError；媒体文件不可访问时抛出 MediaError 或 requests 异常；
+    媒体格式不支持时抛出 MP4Error。
+    """
+    if start < 0 or end <= start:
+        raise ClipError("截取范围无效：需要 0 <= start < end")
+    if end - start > CLIP_MAX_DURATION:
+        raise ClipError(f"截取时长不能超过 {CLIP_MAX_DURATION:g} 秒")
+    if metadata.duration and start >= metadata.duration:
+        raise ClipError(f"开始时间超出视频时长（{metadata.duration} 秒）")
+
+    video, audio = choose_representations(metadata, quality)
+    loader = get_segment_index_loader()
+    plan = []
+    for representation in (video, audio):
+        if representation is None:
+            continue
+        segments = covering_segments(loader.load(representation, metadata.canonical_id), start, end)
+        if not segments:
+            raise ClipError(f"{start:g} 秒之后没有媒体数据")
+        plan.append((representation, segments))
+
+    # 下载前按分段索引估算数据量
+    size = sum(segments[-1].end_offset - segments[0].offset + 1 for _, segments in plan)
+    if size > CLIP_MAX_BYTES:
+        raise ClipError(f"片段数据量过大（{size // (1024 * 1024)} MB），请缩短时长或选择较低清晰度")
+
+    tracks = [_read_track(representation, segments) for representation, segments in plan]
+    output = tempfile.SpooledTemporaryFile(max_size=CLIP_SPOOL_MAX_MEMORY)
+    try:
+        written = write_merged_tracks(tracks, output)
+        output.seek(0)
+    except BaseException:
+        output.close()
+        raise
+    return ClipResult(
+        file=output,
+        size=written,
+        start=min(segments[0].start for _, segments in plan),
+        end=max(segments[-1].start + segments[-1].duration for _, segments in plan),
+        video=video.id if video else None,
+        audio=audio.id if audio else None,
+    )
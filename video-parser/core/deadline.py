@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+请求截止时间模块
+
+一次解析请求的截止时间保存在 contextvars 中，沿调用链传递到每个上游请求：
+各请求的超时取"默认超时"与"剩余时间"中的较小值，截止时间已过时不再发起新的请求。
+"""
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+# 接口未指定超时时使用的解析时限（秒），以及允许指定的最大值
+PARSE_DEFAULT_TIMEOUT = float(os.environ.get('PARSE_DEFAULT_TIMEOUT', 15))
+PARSE_MAX_TIMEOUT = float(os.environ.get('PARSE_MAX_TIMEOUT', 60))
+
+# 剩余时间少于该值（秒）时视为已超时，不再发起上游请求
+MIN_REQUEST_TIMEOUT = 0.05
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('parse_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """请求已超过截止时间"""
+
+    def __init__(self, message: str = "解析超时"):
+        super().__init__(message)
+
+
+def clamp_timeout(timeout: Any) -> float:
+    """接口传入的超时（秒）：未指定或无效时取默认值，并限制在允许范围内"""
+    try:
+        timeout = float(timeout)
+    except (TypeError, ValueError):
+        return PARSE_DEFAULT_TIMEOUT
+    if not timeout > 0:
+        return PARSE_DEFAULT_TIMEOUT
+    return min(timeout, PARSE_MAX_TIMEOUT)
+
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]) -> Iterator[None]:
+    """在作用域内设置截止时间；已有更早的截止时间时保持不变，timeout 为 None 时不设限制"""
+    if timeout is None:
+        yield
+        return
+    deadline = time.monotonic() + timeout
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """距截止时间的剩余秒数，未设置截止时间时返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_exceeded() -> bool:
+    """截止时间是否已过"""
+    left = remaining()
+    return left is not None and left < MIN_REQUEST_TIMEOUT
+
+
+def upstream_timeout(default: float) -> float:
+    """单次上游请求可用的超时：默认超时与剩余时间中的较小值；已超时时抛出 DeadlineExceeded"""
+    left = remaining()
+    if left is None:
+        return default
+    if left < MIN_REQUEST_TIMEOUT:
+        raise DeadlineExceeded()
+    return min(default, left)
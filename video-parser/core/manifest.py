@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+播放清单生成模块
+
+由解析结果中的 DASH 音视频表示生成 DASH MPD 和 HLS 播放列表，播放器据此
+按需加载分段并自适应切换码率，不需要下载完整文件。
+
+- DASH：使用 on-demand profile，每个表示一个文件，通过 SegmentBase（sidx）定位分段；
+- HLS：使用 fMP4 分段，每个分段的字节范围来自 sidx 分段索引。
+
+media_url 回调把 CDN 链接转换为清单中实际使用的地址（原链接或代理地址）。
+"""
+
+import math
+import xml.etree.ElementTree as ET
+from typing import Callable, Dict, List, Tuple
+
+from .mp4 import SegmentIndex
+from .parser import MediaRepresentation, VideoMetadata
+
+DASH_NAMESPACE = 'urn:mpeg:dash:schema:mpd:2011'
+DASH_PROFILE = 'urn:mpeg:dash:profile:isoff-on-demand:2011'
+
+# HLS 音频分组 ID
+HLS_AUDIO_GROUP = 'audio'
+
+
+def _duration(seconds: float) -> str:
+    """ISO 8601 时长，如 PT180.000S"""
+    return f'PT{seconds:.3f}S'
+
+
+def _adaptation_sets(representations: List[MediaRepresentation]) -> Dict[Tuple[str, str, str], List[MediaRepresentation]]:
+    """按类型、MIME 类型和编码族分组；不同编码（AVC/HEVC/AV1）放在不同的自适应集中"""
+    groups: Dict[Tuple[str, str, str], List[MediaRepresentation]] = {}
+    for representation in representations:
+        key = (representation.kind, representation.mime_type, representation.codecs.split('.')[0])
+        groups.setdefault(key, []).append(representation)
+    return groups
+
+
+def build_mpd(metadata: VideoMetadata, media_url: Callable[[str], str]) -> str:
+    """生成 DASH MPD（静态点播清单）"""
+    mpd = ET.Element('MPD', {
+        'xmlns': DASH_NAMESPACE,
+        'profiles': DASH_PROFILE,
+        'type': 'static',
+        'mediaPresentationDuration': _duration(metadata.duration),
+        'minBufferTime': 'PT1.500S',
+    })
+    if metadata.title:
+        information = ET.SubElement(mpd, 'ProgramInformation')
+        ET.SubElement(information, 'Title').text = metadata.title
+    period = ET.SubElement(mpd, 'Period', {'id': '0', 'start': 'PT0S'})
+
+    groups = _adaptation_sets(metadata.representations)
+    for set_id, ((kind, mime_type, _), representations) in enumerate(groups.items()):
+        adaptation_set = ET.SubElement(period, 'AdaptationSet', {
+            'id': str(set_id),
+            'contentType': kind,
+            'mimeType': mime_type,
+            'segmentAlignment': 'true',
+            'startWithSAP': '1',
+        })
+        for representation in sorted(representations, key=lambda item: item.bandwidth):
+            attributes = {
+                'id': representation.id,
+                'bandwidth': str(representation.bandwidth),
+                'codecs': representation.codecs,
+            }
+            if representation.width and representation.height:
+                attributes['width'] = str(representation.width)
+                attributes['height'] = str(representation.height)
+            if representation.frame_rate:
+                attributes['frameRate'] = representation.frame_rate
+            element = ET.SubElement(adaptation_set, 'Representation', attributes)
+            ET.SubElement(element, 'BaseURL').text = media_url(representation.url)
+            if representation.index_range:
+                segment_base = ET.SubElement(element, 'SegmentBase',
+                                             {'indexRange': representation.index_range})
+                if representation.initialization:
+                    ET.SubElement(segment_base, 'Initialization',
+                                  {'range': representation.initialization})
+
+    return ET.tostring(mpd, encoding='unicode', xml_declaration=True)
+
+
+def hls_supported(metadata: VideoMetadata) -> bool:
+    """生成 HLS 需要每个表示都有初始化段和分段索引的字节范围"""
+    return bool(metadata.representations) and all(
+        representation.initialization and representation.index_range
+        for representation in metadata.representations
+    )
+
+
+def _attribute(value: str) -> str:
+    return '"' + value.replace('"', "'") + '"'
+
+
+def build_hls_master(metadata: VideoMetadata, playlist_url: Callable[[MediaRepresentation], str]) -> str:
+    """生成 HLS 主播放列表：每个视频表示一个变体流，音频表示作为一个音频分组"""
+    videos = [item for item in metadata.representations if item.kind == 'video']
+    audios = sorted((item for item in metadata.representations if item.kind == 'audio'),
+                    key=lambda item: -item.bandwidth)
+
+    lines = ['#EXTM3U', '#EXT-X-VERSION:7', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for i, audio in enumerate(audios):
+        lines.append(
+            f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID={_attribute(HLS_AUDIO_GROUP)},'
+            f'NAME={_attribute(f"{audio.bandwidth // 1000}kbps")},'
+            f'DEFAULT={"YES" if i == 0 else "NO"},AUTOSELECT=YES,URI={_attribute(playlist_url(audio))}'
+        )
+
+    audio_bandwidth = audios[0].bandwidth if audios else 0
+    for video in sorted(videos, key=lambda item: item.bandwidth):
+        codecs = video.codecs + (f',{audios[0].codecs}' if audios else '')
+        attributes = [f'BANDWIDTH={video.bandwidth + audio_bandwidth}', f'CODECS={_attribute(codecs)}']
+        if video.width and video.height:
+            attributes.append(f'RESOLUTION={video.width}x{video.height}')
+        if video.frame_rate:
+            try:
+                attributes.append(f'FRAME-RATE={float(video.frame_rate):.3f}')
+            except ValueError:
+                pass
+        if audios:
+            attributes.append(f'AUDIO={_attribute(HLS_AUDIO_GROUP)}')
+        lines.append('#EXT-X-STREAM-INF:' + ','.join(attributes))
+        lines.append(playlist_url(video))
+
+    # 没有单独视频流时（纯音频），音频表示直接作为变体流
+    if not videos:
+        for audio in audios:
+            lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={audio.bandwidth},CODECS={_attribute(audio.codecs)}')
+            lines.append(playlist_url(audio))
+    return '\n'.join(lines) + '\n'
+
+
+def build_hls_media(representation: MediaRepresentation, index: SegmentIndex,
+                    media_url: Callable[[str], str]) -> str:
+    """生成一个表示的 HLS 媒体播放列表，每个 sidx 分段对应一个按字节范围读取的 fMP4 分段"""
+    url = media_url(representation.url)
+    init_start, init_end = (int(value) for value in representation.initialization.split('-'))
+    target = max((segment.duration for segment in index.segments), default=0)
+
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:7',
+        f'#EXT-X-TARGETDURATION:{max(1, math.ceil(target))}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+        '#EXT-X-INDEPENDENT-SEGMENTS',
+        f'#EXT-X-MAP:URI={_attribute(url)},BYTERANGE="{init_end - init_start + 1}@{init_start}"',
+    ]
+    for segment in index.segments:
+        lines.append(f'#EXTINF:{segment.duration:.3f},')
+        lines.append(f'#EXT-X-BYTERANGE:{segment.size}@{segment.offset}')
+        lines.append(url)
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
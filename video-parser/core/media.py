@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+媒体文件访问模块
+
+访问各平台 CDN 上的媒体文件：只允许已知的 CDN 主机，并附带平台要求的 Referer；
+支持按字节范围读取，用于读取 DASH 分段索引和转发播放器的 Range 请求。
+
+媒体代理只接受本服务签发的链接（sign_media_url），代理地址不能被用来转发任意
+CDN 链接。
+"""
+
+import hashlib
+import hmac
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from .cache import Cache, get_cache_backend
+from .deadline import deadline_scope, upstream_timeout
+from .mp4 import SegmentIndex, parse_sidx
+from .parser import MediaRepresentation
+
+# 允许访问的媒体 CDN 主机（完整匹配主机名）及请求时携带的 Referer
+MEDIA_HOSTS = (
+    (re.compile(r'^[a-z0-9-]+(\.[a-z0-9-]+)*\.bilivideo\.(com|cn)$'), 'https://www.bilibili.com'),
+    # B站海外节点使用 Akamai 的共享域名，只允许 B站专用的主机名
+    (re.compile(r'^upos-[a-z0-9-]+-mirrorakam\.akamaized\.net$'), 'https://www.bilibili.com'),
+    (re.compile(r'^[a-z0-9-]+\.douyinvod\.com$'), 'https://www.douyin.com'),
+)
+
+MEDIA_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# 分段索引缓存有效期（秒）；同一视频同一表示的索引不随签名链接变化
+SIDX_CACHE_TTL = float(os.environ.get('SIDX_CACHE_TTL', 24 * 3600))
+
+# 媒体代理链接的签名密钥；未配置时使用 use_signing_key_file() 指定文件中的密钥，
+# 仍未指定时每个进程随机生成（只在本进程内有效）
+MEDIA_SIGNING_KEY = os.environ.get('MEDIA_SIGNING_KEY', '')
+
+# 单次媒体文件请求的超时（秒）
+MEDIA_REQUEST_TIMEOUT = float(os.environ.get('MEDIA_REQUEST_TIMEOUT', 10))
+
+# 媒体代理链接的有效期（秒）
+MEDIA_TOKEN_TTL = int(os.environ.get('MEDIA_TOKEN_TTL', 6 * 3600))
+
+
+class MediaError(Exception):
+    """媒体文件不可访问"""
+    pass
+
+
+def media_referer(url: str) -> Optional[str]:
+    """链接属于允许访问的 CDN 时返回应携带的 Referer，否则返回 None"""
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if parsed.scheme not in ('http', 'https'):
+        return None
+    for pattern, referer in MEDIA_HOSTS:
+        if pattern.match(host):
+            return referer
+    return None
+
+
+_signing_key: Optional[bytes] = MEDIA_SIGNING_KEY.encode('utf-8') if MEDIA_SIGNING_KEY else None
+_signing_key_lock = threading.Lock()
+
+
+def _read_or_create_key(path: str) -> bytes:
+    """读取密钥文件，不存在时原子地创建；多个进程同时创建时以先创建的为准"""
+    try:
+        with open(path, 'rb') as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.media_key.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(32).hex().encode('ascii'))
+        os.chmod(tmp_path, 0o600)
+        try:
+            # link 在目标已存在时失败，不会覆盖其他进程先写入的密钥
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+    finally:
+        os.remove(tmp_path)
+    with open(path, 'rb') as f:
+        return f.read().strip()
+
+
+def use_signing_key_file(path: str):
+    """未配置 MEDIA_SIGNING_KEY 时使用 path 中保存的密钥（不存在时生成），同一主机上的 worker 共用"""
+    global _signing_key
+    if MEDIA_SIGNING_KEY:
+        return
+    try:
+        key = _read_or_create_key(path)
+    except OSError as e:
+        print(f"读取媒体签名密钥文件失败: {str(e)}")
+        return
+    with _signing_key_lock:
+        _signing_key = key
+
+
+def _get_signing_key() -> bytes:
+    global _signing_key
+    with _signing_key_lock:
+        if _signing_key is None:
+            print("警告: 未配置 MEDIA_SIGNING_KEY，媒体代理令牌只在本进程内有效，多 worker 部署时请配置")
+            _signing_key = os.urandom(32).hex().encode('ascii')
+        return _signing_key
+
+
+def _signature(url: str, expires: int) -> str:
+    message = f'{expires}:{url}'.encode('utf-8')
+    return hmac.new(_get_signing_key(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def sign_media_url(url: str, ttl: int = MEDIA_TOKEN_TTL) -> str:
+    """为媒体链接签发代理令牌（"过期时间.签名"）"""
+    expires = int(time.time()) + ttl
+    return f'{expires}.{_signature(url, expires)}'
+
+
+def verify_media_token(url: str, token: Optional[str]):
+    """校验代理令牌，无效或已过期时抛出 MediaError"""
+    expires, _, signature = (token or '').partition('.')
+    if not expires.isdigit() or not hmac.compare_digest(signature, _signature(url, int(expires))):
+        raise MediaError("媒体代理令牌无效")
+    if int(expires) < time.time():
+        raise MediaError("媒体代理令牌已过期")
+
+
+def media_headers(url: str, range_header: Optional[str] = None) -> Dict[str, str]:
+    """请求媒体文件的请求头；链接不属于允许访问的 CDN 时抛出 MediaError"""
+    referer = media_referer(url)
+    if referer is None:
+        raise MediaError("不支持的媒体地址")
+    headers = {'User-Agent': MEDIA_USER_AGENT, 'Referer': referer}
+    if range_header:
+        headers['Range'] = range_header
+    return headers
+
+
+def parse_byte_range(value: str) -> Tuple[int, int]:
+    """解析 "起始-结束" 形式的字节范围（含结束字节）"""
+    start, _, end = value.partition('-')
+    try:
+        start, end = int(start), int(end)
+    except ValueError:
+        raise MediaError(f"字节范围无效: {value}")
+    if start < 0 or end < start:
+        raise MediaError(f"字节范围无效: {value}")
+    return start, end
+
+
+def open_media(url: str, range_header: Optional[str] = None,
+               timeout: Optional[float] = None) -> requests.Response:
+    """以流式请求打开媒体文件（供代理转发），timeout 为本次请求的截止时间（秒）
+
+    不跟随重定向，避免被引导到允许范围之外的地址；链接不属于允许访问的 CDN 时抛出 MediaError。
+    """
+    headers = media_headers(url, range_header)
+    with deadline_scope(timeout):
+        return requests.get(url, headers=headers, stream=True, allow_redirects=False,
+                            timeout=upstream_timeout(MEDIA_REQUEST_TIMEOUT))
+
+
+def fetch_range(url: str, start: int, end: int, timeout: float = MEDIA_REQUEST_TIMEOUT) -> bytes:
+    """读取媒体文件中 [start, end] 的字节"""
+    response = requests.get(url, headers=media_headers(url, f'bytes={start}-{end}'),
+                            timeout=upstream_timeout(timeout), stream=True, allow_redirects=False)
+    try:
+        response.raise_for_status()
+        if response.status_code == 206:
+            data = response.content
+        else:
+            # 服务端不支持 Range 时返回完整文件，只读到需要的位置为止
+            data = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                data += chunk
+                if len(data) > end:
+                    break
+            data = bytes(data[start:end + 1])
+    finally:
+        response.close()
+    if len(data) != end - start + 1:
+        raise MediaError(f"读取字节范围 {start}-{end} 不完整")
+    return data
+
+
+class SegmentIndexLoader:
+    """读取并缓存各表示的 sidx 分段索引"""
+
+    def __init__(self):
+        self.cache = Cache(get_cache_backend(), 'sidx', SIDX_CACHE_TTL)
+
+    def load(self, representation: MediaRepresentation, canonical_id: Optional[str]) -> SegmentIndex:
+        """读取分段索引；表示没有 indexRange 时抛出 MediaError"""
+        if not representation.index_range:
+            raise MediaError(f"表示 {representation.id} 没有分段索引")
+        key = f'{canonical_id}:{representation.id}' if canonical_id else None
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return SegmentIndex.from_dict(cached)
+
+        start, end = parse_byte_range(representation.index_range)
+        index = parse_sidx(fetch_range(representation.url, start, end), start)
+        if key is not None:
+            self.cache.set(key, index.to_dict())
+        return index
+
+
+# 单例模式，同一进程内共用一个分段索引缓存
+_segment_index_loader = None
+
+
+def get_segment_index_loader() -> SegmentIndexLoader:
+    """获取全局分段索引读取器"""
+    global _segment_index_loader
+    if _segment_index_loader is None:
+        _segment_index_loader = SegmentIndexLoader()
+    return _segment_index_loader
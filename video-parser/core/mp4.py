@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+ISO BMFF（MP4）盒子解析模块
+
+只处理 DASH 分片 MP4（fMP4）用到的结构：遍历盒子、读取 sidx 分段索引、
+把音视频分离的单轨道文件合并为一个文件。分段索引给出每个分段（moof + mdat）
+在文件中的字节范围和时长，据此可以生成 HLS 播放列表，或只下载某个时间段覆盖的分段。
+"""
+
+import io
+import struct
+from dataclasses import asdict, dataclass
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+
+class MP4Error(Exception):
+    """MP4 数据格式错误或不支持"""
+    pass
+
+
+def iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[str, int, int, int]]:
+    """遍历 data[start:end] 中的同级盒子，产出 (类型, 盒子起始, 内容起始, 盒子结束)"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                raise MP4Error("盒子头不完整")
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            # 延伸到数据末尾
+            size = end - offset
+        if size < header or offset + size > end:
+            raise MP4Error(f"盒子 {box_type!r} 的长度无效: {size}")
+        yield box_type.decode('latin-1'), offset, offset + header, offset + size
+        offset += size
+
+
+def find_box(data: bytes, box_type: str, start: int = 0, end: Optional[int] = None) -> Optional[Tuple[int, int, int]]:
+    """查找第一个指定类型的同级盒子，返回 (盒子起始, 内容起始, 盒子结束)"""
+    for found_type, box_start, payload_start, box_end in iter_boxes(data, start, end):
+        if found_type == box_type:
+            return box_start, payload_start, box_end
+    return None
+
+
+def _box(box_type: str, payload: bytes) -> bytes:
+    return struct.pack('>I4s', 8 + len(payload), box_type.encode('ascii')) + payload
+
+
+@dataclass
+class SegmentReference:
+    """一个媒体分段（一个或多个 moof + mdat）"""
+    offset: int      # 在文件中的起始字节
+    size: int        # 字节数
+    start: float     # 开始时间（秒）
+    duration: float  # 时长（秒）
+
+    @property
+    def end_offset(self) -> int:
+        """最后一个字节的位置（含）"""
+        return self.offset + self.size - 1
+
+
+@dataclass
+class SegmentIndex:
+    """sidx 分段索引"""
+    timescale: int
+    segments: List[SegmentReference]
+
+    @property
+    def duration(self) -> float:
+        return sum(segment.duration for segment in self.segments)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SegmentIndex':
+        return cls(timescale=data['timescale'],
+                   segments=[SegmentReference(**segment) for segment in data['segments']])
+
+
+def parse_sidx(data: bytes, data_offset: int = 0) -> SegmentIndex:
+    """解析 sidx 盒子
+
+    data 为包含 sidx 盒子的字节（通常是 SegmentBase 的 indexRange），
+    data_offset 为 data 在文件中的起始位置，用于换算分段的绝对字节位置。
+    """
+    found = find_box(data, 'sidx')
+    if found is None:
+        raise MP4Error("未找到 sidx 盒子")
+    _, payload, box_end = found
+
+    version = data[payload]
+    pos = payload + 4  # 版本和标志
+    _reference_id, timescale = struct.unpack_from('>II', data, pos)
+    pos += 8
+    if version == 0:
+        earliest, first_offset = struct.unpack_from('>II', data, pos)
+        pos += 8
+    else:
+        earliest, first_offset = struct.unpack_from('>QQ', data, pos)
+        pos += 16
+    count = struct.unpack_from('>2xH', data, pos)[0]
+    pos += 4
+    if pos + count * 12 > box_end:
+        raise MP4Error("sidx 盒子不完整")
+    if timescale == 0:
+        raise MP4Error("sidx 的 timescale 为 0")
+
+    # 第一个分段从 sidx 盒子之后 first_offset 字节处开始
+    offset = data_offset + box_end + first_offset
+    time = earliest
+    segments = []
+    for _ in range(count):
+        reference, duration, _sap = struct.unpack_from('>III', data, pos)
+        pos += 12
+        if reference >> 31:
+            raise MP4Error("不支持多级 sidx 索引")
+        size = reference & 0x7FFFFFFF
+        segments.append(SegmentReference(offset=offset, size=size,
+                                         start=time / timescale, duration=duration / timescale))
+        offset += size
+        time += duration
+    return SegmentIndex(timescale=timescale, segments=segments)
+
+
+def find_path(data: bytes, path: str, start: int = 0, end: Optional[int] = None) -> Optional[Tuple[int, int, int]]:
+    """按路径（如 "moov/trak/mdia/mdhd"）查找嵌套盒子，返回 (盒子起始, 内容起始, 盒子结束)"""
+    found = None
+    for box_type in path.split('/'):
+        found = find_box(data, box_type, start, end)
+        if found is None:
+            return None
+        _, start, end = found
+    return found
+
+
+def _uint(data: bytes, offset: int, version: int) -> int:
+    return struct.unpack_from('>Q' if version else '>I', data, offset)[0]
+
+
+def read_timescale(init: bytes) -> int:
+    """初始化段中第一个轨道的 timescale"""
+    found = find_path(init, 'moov/trak/mdia/mdhd')
+    if found is None:
+        raise MP4Error("初始化段中没有 mdhd 盒子")
+    _, payload, _ = found
+    # 版本 1 的创建/修改时间为 64 位
+    return struct.unpack_from('>I', init, payload + (20 if init[payload] else 12))[0]
+
+
+@dataclass
+class FragmentedTrack:
+    """分片 MP4 的一路轨道：初始化段（ftyp + moov）和若干连续的分段（moof + mdat）"""
+    init: bytes
+    media: bytes
+    media_offset: int  # media 在源文件中的起始位置，用于修正 tfhd 中的绝对数据偏移
+
+
+def _fragments(media: bytes) -> List[Tuple[int, int, int]]:
+    """切分出各分段，返回 [(moof 起始, moof 结束, 分段结束)]，分段包含其后直到下一个 moof 的全部盒子"""
+    fragments = []
+    for box_type, box_start, _, box_end in iter_boxes(media):
+        if box_type == 'moof':
+            fragments.append([box_start, box_end, box_end])
+        elif fragments:
+            fragments[-1][2] = box_end
+    return [tuple(fragment) for fragment in fragments]
+
+
+def _decode_time(media: bytes, moof_start: int, moof_end: int) -> int:
+    found = find_path(media, 'traf/tfdt', moof_start + 8, moof_end)
+    if found is None:
+        raise MP4Error("分段中没有 tfdt 盒子")
+    _, payload, _ = found
+    return _uint(media, payload + 4, media[payload])
+
+
+def merge_tracks(tracks: List[FragmentedTrack]) -> bytes:
+    """把多路单轨道的分片 MP4 合并为一个多轨道的分片 MP4，返回合并后的数据"""
+    output = io.BytesIO()
+    write_merged_tracks(tracks, output)
+    return output.getvalue()
+
+
+def write_merged_tracks(tracks: List[FragmentedTrack], output: BinaryIO) -> int:
+    """把多路单轨道的分片 MP4 合并为一个多轨道的分片 MP4（不重新编码），写入 output
+
+    轨道 ID 依次改为 1、2、…；各轨道的时间轴整体平移，使最早的分段从 0 开始，
+    音视频保持同步；分段按开始时间交错排列。逐个分段写出，返回写入的字节数。
+    """
+    if not tracks:
+        raise MP4Error("没有可合并的轨道")
+
+    ftyp = find_box(tracks[0].init, 'ftyp')
+    moov = find_box(tracks[0].init, 'moov')
+    if moov is None:
+        raise MP4Error("初始化段中没有 moov 盒子")
+    mvhd = find_box(tracks[0].init, 'mvhd', moov[1], moov[2])
+    if mvhd is None:
+        raise MP4Error("初始化段中没有 mvhd 盒子")
+
+    traks, trexes, timelines = [], [], []
+    for track_id, track in enumerate(tracks, 1):
+        track_moov = find_box(track.init, 'moov')
+        trak = find_box(track.init, 'trak', track_moov[1], track_moov[2]) if track_moov else None
+        trex = find_path(track.init, 'moov/mvex/trex')
+        tkhd = find_box(track.init, 'tkhd', trak[1], trak[2]) if trak else None
+        if trak is None or trex is None or tkhd is None:
+            raise MP4Error("初始化段不是分片 MP4")
+
+        trak_data = bytearray(track.init[trak[0]:trak[2]])
+        tkhd_payload = tkhd[1] - trak[0]
+        struct.pack_into('>I', trak_data, tkhd_payload + (20 if trak_data[tkhd_payload] else 12), track_id)
+        traks.append(bytes(trak_data))
+
+        trex_data = bytearray(track.init[trex[0]:trex[2]])
+        struct.pack_into('>I', trex_data, trex[1] - trex[0] + 4, track_id)
+        trexes.append(bytes(trex_data))
+
+        fragments = _fragments(track.media)
+        if not fragments:
+            raise MP4Error("没有媒体分段")
+        timescale = read_timescale(track.init)
+        first = _decode_time(track.media, fragments[0][0], fragments[0][1])
+        timelines.append((timescale, first, fragments))
+
+    # 以最早开始的轨道为时间零点
+    origin = min(first / timescale for timescale, first, _ in timelines)
+
+    mvhd_data = bytearray(tracks[0].init[mvhd[0]:mvhd[2]])
+    struct.pack_into('>I', mvhd_data, len(mvhd_data) - 4, len(tracks) + 1)  # next_track_ID
+    moov_payload = bytes(mvhd_data) + b''.join(traks) + _box('mvex', b''.join(trexes))
+    header = (tracks[0].init[ftyp[0]:ftyp[2]] if ftyp else b'') + _box('moov', moov_payload)
+
+    ordered = []
+    for track_index, (track, (timescale, _, fragments)) in enumerate(zip(tracks, timelines)):
+        shift = round(origin * timescale)
+        for moof_start, moof_end, fragment_end in fragments:
+            start_time = _decode_time(track.media, moof_start, moof_end) / timescale
+            ordered.append((start_time, track_index, shift, moof_start, moof_end, fragment_end))
+    ordered.sort(key=lambda item: (item[0], item[1]))
+
+    output.write(header)
+    written = len(header)
+    for sequence, (_, track_index, shift, moof_start, moof_end, fragment_end) in enumerate(ordered, 1):
+        track = tracks[track_index]
+        fragment = bytearray(track.media[moof_start:fragment_end])
+        moof_len = moof_end - moof_start
+        mfhd = find_box(fragment, 'mfhd', 8, moof_len)
+        if mfhd is not None:
+            struct.pack_into('>I', fragment, mfhd[1] + 4, sequence)
+        for box_type, _, traf_payload, traf_end in iter_boxes(fragment, 8, moof_len):
+            if box_type != 'traf':
+                continue
+            tfhd = find_box(fragment, 'tfhd', traf_payload, traf_end)
+            if tfhd is not None:
+                struct.pack_into('>I', fragment, tfhd[1] + 4, track_index + 1)
+                flags = struct.unpack_from('>I', fragment, tfhd[1])[0] & 0xFFFFFF
+                if flags & 0x000001:
+                    # 绝对数据偏移：按分段在新文件中的位置修正
+                    base_offset = struct.unpack_from('>Q', fragment, tfhd[1] + 8)[0]
+                    moved = written - (track.media_offset + moof_start)
+                    struct.pack_into('>Q', fragment, tfhd[1] + 8, base_offset + moved)
+            tfdt = find_box(fragment, 'tfdt', traf_payload, traf_end)
+            if tfdt is not None:
+                version = fragment[tfdt[1]]
+                decode_time = _uint(fragment, tfdt[1] + 4, version) - shift
+                struct.pack_into('>Q' if version else '>I', fragment, tfdt[1] + 4, max(0, decode_time))
+        output.write(fragment)
+        written += len(fragment)
+    return written
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+CPU 密集型任务的进程池模块
+
+HTML 正则扫描、大 JSON 解码等 CPU 密集的解析步骤放到独立的进程池执行，
+不占用请求线程所在进程的 GIL，也不阻塞事件循环。小于 OFFLOAD_MIN_BYTES 的
+数据在当前线程直接处理（进程间传输的开销大于收益）。
+
+提交到进程池的函数及其参数、返回值都必须可以被 pickle，函数需定义在模块顶层。
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from .deadline import DeadlineExceeded, remaining
+
+# 进程池大小，0 表示不使用进程池（全部在当前线程执行）
+CPU_POOL_WORKERS = int(os.environ.get('CPU_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+
+# 数据量（字节）达到该值时才提交到进程池
+OFFLOAD_MIN_BYTES = int(os.environ.get('OFFLOAD_MIN_BYTES', 256 * 1024))
+
+
+def _warm_up() -> int:
+    """预热工作进程：提前导入解析器模块"""
+    from . import parsers  # noqa: F401
+    return os.getpid()
+
+
+def _mp_context():
+    # 请求进程中有多个线程，fork 可能复制到被其他线程持有的锁，优先使用 forkserver
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class CpuExecutor:
+    """CPU 密集型任务执行器
+
+    run() 供同步代码（解析器、线程池中的请求）调用，run_async() 供协程调用。
+    进程池中的空闲进程从共享的任务队列中取任务，大任务不会排在某一个忙碌进程之后。
+    """
+
+    def __init__(self, workers: int = CPU_POOL_WORKERS, min_bytes: int = OFFLOAD_MIN_BYTES):
+        self.workers = max(0, workers)
+        self.min_bytes = min_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stats = {'inline': 0, 'offloaded': 0, 'failed': 0, 'restarts': 0}
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers == 0:
+            return None
+        # 进程池不能跨 fork 复用，进程变化时重新创建
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                    self._pid = os.getpid()
+        return self._pool
+
+    def start(self):
+        """启动并预热全部工作进程，应在服务启动时调用，避免首个请求承担创建进程的开销"""
+        pool = self._get_pool()
+        if pool is not None:
+            wait([pool.submit(_warm_up) for _ in range(self.workers)])
+
+    def shutdown(self):
+        """关闭进程池"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _restart(self, pool: ProcessPoolExecutor):
+        """工作进程异常退出后进程池不可再用，重新创建"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self._stats['restarts'] += 1
+        pool.shutdown(wait=False)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def run(self, fn: Callable, *args, size: int = 0) -> Any:
+        """执行 fn(*args)；size 为待处理数据的字节数，较大时在进程池中执行
+
+        等待时间受当前请求的截止时间限制，超时时抛出 DeadlineExceeded。
+        """
+        pool = self._get_pool() if size >= self.min_bytes else None
+        if pool is None:
+            self._count('inline')
+            return fn(*args)
+
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self._restart(pool)
+            self._count('inline')
+            return fn(*args)
+        self._count('offloaded')
+        try:
+            return future.result(timeout=remaining())
+        except FutureTimeoutError:
+            future.cancel()
+            raise DeadlineExceeded()
+        except BrokenProcessPool:
+            self._restart(pool)
+            self._count('failed')
+            return fn(*args)
+
+    async def run_async(self, fn: Callable, *args, size: int = 0) -> Any:
+        """协程版本的 run()，等待期间不阻塞事件循环"""
+        pool = self._get_pool() if size >= self.min_bytes else None
+        if pool is None:
+            self._count('inline')
+            return fn(*args)
+
+        self._count('offloaded')
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, partial(fn, *args))
+        except BrokenProcessPool:
+            self._restart(pool)
+            self._count('failed')
+            return fn(*args)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['workers'] = self.workers
+        stats['min_bytes'] = self.min_bytes
+        return stats
+
+
+# 单例模式，同一进程内的解析器共用一个进程池
+_cpu_executor = None
+
+
+def get_cpu_executor() -> CpuExecutor:
+    """获取全局 CPU 任务执行器"""
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = CpuExecutor()
+    return _cpu_executor
@@ -3,14 +3,56 @@
 多平台视频链接解析与下载引擎 - 核心解析器
 """
 
+import contextvars
+import os
 import re
 import json
+import threading
+import time
 import urllib.parse
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Union
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple, Union
+from dataclasses import asdict, dataclass, field
 from enum import Enum
 
+from .cache import Cache, CacheBackend, get_cache_backend
+from .canonical import CanonicalVideo, canonicalize, strip_tracking_params
+from .deadline import deadline_scope, remaining
+from .offload import get_cpu_executor
+from .refresh import HotEntryRefresher, REFRESH_LEAD, streams_deadline, url_deadline
+
+# 下载链接不带过期时间时，解析结果缓存的有效期（秒）
+PARSE_CACHE_TTL = float(os.environ.get('PARSE_CACHE_TTL', 600))
+
+# 下载链接带过期时间时，缓存在过期前 PARSE_EXPIRY_MARGIN 秒失效（留给客户端开始下载），
+# 最长不超过 PARSE_CACHE_MAX_TTL 秒
+PARSE_EXPIRY_MARGIN = 120.0
+PARSE_CACHE_MAX_TTL = float(os.environ.get('PARSE_CACHE_MAX_TTL', 3600))
+
+# 解析结果过期后继续保留的时间（秒），上游出错或超时时返回这份旧结果
+STALE_TTL = float(os.environ.get('PARSE_STALE_TTL', 7 * 24 * 3600))
+
+# 有旧结果可用时上游解析的耗时预算（秒），超出后先返回旧结果，解析在后台继续并写回缓存
+STALE_LATENCY_BUDGET = float(os.environ.get('PARSE_STALE_LATENCY_BUDGET', 3.0))
+
+# 上游出错后返回旧结果的时长（秒），期间不再请求上游，避免重试风暴
+STALE_SERVE_TTL = 30.0
+
+# 有旧结果可用时执行上游解析的线程数
+STALE_PARSE_WORKERS = 8
+
+# 负缓存：永久性失败按类型缓存的时长（秒），临时错误和签名过期等不缓存
+NEGATIVE_CACHE_TTLS = {
+    'deleted': 24 * 3600,      # 视频已删除
+    'restricted': 3600,        # 需要登录或会员，可能改为公开
+    'no_streams': 6 * 3600,    # 平台不提供可下载的视频流
+    'unsupported': 24 * 3600,  # 链接格式无法识别（如用户主页）
+}
+
+# 短链接跳转结果缓存有效期（秒）
+LINK_CACHE_TTL = float(os.environ.get('LINK_CACHE_TTL', 7 * 24 * 3600))
+
 
 class PlatformType(Enum):
     """支持的视频平台枚举"""
@@ -38,6 +80,22 @@ class VideoStream:
     duration: Optional[int] = None  # 时长（秒）
 
 
+@dataclass
+class MediaRepresentation:
+    """DASH 媒体表示：音视频分离的一路视频或音频流，用于生成 DASH/HLS 清单"""
+    id: str          # 表示 ID，如 "80.avc1"、"30280.mp4a"
+    kind: str        # "video" 或 "audio"
+    url: str         # 媒体文件链接
+    mime_type: str   # 如 "video/mp4"
+    codecs: str      # 如 "avc1.640032"
+    bandwidth: int   # 码率（bit/s）
+    width: Optional[int] = None
+    height: Optional[int] = None
+    frame_rate: Optional[str] = None
+    initialization: Optional[str] = None  # 初始化段的字节范围，如 "0-927"
+    index_range: Optional[str] = None     # sidx 分段索引的字节范围，如 "928-1395"
+
+
 @dataclass
 class VideoMetadata:
     """视频元数据"""
@@ -48,6 +106,16 @@ class VideoMetadata:
     streams: List[VideoStream]
     downloadable: bool
     reason: Optional[str] = None  # 不可下载时的原因
+    canonical_id: Optional[str] = None  # 规范键，如 "bilibili:BV17x411w7KC"，同一视频的各种链接形式相同
+    stale: bool = False  # 上游不可用时返回的旧解析结果
+    error: Optional[str] = None  # 解析失败时的错误信息，失败的结果不会被缓存
+    failure: Optional[str] = None  # 永久性失败的类型（见 NEGATIVE_CACHE_TTLS），按类型写入负缓存
+    representations: List[MediaRepresentation] = field(default_factory=list)  # DASH 音视频流
+
+
+class UnsupportedURLError(Exception):
+    """链接属于支持的平台，但无法从中识别出视频（如用户主页）"""
+    pass
 
 
 class BasePlatformParser(ABC):
@@ -78,9 +146,30 @@ class BasePlatformParser(ABC):
 class VideoParserEngine:
     """视频解析引擎主类"""
 
-    def __init__(self):
+    def __init__(self, cache_backend: Optional[CacheBackend] = None):
         self.parsers: List[BasePlatformParser] = []
         self._register_default_parsers()
+        backend = cache_backend or get_cache_backend()
+        # 解析结果按规范键缓存，同一视频的不同链接形式共用一个条目
+        self.parse_cache = Cache(backend, 'parse', PARSE_CACHE_TTL)
+        self.link_cache = Cache(backend, 'link', LINK_CACHE_TTL)
+        self.negative_cache = Cache(backend, 'negative', max(NEGATIVE_CACHE_TTLS.values()))
+        self.refresher = HotEntryRefresher(self._refresh_entry)
+        self._stale_executor = ThreadPoolExecutor(max_workers=STALE_PARSE_WORKERS,
+                                                  thread_name_prefix='parse-stale')
+        # 每个规范键同一时间只有一个后台解析，上游变慢时后续请求复用它
+        self._stale_inflight: Dict[str, Future] = {}
+        self._stale_lock = threading.Lock()
+        self.cpu_executor = get_cpu_executor()
+
+    def start(self):
+        """服务启动时调用：预先创建 CPU 进程池的工作进程"""
+        self.cpu_executor.start()
+
+    def shutdown(self):
+        """服务关闭时调用：停止后台刷新并关闭 CPU 进程池"""
+        self.refresher.stop()
+        self.cpu_executor.shutdown()
 
     def _register_default_parsers(self):
         """注册默认的平台解析器"""
@@ -102,16 +191,53 @@ class VideoParserEngine:
                 return parser.platform_type
         return PlatformType.UNKNOWN
 
+    def _get_parser(self, platform: PlatformType) -> Optional[BasePlatformParser]:
+        for parser in self.parsers:
+            if parser.platform_type == platform:
+                return parser
+        return None
+
     def normalize_url(self, url: str) -> str:
-        """标准化URL"""
+        """标准化URL，短链接的跳转结果会被缓存"""
         platform = self.detect_platform(url)
         for parser in self.parsers:
             if parser.platform_type == platform:
-                return parser.normalize_url(url)
+                if canonicalize(url) is not None:
+                    return parser.normalize_url(url)
+
+                # 无法本地识别的链接（短链接等）需要访问网络跳转
+                link_key = strip_tracking_params(url.strip())
+                cached = self.link_cache.get(link_key)
+                if cached:
+                    return cached
+                resolved = parser.normalize_url(url)
+                if canonicalize(resolved) is not None:
+                    self.link_cache.set(link_key, resolved)
+                return resolved
         return url
 
-    def parse_video(self, url: str) -> Union[VideoMetadata, Dict[str, str]]:
-        """解析视频链接"""
+    def canonical_key(self, url: str) -> Optional[str]:
+        """不访问网络地计算视频的规范键，短链接等无法本地识别的链接返回 None"""
+        video = canonicalize(url)
+        return video.key if video else None
+
+    def resolve_canonical_key(self, url: str) -> Optional[str]:
+        """计算视频的规范键，短链接会先跳转解析"""
+        key = self.canonical_key(url)
+        if key is None and self.detect_platform(url) != PlatformType.UNKNOWN:
+            key = self.canonical_key(self.normalize_url(url))
+        return key
+
+    def parse_video(self, url: str, timeout: Optional[float] = None) -> Union[VideoMetadata, Dict[str, str]]:
+        """解析视频链接
+
+        timeout 为整个解析过程的时限（秒），每个上游请求只会得到剩余的时间；
+        超时后不再发起新的请求，已获取视频信息但未获取到下载链接时返回不含视频流的部分结果。
+        """
+        with deadline_scope(timeout):
+            return self._parse_video(url)
+
+    def _parse_video(self, url: str) -> Union[VideoMetadata, Dict[str, str]]:
         platform = self.detect_platform(url)
 
         if platform == PlatformType.UNKNOWN:
@@ -123,9 +249,36 @@ class VideoParserEngine:
         for parser in self.parsers:
             if parser.platform_type == platform:
                 try:
+                    # 已知的永久性失败（视频已删除、需要会员等）直接返回，不请求上游
+                    negative_key = self.canonical_key(url) or 'url:' + strip_tracking_params(url.strip())
+                    negative = self.negative_cache.get(negative_key)
+                    if negative:
+                        return self.from_dict(negative)
+
                     normalized_url = self.normalize_url(url)
-                    metadata = parser.parse(normalized_url)
-                    return metadata
+                    # 统一为规范链接（av 号转 BV 号、去除跟踪参数等）
+                    canonical = canonicalize(normalized_url)
+                    if not canonical:
+                        metadata = parser.parse(strip_tracking_params(normalized_url))
+                        self._cache_failure(negative_key, metadata)
+                        return metadata
+
+                    # 短链接跳转后才能得到规范键
+                    if canonical.key != negative_key:
+                        negative = self.negative_cache.get(canonical.key)
+                        if negative:
+                            return self.from_dict(negative)
+
+                    cached = self.parse_cache.get(canonical.key)
+                    if not (cached and "result" in cached):
+                        self.refresher.record_hit(canonical, None)
+                        return self._parse_and_cache(parser, canonical)[0]
+
+                    self.refresher.record_hit(canonical, cached["expires_at"])
+                    if cached["expires_at"] > time.time():
+                        return self.from_dict(cached["result"])
+                    # 已过期的旧结果，上游失败或超时时返回
+                    return self._parse_or_stale(parser, canonical, cached["result"])
                 except Exception as e:
                     return {
                         "success": False,
@@ -137,6 +290,144 @@ class VideoParserEngine:
             "reason": "No parser available for this platform"
         }
 
+    def _parse_and_cache(self, parser: BasePlatformParser,
+                         canonical: CanonicalVideo) -> Tuple[VideoMetadata, Optional[float]]:
+        """请求上游解析，成功时写入缓存，返回解析结果和缓存过期时间"""
+        metadata = parser.parse(canonical.url)
+        if not metadata.canonical_id:
+            metadata.canonical_id = canonical.key
+        expires_at = None
+        if metadata.failure:
+            self._cache_failure(canonical.key, metadata)
+        elif metadata.error is None:
+            expires_at = self._cache_result(canonical, metadata)
+            self.refresher.update_expiry(canonical.key, expires_at)
+        return metadata, expires_at
+
+    def _cache_failure(self, key: str, metadata: VideoMetadata):
+        """永久性失败按类型写入负缓存，其他失败（网络错误、签名过期等）不缓存"""
+        ttl = NEGATIVE_CACHE_TTLS.get(metadata.failure) if metadata.failure else None
+        if ttl:
+            self.negative_cache.set(key, self.to_dict(metadata), ttl)
+
+    def _stale_parse(self, parser: BasePlatformParser, canonical: CanonicalVideo) -> Future:
+        """提交后台解析；同一规范键已有解析在进行时直接复用"""
+        with self._stale_lock:
+            future = self._stale_inflight.get(canonical.key)
+            if future is not None:
+                return future
+            # 在当前上下文中执行，使截止时间传递到后台线程
+            context = contextvars.copy_context()
+            future = self._stale_executor.submit(context.run, self._parse_and_cache, parser, canonical)
+            self._stale_inflight[canonical.key] = future
+
+        def release(done: Future):
+            with self._stale_lock:
+                if self._stale_inflight.get(canonical.key) is done:
+                    del self._stale_inflight[canonical.key]
+
+        future.add_done_callback(release)
+        return future
+
+    def _parse_or_stale(self, parser: BasePlatformParser, canonical: CanonicalVideo,
+                        stale: Dict) -> VideoMetadata:
+        """在耗时预算内请求上游，出错或超时时返回旧结果"""
+        future = self._stale_parse(parser, canonical)
+        left = remaining()
+        budget = STALE_LATENCY_BUDGET if left is None else max(0.0, min(STALE_LATENCY_BUDGET, left))
+        try:
+            metadata = future.result(timeout=budget)[0]
+        except FutureTimeoutError:
+            # 解析在后台继续，完成后写回缓存；在此之前短时间内直接返回旧结果
+            return self._serve_stale(canonical, stale, "上游响应超时，返回最近一次的解析结果",
+                                     pending=future)
+        except Exception as e:
+            error = str(e)
+        else:
+            error = metadata.error
+            if error is None:
+                return metadata
+
+        # 上游出错：短时间内直接返回旧结果，不再请求上游
+        return self._serve_stale(canonical, stale, "平台暂时不可用，返回最近一次的解析结果")
+
+    def _serve_stale(self, canonical: CanonicalVideo, stale: Dict, reason: str,
+                     pending: Optional[Future] = None) -> VideoMetadata:
+        """返回旧结果，并把它写回缓存 STALE_SERVE_TTL 秒，期间的请求不再访问上游"""
+        stale_result = self.to_dict(self._stale_metadata(stale, reason))
+        # 后台解析已完成时缓存中已是新结果，不能覆盖
+        if pending is None or not pending.done():
+            expires_at = time.time() + STALE_SERVE_TTL
+            self.parse_cache.set(canonical.key, {"expires_at": expires_at, "result": stale_result},
+                                 STALE_SERVE_TTL + STALE_TTL)
+            self.refresher.update_expiry(canonical.key, expires_at)
+        return self.from_dict(stale_result)
+
+    def _stale_metadata(self, stale: Dict, reason: str) -> VideoMetadata:
+        """由旧结果生成标记为过期的解析结果，只保留仍在有效期内的下载链接"""
+        metadata = self.from_dict(stale)
+        metadata.stale = True
+        now = time.time()
+        metadata.streams = [
+            stream for stream in metadata.streams
+            if (url_deadline(stream.url) or float('inf')) > now + PARSE_EXPIRY_MARGIN
+        ]
+        metadata.representations = [
+            representation for representation in metadata.representations
+            if (url_deadline(representation.url) or float('inf')) > now + PARSE_EXPIRY_MARGIN
+        ]
+        if metadata.downloadable and not metadata.streams:
+            metadata.downloadable = False
+            metadata.reason = f"{reason}，下载链接已过期，请稍后重试"
+        elif not metadata.reason:
+            metadata.reason = reason
+        return metadata
+
+    def _cache_result(self, canonical: CanonicalVideo, metadata: VideoMetadata) -> Optional[float]:
+        """写入解析结果缓存，返回缓存过期时间；下载链接即将过期时不缓存
+
+        缓存条目在过期后还会保留 STALE_TTL 秒，供上游不可用时返回旧结果。
+        """
+        now = time.time()
+        deadline = streams_deadline([stream.url for stream in metadata.streams] +
+                                    [representation.url for representation in metadata.representations])
+        if deadline is None:
+            ttl = PARSE_CACHE_TTL
+        else:
+            ttl = min(deadline - PARSE_EXPIRY_MARGIN - now, PARSE_CACHE_MAX_TTL)
+        if ttl <= 0:
+            return None
+        expires_at = now + ttl
+        self.parse_cache.set(canonical.key, {
+            "expires_at": expires_at,
+            "result": self.to_dict(metadata)
+        }, ttl + STALE_TTL)
+        return expires_at
+
+    def _refresh_entry(self, canonical: CanonicalVideo) -> Optional[float]:
+        """后台重新解析并写回缓存（由预刷新器调用），返回新的缓存过期时间"""
+        # 共享缓存中的条目可能已被其他进程刷新
+        cached = self.parse_cache.get(canonical.key)
+        if cached and cached.get("expires_at", 0) - time.time() > REFRESH_LEAD:
+            return cached["expires_at"]
+        parser = self._get_parser(PlatformType(canonical.platform))
+        if parser is None:
+            return None
+        metadata, expires_at = self._parse_and_cache(parser, canonical)
+        if metadata.error is not None:
+            raise Exception(metadata.error)
+        return expires_at
+
+    def cache_stats(self) -> Dict:
+        """解析结果缓存、短链接缓存、预刷新和 CPU 进程池的统计信息"""
+        return {
+            "parse": self.parse_cache.stats(),
+            "link": self.link_cache.stats(),
+            "negative": self.negative_cache.stats(),
+            "refresh": self.refresher.stats(),
+            "offload": self.cpu_executor.stats()
+        }
+
     def to_dict(self, data: Union[VideoMetadata, Dict]) -> Dict:
         """将解析结果转换为字典格式"""
         if isinstance(data, dict):
@@ -160,9 +451,28 @@ class VideoParserEngine:
                 for stream in data.streams
             ],
             "downloadable": data.downloadable,
-            "reason": data.reason
+            "reason": data.reason,
+            "canonical_id": data.canonical_id,
+            "stale": data.stale,
+            "representations": [asdict(representation) for representation in data.representations]
         }
 
+    def from_dict(self, data: Dict) -> VideoMetadata:
+        """由 to_dict 的结果还原解析结果（用于读取缓存）"""
+        return VideoMetadata(
+            platform=PlatformType(data["platform"]),
+            title=data["title"],
+            cover=data["cover"],
+            duration=data["duration"],
+            streams=[VideoStream(**stream) for stream in data["streams"]],
+            downloadable=data["downloadable"],
+            reason=data.get("reason"),
+            canonical_id=data.get("canonical_id"),
+            stale=data.get("stale", False),
+            representations=[MediaRepresentation(**representation)
+                             for representation in data.get("representations", [])]
+        )
+
 
 # 单例模式，确保全局只有一个解析引擎实例
 _parser_engine = None
@@ -176,8 +486,8 @@ def get_parser_engine() -> VideoParserEngine:
     return _parser_engine
 
 
-def parse_video_url(url: str) -> Dict:
-    """便捷函数：解析视频URL并返回JSON格式的结果"""
+def parse_video_url(url: str, timeout: Optional[float] = None) -> Dict:
+    """便捷函数：解析视频URL并返回JSON格式的结果，timeout 为解析时限（秒）"""
     engine = get_parser_engine()
-    result = engine.parse_video(url)
+    result = engine.parse_video(url, timeout)
     return engine.to_dict(result)
@@ -6,10 +6,15 @@
 import re
 import json
 import requests
-from typing import List
+from typing import List, Tuple
 from urllib.parse import urlparse, parse_qs
 
-from ..parser import BasePlatformParser, PlatformType, VideoMetadata, VideoStream
+from ..parser import (
+    BasePlatformParser, MediaRepresentation, PlatformType, VideoMetadata, VideoStream, UnsupportedURLError
+)
+from ..canonical import canonicalize
+from ..deadline import upstream_timeout, deadline_exceeded
+from ..payloads import BilibiliDashStream, BilibiliView, decode_bilibili_playurl, decode_bilibili_view
 
 
 class BilibiliParser(BasePlatformParser):
@@ -26,6 +31,7 @@ class BilibiliParser(BasePlatformParser):
             r'bilibili\.com/video/av\d+',
             r'b23\.tv/[a-zA-Z0-9]+',  # 短链接
             r'bilibili\.com/medialist/detail/ml\d+',  # 播单
+            r'^\s*([bB][vV]1[a-zA-Z0-9]{9}|[aA][vV]\d+)\s*$',  # 单独的BV号或av号
         ]
         return any(re.search(pattern, url) for pattern in patterns)
 
@@ -34,11 +40,16 @@ class BilibiliParser(BasePlatformParser):
         # 处理短链接
         if 'b23.tv' in url:
             try:
-                response = requests.head(url, allow_redirects=True, timeout=10)
+                response = requests.head(url, allow_redirects=True, timeout=upstream_timeout(10))
                 return response.url
             except Exception:
                 return url
 
+        # 单独的BV号或av号
+        video = canonicalize(url)
+        if video and not re.search(r'bilibili\.com', url):
+            return video.url
+
         # 确保URL是完整的
         if not url.startswith('http'):
             url = 'https://' + url
@@ -46,46 +57,32 @@ class BilibiliParser(BasePlatformParser):
         return url
 
     def _extract_video_id(self, url: str) -> str:
-        """从URL中提取视频ID"""
-        # BV号
-        bv_match = re.search(r'/video/([bB][vV][a-zA-Z0-9]+)', url)
-        if bv_match:
-            return bv_match.group(1)
-
-        # AV号
-        av_match = re.search(r'/video/av(\d+)', url)
-        if av_match:
-            return av_match.group(1)
+        """从URL中提取视频ID，av号在本地换算为BV号，统一返回BV号"""
+        video = canonicalize(url)
+        if video and video.platform == 'bilibili':
+            return video.video_id
 
         return ""
 
-    def _get_video_info(self, video_id: str) -> dict:
+    def _get_video_info(self, video_id: str) -> BilibiliView:
         """获取视频基本信息"""
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Referer': 'https://www.bilibili.com'
         }
 
-        # 判断是BV号还是AV号
-        if video_id.lower().startswith('bv'):
-            api_url = f'https://api.bilibili.com/x/web-interface/view?bvid={video_id}'
-        else:
-            api_url = f'https://api.bilibili.com/x/web-interface/view?aid={video_id}'
+        api_url = f'https://api.bilibili.com/x/web-interface/view?bvid={video_id}'
 
         try:
-            response = requests.get(api_url, headers=headers, timeout=10)
+            response = requests.get(api_url, headers=headers, timeout=upstream_timeout(10))
             response.raise_for_status()
-            data = response.json()
-
-            if data.get('code') != 0:
-                raise Exception(f"API error: {data.get('message')}")
-
-            return data.get('data', {})
+            return decode_bilibili_view(response.content)
         except Exception as e:
             raise Exception(f"Failed to get video info: {str(e)}")
 
-    def _get_video_streams(self, video_id: str, cid: int) -> List[VideoStream]:
-        """获取视频流信息"""
+    def _get_video_streams(self, video_id: str,
+                           cid: int) -> Tuple[List[VideoStream], List[MediaRepresentation]]:
+        """获取视频流信息，以及 DASH 格式下的全部音视频表示（用于生成播放清单）"""
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Referer': 'https://www.bilibili.com'
@@ -94,20 +91,16 @@ class BilibiliParser(BasePlatformParser):
         api_url = f'https://api.bilibili.com/x/player/playurl?bvid={video_id}&cid={cid}&qn=80&fnver=0&fnval=16&fourk=1'
 
         try:
-            response = requests.get(api_url, headers=headers, timeout=10)
+            response = requests.get(api_url, headers=headers, timeout=upstream_timeout(10))
             response.raise_for_status()
-            data = response.json()
-
-            if data.get('code') != 0:
-                raise Exception(f"API error: {data.get('message')}")
-
-            playurl_data = data.get('data', {})
+            playurl = decode_bilibili_playurl(response.content)
             streams = []
+            representations = []
 
             # 解析不同清晰度的视频流
-            if 'dash' in playurl_data:
+            if playurl.dash_videos is not None:
                 # DASH格式
-                for video in playurl_data['dash'].get('video', []):
+                for video in playurl.dash_videos:
                     quality_map = {
                         120: "8K",
                         116: "1080P60",
@@ -118,19 +111,25 @@ class BilibiliParser(BasePlatformParser):
                         32: "480P",
                         16: "360P"
                     }
-                    quality = quality_map.get(video.get('id'), f"Quality_{video.get('id')}")
+                    quality = quality_map.get(video.id, f"Quality_{video.id}")
 
                     streams.append(VideoStream(
                         quality=quality,
-                        format=video.get('codecs', 'unknown'),
-                        url=video.get('baseUrl', ''),
+                        format=video.codecs,
+                        url=video.base_url,
                         has_watermark=False,  # B站官方流通常无水印
-                        size=video.get('bandwidth'),
-                        duration=video.get('duration')
+                        size=video.bandwidth,
+                        duration=video.duration
                     ))
+
+                representations = [
+                    self._representation(stream, kind)
+                    for kind, dash_streams in (('video', playurl.dash_videos), ('audio', playurl.dash_audios))
+                    for stream in dash_streams
+                ]
             else:
                 # 传统格式
-                durl = playurl_data.get('durl', [])
+                durl = playurl.durl
                 if durl:
                     quality_map = {
                         80: "1080P",
@@ -138,41 +137,59 @@ class BilibiliParser(BasePlatformParser):
                         32: "480P",
                         16: "360P"
                     }
-                    quality = quality_map.get(playurl_data.get('quality', 16), "Unknown")
+                    quality = quality_map.get(playurl.quality, "Unknown")
 
                     streams.append(VideoStream(
                         quality=quality,
                         format="mp4",
-                        url=durl[0].get('url', ''),
+                        url=durl[0].url,
                         has_watermark=False,
-                        size=durl[0].get('size'),
-                        duration=durl[0].get('length')
+                        size=durl[0].size,
+                        duration=durl[0].length
                     ))
 
-            return streams
+            return streams, representations
         except Exception as e:
             raise Exception(f"Failed to get video streams: {str(e)}")
 
+    @staticmethod
+    def _representation(stream: BilibiliDashStream, kind: str) -> MediaRepresentation:
+        """DASH 流转换为媒体表示；同一清晰度可能有 AVC/HEVC/AV1 多种编码，ID 中带上编码"""
+        return MediaRepresentation(
+            id=f"{stream.id}.{stream.codecs.split('.')[0]}",
+            kind=kind,
+            url=stream.base_url,
+            mime_type=stream.mime_type or f"{kind}/mp4",
+            codecs=stream.codecs,
+            bandwidth=stream.bandwidth or 0,
+            width=stream.width,
+            height=stream.height,
+            frame_rate=stream.frame_rate,
+            initialization=stream.initialization,
+            index_range=stream.index_range
+        )
+
     def parse(self, url: str) -> VideoMetadata:
         """解析哔哩哔哩视频"""
         try:
             # 提取视频ID
             video_id = self._extract_video_id(url)
             if not video_id:
-                raise Exception("无法从URL中提取视频ID")
+                # 短链接跳转失败（网络错误或超时）属于临时错误
+                if 'b23.tv' in url:
+                    raise Exception("短链接跳转失败")
+                raise UnsupportedURLError("无法从URL中提取视频ID")
 
             # 获取视频基本信息
             video_info = self._get_video_info(video_id)
-            if not video_info:
-                raise Exception("获取视频信息失败")
 
-            title = video_info.get('title', '')
-            cover = video_info.get('pic', '')
-            duration = video_info.get('duration', 0)
-            cid = video_info.get('cid', 0)
+            title = video_info.title
+            cover = video_info.pic
+            duration = video_info.duration
+            cid = video_info.cid
 
             # 检查视频是否可下载
-            if video_info.get('redirect_url'):
+            if video_info.redirect_url:
                 return VideoMetadata(
                     platform=self.platform_type,
                     title=title,
@@ -180,11 +197,26 @@ class BilibiliParser(BasePlatformParser):
                     duration=duration,
                     streams=[],
                     downloadable=False,
-                    reason="此视频需要登录或会员才能观看"
+                    reason="此视频需要登录或会员才能观看",
+                    failure="restricted"
                 )
 
-            # 获取视频流
-            streams = self._get_video_streams(video_id, cid)
+            # 获取视频流；超过截止时间时只返回视频基本信息
+            try:
+                streams, representations = self._get_video_streams(video_id, cid)
+            except Exception as e:
+                if not deadline_exceeded():
+                    raise
+                return VideoMetadata(
+                    platform=self.platform_type,
+                    title=title,
+                    cover=cover,
+                    duration=duration,
+                    streams=[],
+                    downloadable=False,
+                    reason="解析超时，未能获取下载链接，请稍后重试",
+                    error=str(e)
+                )
 
             return VideoMetadata(
                 platform=self.platform_type,
@@ -192,7 +224,8 @@ class BilibiliParser(BasePlatformParser):
                 cover=cover,
                 duration=duration,
                 streams=streams,
-                downloadable=len(streams) > 0
+                downloadable=len(streams) > 0,
+                representations=representations
             )
         except Exception as e:
             return VideoMetadata(
@@ -202,5 +235,7 @@ class BilibiliParser(BasePlatformParser):
                 duration=0,
                 streams=[],
                 downloadable=False,
-                reason=f"解析失败: {str(e)}"
+                reason=f"解析失败: {str(e)}",
+                error=str(e),
+                failure="unsupported" if isinstance(e, UnsupportedURLError) else None
             )
@@ -9,7 +9,10 @@ import requests
 from typing import List
 from urllib.parse import urlparse, parse_qs
 
-from ..parser import BasePlatformParser, PlatformType, VideoMetadata, VideoStream
+from ..parser import BasePlatformParser, PlatformType, VideoMetadata, VideoStream, UnsupportedURLError
+from ..deadline import upstream_timeout
+from ..offload import get_cpu_executor
+from ..payloads import DouyinItem, decode_douyin_item
 
 
 class DouyinParser(BasePlatformParser):
@@ -34,7 +37,7 @@ class DouyinParser(BasePlatformParser):
         # 处理短链接
         if 'v.douyin.com' in url:
             try:
-                response = requests.head(url, allow_redirects=True, timeout=10)
+                response = requests.head(url, allow_redirects=True, timeout=upstream_timeout(10))
                 return response.url
             except Exception:
                 return url
@@ -60,7 +63,7 @@ class DouyinParser(BasePlatformParser):
 
         return ""
 
-    def _get_video_info(self, video_id: str) -> dict:
+    def _get_video_info(self, video_id: str) -> DouyinItem:
         """获取视频基本信息"""
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -70,31 +73,30 @@ class DouyinParser(BasePlatformParser):
         api_url = f'https://www.iesdouyin.com/web/api/v2/aweme/iteminfo/?item_ids={video_id}'
 
         try:
-            response = requests.get(api_url, headers=headers, timeout=10)
+            response = requests.get(api_url, headers=headers, timeout=upstream_timeout(10))
             response.raise_for_status()
-            data = response.json()
+            content = response.content
+            # 解码在 CPU 进程池中执行，只传回解析器用到的字段
+            video_info = get_cpu_executor().run(decode_douyin_item, content, size=len(content))
 
-            if not data.get('item_list'):
+            if not video_info:
                 raise Exception("未找到视频信息")
 
-            return data.get('item_list', [])[0]
+            return video_info
         except Exception as e:
             raise Exception(f"获取视频信息失败: {str(e)}")
 
-    def _get_video_streams(self, video_info: dict) -> List[VideoStream]:
+    def _get_video_streams(self, video_info: DouyinItem) -> List[VideoStream]:
         """获取视频流信息"""
         streams = []
 
         try:
             # 获取视频地址
-            video = video_info.get('video', {})
-            play_addr = video.get('play_addr', {})
-
-            if not play_addr or not play_addr.get('url_list'):
+            if not video_info.play_urls:
                 return streams
 
             # 获取不同清晰度的视频
-            for i, url in enumerate(play_addr.get('url_list', [])):
+            for i, url in enumerate(video_info.play_urls):
                 # 抖音视频通常有水印，但官方API可能提供无水印版本
                 # 这里假设获取的是无水印版本
                 quality = "原画"
@@ -104,22 +106,20 @@ class DouyinParser(BasePlatformParser):
                     format="mp4",
                     url=url,
                     has_watermark=False,  # 假设是无水印版本
-                    size=video.get('size'),
-                    duration=video_info.get('duration')
+                    size=video_info.size,
+                    duration=video_info.duration
                 ))
 
             # 如果有高清版本
-            download_addr = video.get('download_addr', {})
-            if download_addr and download_addr.get('url_list'):
-                for url in download_addr.get('url_list', []):
-                    streams.append(VideoStream(
-                        quality="高清",
-                        format="mp4",
-                        url=url,
-                        has_watermark=True,  # 下载版本可能有水印
-                        size=video.get('size'),
-                        duration=video_info.get('duration')
-                    ))
+            for url in video_info.download_urls:
+                streams.append(VideoStream(
+                    quality="高清",
+                    format="mp4",
+                    url=url,
+                    has_watermark=True,  # 下载版本可能有水印
+                    size=video_info.size,
+                    duration=video_info.duration
+                ))
 
             return streams
         except Exception as e:
@@ -131,28 +131,26 @@ class DouyinParser(BasePlatformParser):
             # 提取视频ID
             video_id = self._extract_video_id(url)
             if not video_id:
-                raise Exception("无法从URL中提取视频ID")
+                # 短链接跳转失败（网络错误或超时）属于临时错误
+                if 'v.douyin.com' in url:
+                    raise Exception("短链接跳转失败")
+                raise UnsupportedURLError("无法从URL中提取视频ID")
 
             # 获取视频基本信息
             video_info = self._get_video_info(video_id)
-            if not video_info:
-                raise Exception("获取视频信息失败")
 
             # 提取视频信息
-            desc = video_info.get('desc', '')
-            cover = ""
-            duration = video_info.get('duration', 0)
+            desc = video_info.desc
+            duration = video_info.duration
 
             # 获取封面
-            video = video_info.get('video', {})
-            if video and video.get('cover', {}).get('url_list'):
-                cover = video.get('cover', {}).get('url_list', [])[0]
+            cover = video_info.cover_urls[0] if video_info.cover_urls else ""
 
             # 获取视频流
             streams = self._get_video_streams(video_info)
 
             # 检查视频是否可下载
-            if video_info.get('status', {}).get('is_delete', False):
+            if video_info.is_delete:
                 return VideoMetadata(
                     platform=self.platform_type,
                     title=desc,
@@ -160,7 +158,8 @@ class DouyinParser(BasePlatformParser):
                     duration=duration,
                     streams=[],
                     downloadable=False,
-                    reason="视频已被删除"
+                    reason="视频已被删除",
+                    failure="deleted"
                 )
 
             return VideoMetadata(
@@ -179,5 +178,7 @@ class DouyinParser(BasePlatformParser):
                 duration=0,
                 streams=[],
                 downloadable=False,
-                reason=f"解析失败: {str(e)}"
+                reason=f"解析失败: {str(e)}",
+                error=str(e),
+                failure="unsupported" if isinstance(e, UnsupportedURLError) else None
             )
@@ -9,7 +9,30 @@ import requests
 from typing import List
 from urllib.parse import urlparse, parse_qs
 
-from ..parser import BasePlatformParser, PlatformType, VideoMetadata, VideoStream
+from ..parser import BasePlatformParser, PlatformType, VideoMetadata, VideoStream, UnsupportedURLError
+from ..deadline import upstream_timeout
+from ..offload import get_cpu_executor
+
+
+def extract_page_info(html: str) -> dict:
+    """从视频页面 HTML 中提取标题、缩略图和时长（在 CPU 进程池中执行）"""
+    # 提取标题
+    title_match = re.search(r'"title":"([^"]+)"', html)
+    title = title_match.group(1) if title_match else ""
+
+    # 提取缩略图
+    thumbnail_match = re.search(r'"thumbnailUrl":"([^"]+)"', html)
+    thumbnail = thumbnail_match.group(1) if thumbnail_match else ""
+
+    # 提取时长
+    duration_match = re.search(r'"lengthSeconds":"(\d+)"', html)
+    duration = int(duration_match.group(1)) if duration_match else 0
+
+    return {
+        'title': title,
+        'thumbnail_url': thumbnail,
+        'duration': duration
+    }
 
 
 class YouTubeParser(BasePlatformParser):
@@ -93,7 +116,7 @@ class YouTubeParser(BasePlatformParser):
         api_url = f'https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json'
 
         try:
-            response = requests.get(api_url, headers=headers, timeout=10)
+            response = requests.get(api_url, headers=headers, timeout=upstream_timeout(10))
             response.raise_for_status()
             data = response.json()
 
@@ -116,27 +139,10 @@ class YouTubeParser(BasePlatformParser):
         page_url = f'https://www.youtube.com/watch?v={video_id}'
 
         try:
-            response = requests.get(page_url, headers=headers, timeout=10)
+            response = requests.get(page_url, headers=headers, timeout=upstream_timeout(10))
             response.raise_for_status()
             html = response.text
-
-            # 提取标题
-            title_match = re.search(r'"title":"([^"]+)"', html)
-            title = title_match.group(1) if title_match else ""
-
-            # 提取缩略图
-            thumbnail_match = re.search(r'"thumbnailUrl":"([^"]+)"', html)
-            thumbnail = thumbnail_match.group(1) if thumbnail_match else ""
-
-            # 提取时长
-            duration_match = re.search(r'"lengthSeconds":"(\d+)"', html)
-            duration = int(duration_match.group(1)) if duration_match else 0
-
-            return {
-                'title': title,
-                'thumbnail_url': thumbnail,
-                'duration': duration
-            }
+            return get_cpu_executor().run(extract_page_info, html, size=len(html))
         except Exception as e:
             raise Exception(f"解析视频页面失败: {str(e)}")
 
@@ -159,7 +165,7 @@ class YouTubeParser(BasePlatformParser):
             # 提取视频ID
             video_id = self._extract_video_id(url)
             if not video_id:
-                raise Exception("无法从URL中提取视频ID")
+                raise UnsupportedURLError("无法从URL中提取视频ID")
 
             # 获取视频基本信息
             video_info = self._get_video_info(video_id)
@@ -182,7 +188,8 @@ class YouTubeParser(BasePlatformParser):
                     duration=duration,
                     streams=[],
                     downloadable=False,
-                    reason="YouTube视频受版权保护，无法直接下载。请使用YouTube Premium或第三方工具下载。"
+                    reason="YouTube视频受版权保护，无法直接下载。请使用YouTube Premium或第三方工具下载。",
+                    failure="no_streams"
                 )
 
             return VideoMetadata(
@@ -201,5 +208,7 @@ class YouTubeParser(BasePlatformParser):
                 duration=0,
                 streams=[],
                 downloadable=False,
-                reason=f"解析失败: {str(e)}"
+                reason=f"解析失败: {str(e)}",
+                error=str(e),
+                failure="unsupported" if isinstance(e, UnsupportedURLError) else None
             )
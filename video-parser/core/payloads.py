@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+上游接口响应的类型化解码模块
+
+各平台接口返回的 JSON 只有少数字段会被解析器用到。这里为每种响应定义
+只包含所需字段的数据类，解码时一次性检查结构和类型，其余字段直接丢弃；
+结构不符合预期时抛出 PayloadError，指明出错字段的路径。
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库
+    orjson = None
+
+_REQUIRED = object()
+
+_TYPE_NAMES = {int: '整数', float: '数字', str: '字符串', bool: '布尔值', dict: '对象', list: '数组'}
+
+
+class PayloadError(Exception):
+    """上游响应结构不符合预期"""
+
+    def __init__(self, path: str, message: str):
+        super().__init__(f"响应格式错误: {path} {message}")
+        self.path = path
+        self.message = message
+
+    def __reduce__(self):
+        # 在进程池中抛出时需要按构造参数重建
+        return type(self), (self.path, self.message)
+
+
+class UpstreamAPIError(Exception):
+    """上游接口返回了错误码"""
+
+    def __init__(self, code: Any, message: Any):
+        super().__init__(f"API error: {message}")
+        self.code = code
+        self.message = message
+
+    def __reduce__(self):
+        return type(self), (self.code, self.message)
+
+
+def decode_json(content: bytes) -> Any:
+    """解码 JSON 响应体，优先使用 orjson"""
+    try:
+        return orjson.loads(content) if orjson is not None else json.loads(content)
+    except ValueError as e:
+        raise PayloadError('$', f"不是有效的 JSON: {str(e)}")
+
+
+def _field(obj: Dict, key: str, kind: type, path: str, default: Any = _REQUIRED) -> Any:
+    """读取并检查一个字段；字段缺失或为 null 时返回 default，未提供 default 时报错"""
+    value = obj.get(key)
+    if value is None:
+        if default is _REQUIRED:
+            raise PayloadError(f"{path}.{key}", "缺少字段")
+        return default
+    # bool 是 int 的子类，数值字段不接受布尔值
+    if isinstance(value, bool) and kind is not bool:
+        valid = False
+    elif kind is float:
+        valid = isinstance(value, (int, float))
+    else:
+        valid = isinstance(value, kind)
+    if not valid:
+        raise PayloadError(f"{path}.{key}", f"应为{_TYPE_NAMES.get(kind, kind.__name__)}")
+    return value
+
+
+def _object(obj: Dict, key: str, path: str, required: bool = True) -> Dict:
+    """读取嵌套对象，非必需且缺失时返回空对象"""
+    return _field(obj, key, dict, path, _REQUIRED if required else {})
+
+
+def _list(obj: Dict, key: str, path: str, required: bool = False) -> List:
+    return _field(obj, key, list, path, _REQUIRED if required else [])
+
+
+def _str_list(obj: Dict, key: str, path: str) -> List[str]:
+    """读取字符串数组，非字符串元素视为格式错误"""
+    values = _list(obj, key, path)
+    for i, value in enumerate(values):
+        if not isinstance(value, str):
+            raise PayloadError(f"{path}.{key}[{i}]", "应为字符串")
+    return values
+
+
+def _root(content: bytes) -> Dict:
+    data = decode_json(content)
+    if not isinstance(data, dict):
+        raise PayloadError('$', "应为对象")
+    return data
+
+
+def _bilibili_data(content: bytes) -> Dict:
+    """检查B站接口的 code/message 外层结构，返回 data 对象"""
+    data = _root(content)
+    code = data.get('code')
+    if code != 0:
+        raise UpstreamAPIError(code, data.get('message'))
+    return _object(data, 'data', '$')
+
+
+@dataclass
+class BilibiliView:
+    """B站视频信息接口（x/web-interface/view）"""
+    title: str
+    pic: str
+    duration: int
+    cid: int
+    redirect_url: Optional[str] = None
+
+
+@dataclass
+class BilibiliDashStream:
+    """B站 DASH 视频流或音频流"""
+    id: int
+    base_url: str
+    codecs: str
+    bandwidth: Optional[int] = None
+    duration: Optional[int] = None
+    mime_type: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    frame_rate: Optional[str] = None
+    initialization: Optional[str] = None  # SegmentBase.Initialization，如 "0-927"
+    index_range: Optional[str] = None     # SegmentBase.indexRange，如 "928-1395"
+
+
+@dataclass
+class BilibiliDurl:
+    """B站传统格式（FLV/MP4）分段"""
+    url: str
+    size: Optional[int] = None
+    length: Optional[int] = None
+
+
+@dataclass
+class BilibiliPlayurl:
+    """B站播放地址接口（x/player/playurl）；dash_videos 为 None 表示没有 DASH 流"""
+    quality: int
+    dash_videos: Optional[List[BilibiliDashStream]] = None
+    dash_audios: List[BilibiliDashStream] = field(default_factory=list)
+    durl: List[BilibiliDurl] = field(default_factory=list)
+
+
+@dataclass
+class DouyinItem:
+    """抖音作品信息接口（aweme/iteminfo）中的作品"""
+    desc: str
+    duration: int
+    is_delete: bool
+    cover_urls: List[str]
+    play_urls: List[str]
+    download_urls: List[str]
+    size: Optional[int] = None
+
+
+def decode_bilibili_view(content: bytes) -> BilibiliView:
+    data = _bilibili_data(content)
+    path = '$.data'
+    return BilibiliView(
+        title=_field(data, 'title', str, path, ''),
+        pic=_field(data, 'pic', str, path, ''),
+        duration=_field(data, 'duration', int, path, 0),
+        cid=_field(data, 'cid', int, path),
+        redirect_url=_field(data, 'redirect_url', str, path, None) or None
+    )
+
+
+def _dash_streams(dash: Dict, key: str) -> List[BilibiliDashStream]:
+    streams = []
+    for i, stream in enumerate(_list(dash, key, '$.data.dash')):
+        path = f'$.data.dash.{key}[{i}]'
+        if not isinstance(stream, dict):
+            raise PayloadError(path, "应为对象")
+        segment_base = _object(stream, 'SegmentBase', path, required=False)
+        streams.append(BilibiliDashStream(
+            id=_field(stream, 'id', int, path),
+            base_url=_field(stream, 'baseUrl', str, path),
+            codecs=_field(stream, 'codecs', str, path, 'unknown'),
+            bandwidth=_field(stream, 'bandwidth', int, path, None),
+            duration=_field(stream, 'duration', int, path, None),
+            mime_type=_field(stream, 'mimeType', str, path, None),
+            width=_field(stream, 'width', int, path, None),
+            height=_field(stream, 'height', int, path, None),
+            frame_rate=_field(stream, 'frameRate', str, path, None),
+            initialization=_field(segment_base, 'Initialization', str, f'{path}.SegmentBase', None),
+            index_range=_field(segment_base, 'indexRange', str, f'{path}.SegmentBase', None)
+        ))
+    return streams
+
+
+def decode_bilibili_playurl(content: bytes) -> BilibiliPlayurl:
+    data = _bilibili_data(content)
+    playurl = BilibiliPlayurl(quality=_field(data, 'quality', int, '$.data', 16))
+
+    if data.get('dash') is not None:
+        dash = _object(data, 'dash', '$.data')
+        playurl.dash_videos = _dash_streams(dash, 'video')
+        # 无音轨的视频 audio 为 null
+        playurl.dash_audios = _dash_streams(dash, 'audio')
+    else:
+        for i, segment in enumerate(_list(data, 'durl', '$.data')):
+            path = f'$.data.durl[{i}]'
+            if not isinstance(segment, dict):
+                raise PayloadError(path, "应为对象")
+            playurl.durl.append(BilibiliDurl(
+                url=_field(segment, 'url', str, path),
+                size=_field(segment, 'size', int, path, None),
+                length=_field(segment, 'length', int, path, None)
+            ))
+    return playurl
+
+
+def decode_douyin_item(content: bytes) -> Optional[DouyinItem]:
+    """解码抖音作品信息接口的响应，返回第一个作品，没有作品时返回 None"""
+    data = _root(content)
+    item_list = _list(data, 'item_list', '$')
+    if not item_list:
+        return None
+
+    item = item_list[0]
+    path = '$.item_list[0]'
+    if not isinstance(item, dict):
+        raise PayloadError(path, "应为对象")
+    video = _object(item, 'video', path, required=False)
+    video_path = f'{path}.video'
+    return DouyinItem(
+        desc=_field(item, 'desc', str, path, ''),
+        duration=_field(item, 'duration', int, path, 0),
+        is_delete=_field(_object(item, 'status', path, required=False), 'is_delete', bool,
+                         f'{path}.status', False),
+        cover_urls=_str_list(_object(video, 'cover', video_path, required=False), 'url_list',
+                             f'{video_path}.cover'),
+        play_urls=_str_list(_object(video, 'play_addr', video_path, required=False), 'url_list',
+                            f'{video_path}.play_addr'),
+        download_urls=_str_list(_object(video, 'download_addr', video_path, required=False), 'url_list',
+                                f'{video_path}.download_addr'),
+        size=_field(video, 'size', int, video_path, None)
+    )
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+客户端限流与配额模块
+
+按客户端（已配置的 API 令牌，否则为 IP）限制每分钟请求数（滑动窗口）
+和每日请求数（按自然日重置）。不同接口使用不同的策略，未匹配的请求不受限制。
+
+计数默认保存在进程内：每个客户端每个计数器只占一个打包整数，数十万客户端
+也只需几十 MB 内存，过期计数随请求逐步清理。缓存后端在多个进程间共享（sqlite/redis）时，计数写入
+缓存后端，多个 worker 共用同一份额度；缓存后端不可用时退回进程内计数。
+"""
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Pattern, Tuple
+
+from .cache import CacheBackend, get_cache_backend
+
+# 是否启用限流
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+
+# 缓存后端为共享后端时是否用它保存计数
+RATE_LIMIT_SHARED = os.environ.get('RATE_LIMIT_SHARED', '1') == '1'
+
+# 单个视频解析
+PARSE_PER_MINUTE = int(os.environ.get('RATE_LIMIT_PARSE_PER_MINUTE', 30))
+PARSE_PER_DAY = int(os.environ.get('RATE_LIMIT_PARSE_PER_DAY', 1000))
+
+# AI 生成与相关性分析
+AI_PER_MINUTE = int(os.environ.get('RATE_LIMIT_AI_PER_MINUTE', 10))
+AI_PER_DAY = int(os.environ.get('RATE_LIMIT_AI_PER_DAY', 200))
+
+# 批量相关性分析
+BATCH_PER_MINUTE = int(os.environ.get('RATE_LIMIT_BATCH_PER_MINUTE', 2))
+BATCH_PER_DAY = int(os.environ.get('RATE_LIMIT_BATCH_PER_DAY', 50))
+
+# 片段截取（需要下载和合并媒体数据）
+CLIP_PER_MINUTE = int(os.environ.get('RATE_LIMIT_CLIP_PER_MINUTE', 5))
+CLIP_PER_DAY = int(os.environ.get('RATE_LIMIT_CLIP_PER_DAY', 100))
+
+# 媒体代理（播放时每个分段一次请求）
+MEDIA_PER_MINUTE = int(os.environ.get('RATE_LIMIT_MEDIA_PER_MINUTE', 240))
+MEDIA_PER_DAY = int(os.environ.get('RATE_LIMIT_MEDIA_PER_DAY', 50000))
+
+# 进程内跟踪的客户端数上限（每个计数器）
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 500000))
+
+# 每次计数时最多清理的过期客户端数
+RATE_LIMIT_SWEEP_STEP = 32
+
+# 每日配额按北京时间零点重置
+QUOTA_DAY_OFFSET = 8 * 3600
+
+# 是否信任反向代理传入的 X-Real-IP / X-Forwarded-For（仅在服务只能经由代理访问时开启）
+TRUST_PROXY_HEADERS = os.environ.get('RATE_LIMIT_TRUST_PROXY', '0') == '1'
+
+
+def _parse_client_tokens(value: str) -> Dict[str, float]:
+    """解析 CLIENT_TOKENS：逗号分隔的 令牌[:限额倍数]"""
+    tokens = {}
+    for item in value.split(','):
+        token, _, multiplier = item.strip().partition(':')
+        if token:
+            tokens[token] = float(multiplier) if multiplier else 1.0
+    return tokens
+
+
+# 已登记的客户端令牌及其限额倍数；未登记的令牌按 IP 计数
+CLIENT_TOKENS = _parse_client_tokens(os.environ.get('CLIENT_TOKENS', ''))
+
+_COUNT_BITS = 20
+_COUNT_MASK = (1 << _COUNT_BITS) - 1
+
+
+class RateLimitExceeded(Exception):
+    """客户端超过限流或配额"""
+
+    status_code = 429
+
+    def __init__(self, policy: str, scope: str, limit: int, retry_after: int):
+        message = "请求过于频繁" if scope == 'rate' else "今日请求次数已用完"
+        super().__init__(message)
+        self.policy = policy
+        self.scope = scope
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+def client_identity(headers: Mapping[str, str], remote_addr: Optional[str]) -> Tuple[str, float]:
+    """根据请求头和来源地址确定客户端，返回 (客户端标识, 限额倍数)"""
+    token = headers.get('x-api-key')
+    if not token:
+        authorization = headers.get('authorization') or ''
+        if authorization[:7].lower() == 'bearer ':
+            token = authorization[7:].strip()
+    if token and token in CLIENT_TOKENS:
+        # 计数键中不保存令牌原文
+        return 'token:' + hashlib.sha256(token.encode('utf-8')).hexdigest()[:16], CLIENT_TOKENS[token]
+
+    ip = remote_addr or 'unknown'
+    if TRUST_PROXY_HEADERS:
+        forwarded = headers.get('x-real-ip') or (headers.get('x-forwarded-for') or '').split(',')[0].strip()
+        ip = forwarded or ip
+    return 'ip:' + ip, 1.0
+
+
+class _Window:
+    """计数窗口：长度、是否滑动，以及给定时刻所在窗口的序号和已过去的比例"""
+
+    def __init__(self, name: str, seconds: int, sliding: bool, offset: int = 0):
+        self.name = name
+        self.seconds = seconds
+        self.sliding = sliding
+        self.offset = offset
+
+    def position(self, now: float) -> Tuple[int, float]:
+        index, elapsed = divmod(now + self.offset, self.seconds)
+        return int(index), elapsed / self.seconds
+
+    def estimate(self, prev: int, cur: int, fraction: float) -> float:
+        """滑动窗口按上一窗口计数的剩余权重估算最近一个窗口长度内的请求数"""
+        if self.sliding:
+            return prev * (1 - fraction) + cur
+        return cur
+
+    def retry_after(self, prev: int, cur: int, fraction: float, limit: int) -> int:
+        """再发起一个请求需要等待的秒数"""
+        if not self.sliding:
+            wait = 1 - fraction
+        elif cur + 1 <= limit and prev > 0:
+            # 当前窗口内等待上一窗口的权重衰减
+            wait = 1 - (limit - 1 - cur) / prev - fraction
+        else:
+            # 等到下一窗口，当前窗口的计数衰减到足够低
+            wait = 1 - fraction + max(0.0, 1 - (limit - 1) / max(cur, 1))
+        return max(1, math.ceil(wait * self.seconds))
+
+
+class WindowCounter:
+    """进程内的窗口计数器
+
+    每个客户端只占一个字典项，值为打包后的整数：
+    窗口序号 << 40 | 上一窗口计数 << 20 | 当前窗口计数。
+    字典按最后一次计数的时间排序，最久未访问的客户端在最前面：
+    每次计数时从最前面清理少量两个窗口以上未访问的客户端，
+    超出上限时淘汰最久未访问的客户端，单次操作的耗时与客户端总数无关。
+    """
+
+    def __init__(self, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def get(self, client: str, index: int) -> Tuple[int, int]:
+        """返回 (上一窗口计数, 当前窗口计数)"""
+        packed = self._counts.get(client)
+        if packed is None:
+            return 0, 0
+        start = packed >> (2 * _COUNT_BITS)
+        if start == index:
+            return (packed >> _COUNT_BITS) & _COUNT_MASK, packed & _COUNT_MASK
+        if start == index - 1:
+            return packed & _COUNT_MASK, 0
+        return 0, 0
+
+    def add(self, client: str, index: int, amount: int = 1):
+        self._sweep(index)
+        prev, cur = self.get(client, index)
+        if client in self._counts:
+            self._counts.move_to_end(client)
+        elif len(self._counts) >= self.max_clients:
+            # 清理后仍超出上限时淘汰最久未访问的客户端
+            self._counts.popitem(last=False)
+        cur = min(max(cur + amount, 0), _COUNT_MASK)
+        self._counts[client] = (index << (2 * _COUNT_BITS)) | (prev << _COUNT_BITS) | cur
+
+    def _sweep(self, index: int):
+        # 越靠前的客户端最后访问的窗口越早，遇到仍有效的客户端即可停止
+        for _ in range(RATE_LIMIT_SWEEP_STEP):
+            if not self._counts:
+                return
+            client = next(iter(self._counts))
+            if self._counts[client] >> (2 * _COUNT_BITS) >= index - 1:
+                return
+            del self._counts[client]
+
+
+class RateLimitPolicy:
+    """一类接口的限流策略：每分钟（滑动窗口）和每日（自然日）请求上限，0 表示不限制"""
+
+    def __init__(self, name: str, per_minute: int, per_day: int):
+        self.name = name
+        self.limits: List[Tuple[str, _Window, int]] = []
+        if per_minute > 0:
+            self.limits.append(('rate', _Window('minute', 60, sliding=True), per_minute))
+        if per_day > 0:
+            self.limits.append(('quota', _Window('day', 86400, sliding=False, offset=QUOTA_DAY_OFFSET), per_day))
+
+
+class RateLimiter:
+    """按方法和路径把请求分配到限流策略，按客户端计数"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self.backend = backend if backend is not None and backend.shared else None
+        self.policies: Dict[str, RateLimitPolicy] = {}
+        self._rules: List[Tuple[Optional[str], Pattern, str]] = []
+        self._counters: Dict[Tuple[str, str], WindowCounter] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def shared(self) -> bool:
+        """计数是否保存在共享缓存后端（访问会阻塞，异步服务应在线程池中调用 check）"""
+        return self.backend is not None
+
+    def add_policy(self, policy: RateLimitPolicy):
+        self.policies[policy.name] = policy
+        self._stats[policy.name] = {'allowed': 0, 'rejected_rate': 0, 'rejected_quota': 0}
+        for _, window, _ in policy.limits:
+            self._counters[(policy.name, window.name)] = WindowCounter()
+
+    def add_rule(self, method: Optional[str], path_pattern: str, policy_name: str):
+        """method 为 None 时匹配所有方法；按添加顺序匹配，先匹配的规则生效"""
+        self._rules.append((method, re.compile(path_pattern), policy_name))
+
+    def classify(self, method: str, path: str) -> Optional[RateLimitPolicy]:
+        if not self.enabled:
+            return None
+        for rule_method, pattern, policy_name in self._rules:
+            if (rule_method is None or rule_method == method) and pattern.match(path):
+                return self.policies[policy_name]
+        return None
+
+    def check(self, policy: RateLimitPolicy, client: str, multiplier: float = 1.0):
+        """登记一次请求，超过任一上限时抛出 RateLimitExceeded（被拒绝的请求不计数）"""
+        now = time.time()
+        limits = [(scope, window, max(1, int(limit * multiplier))) for scope, window, limit in policy.limits]
+        try:
+            if self.backend is None or not self._check_shared(policy, client, limits, now):
+                self._check_local(policy, client, limits, now)
+        except RateLimitExceeded as e:
+            self._count(policy.name, 'rejected_' + e.scope)
+            raise
+        self._count(policy.name, 'allowed')
+
+    def _check_local(self, policy: RateLimitPolicy, client: str, limits, now: float):
+        with self._lock:
+            positions = []
+            for scope, window, limit in limits:
+                counter = self._counters[(policy.name, window.name)]
+                index, fraction = window.position(now)
+                prev, cur = counter.get(client, index)
+                if window.estimate(prev, cur, fraction) + 1 > limit:
+                    raise RateLimitExceeded(policy.name, scope, limit,
+                                            window.retry_after(prev, cur, fraction, limit))
+                positions.append((counter, index))
+            for counter, index in positions:
+                counter.add(client, index)
+
+    def _shared_key(self, policy: RateLimitPolicy, window: _Window, client: str, index: int) -> str:
+        return f'ratelimit:{policy.name}:{window.name}:{client}:{index}'
+
+    def _check_shared(self, policy: RateLimitPolicy, client: str, limits, now: float) -> bool:
+        """在共享后端计数；后端不可用时返回 False，由调用方改用进程内计数"""
+        counted = []
+        try:
+            for scope, window, limit in limits:
+                index, fraction = window.position(now)
+                key = self._shared_key(policy, window, client, index)
+                # 计数保留到下一个窗口结束，供滑动窗口估算使用
+                cur = self.backend.incr(key, 1, window.seconds * 2)
+                if cur is None:
+                    return False
+                counted.append(key)
+                prev = 0
+                if window.sliding:
+                    prev = int(self.backend.get(self._shared_key(policy, window, client, index - 1)) or 0)
+                if window.estimate(prev, cur, fraction) > limit:
+                    raise RateLimitExceeded(policy.name, scope, limit,
+                                            window.retry_after(prev, cur - 1, fraction, limit))
+        except RateLimitExceeded:
+            for key in counted:
+                self.backend.incr(key, -1, 60)
+            raise
+        except (ValueError, sqlite3.Error, OSError):
+            # 计数值损坏或后端访问失败时按后端不可用处理
+            for key in counted:
+                try:
+                    self.backend.incr(key, -1, 60)
+                except (ValueError, sqlite3.Error, OSError):
+                    pass
+            return False
+        return True
+
+    def _count(self, policy_name: str, name: str):
+        with self._lock:
+            self._stats[policy_name][name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            policies = {}
+            for name, policy in self.policies.items():
+                stats = dict(self._stats[name])
+                for scope, window, limit in policy.limits:
+                    stats[f'{window.name}_limit'] = limit
+                    stats[f'{window.name}_clients'] = len(self._counters[(name, window.name)])
+                policies[name] = stats
+        return {
+            'enabled': self.enabled,
+            'store': self.backend.name if self.backend is not None else 'local',
+            'policies': policies
+        }
+
+
+def create_default_limiter() -> RateLimiter:
+    """创建包含 parse、ai、batch、clip、media 五个策略的限流器（规则由各应用添加）"""
+    limiter = RateLimiter(get_cache_backend() if RATE_LIMIT_SHARED else None)
+    limiter.add_policy(RateLimitPolicy('parse', PARSE_PER_MINUTE, PARSE_PER_DAY))
+    limiter.add_policy(RateLimitPolicy('ai', AI_PER_MINUTE, AI_PER_DAY))
+    limiter.add_policy(RateLimitPolicy('batch', BATCH_PER_MINUTE, BATCH_PER_DAY))
+    limiter.add_policy(RateLimitPolicy('clip', CLIP_PER_MINUTE, CLIP_PER_DAY))
+    limiter.add_policy(RateLimitPolicy('media', MEDIA_PER_MINUTE, MEDIA_PER_DAY))
+    return limiter
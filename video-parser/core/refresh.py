@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+热点解析结果预刷新模块
+
+各平台的下载链接带有签名过期时间（B站 deadline、抖音 x-expires 等），
+解析结果缓存随之过期。刷新器按规范键统计访问频率（指数衰减），
+在热点条目过期前的一小段时间内后台重新解析并写回缓存，
+使热门视频始终命中缓存；每个平台每分钟的刷新次数有上限。
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+from urllib.parse import urlparse, parse_qsl
+
+from .canonical import CanonicalVideo
+
+# 是否启用预刷新
+REFRESH_ENABLED = os.environ.get('PARSE_REFRESH_ENABLED', '1') == '1'
+
+# 在条目过期前多少秒开始刷新
+REFRESH_LEAD = 60.0
+
+# 扫描待刷新条目的间隔（秒）
+REFRESH_INTERVAL = 5.0
+
+# 访问频率的半衰期（秒）与热点阈值（衰减后的访问次数）
+HIT_HALF_LIFE = 600.0
+HOT_THRESHOLD = 3.0
+
+# 跟踪的条目数上限，超出时淘汰访问频率最低的条目
+REFRESH_MAX_TRACKED = 10000
+
+# 每个平台每分钟最多刷新的次数
+REFRESH_BUDGET_PER_MINUTE = {
+    'bilibili': 30,
+    'douyin': 30,
+    'youtube': 10,
+}
+REFRESH_DEFAULT_BUDGET = 10
+
+# 后台刷新的并发数
+REFRESH_WORKERS = 2
+
+# 下载链接中表示签名过期时间（Unix 时间戳）的查询参数
+DEADLINE_PARAMS = ('deadline', 'x-expires', 'expires', 'expire', 'Expires')
+
+
+def url_deadline(url: str) -> Optional[float]:
+    """从签名链接中读取过期时间，没有时返回 None"""
+    query = dict(parse_qsl(urlparse(url).query))
+    for name in DEADLINE_PARAMS:
+        value = query.get(name)
+        if value and value.isdigit():
+            deadline = float(value)
+            # 毫秒时间戳
+            return deadline / 1000 if deadline > 1e12 else deadline
+    return None
+
+
+def streams_deadline(urls: List[str]) -> Optional[float]:
+    """一组下载链接中最早的过期时间"""
+    deadlines = [deadline for deadline in map(url_deadline, urls) if deadline is not None]
+    return min(deadlines) if deadlines else None
+
+
+class _TrackedEntry:
+    """一个规范键的访问频率和缓存过期时间"""
+
+    __slots__ = ('video', 'score', 'updated_at', 'expires_at', 'refreshing')
+
+    def __init__(self, video: CanonicalVideo, now: float):
+        self.video = video
+        self.score = 0.0
+        self.updated_at = now
+        self.expires_at: Optional[float] = None
+        self.refreshing = False
+
+    def decayed_score(self, now: float) -> float:
+        return self.score * 0.5 ** ((now - self.updated_at) / HIT_HALF_LIFE)
+
+
+class HotEntryRefresher:
+    """后台刷新即将过期的热点解析结果
+
+    refresh_fn(video) 重新解析并写入缓存，返回新的过期时间（失败时抛出异常或返回 None）。
+    """
+
+    def __init__(self, refresh_fn: Callable[[CanonicalVideo], Optional[float]],
+                 enabled: bool = REFRESH_ENABLED):
+        self.refresh_fn = refresh_fn
+        self.enabled = enabled
+        self._entries: Dict[str, _TrackedEntry] = {}
+        self._recent: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._stats = {'refreshed': 0, 'failed': 0, 'skipped_budget': 0}
+
+    def record_hit(self, video: CanonicalVideo, expires_at: Optional[float]):
+        """登记一次访问（命中或未命中）及当前缓存条目的过期时间"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(video.key)
+            if entry is None:
+                if len(self._entries) >= REFRESH_MAX_TRACKED:
+                    self._evict(now)
+                entry = _TrackedEntry(video, now)
+                self._entries[video.key] = entry
+            entry.score = entry.decayed_score(now) + 1.0
+            entry.updated_at = now
+            if expires_at is not None:
+                entry.expires_at = expires_at
+        self._ensure_started()
+
+    def update_expiry(self, key: str, expires_at: Optional[float]):
+        """缓存条目被重新写入后更新其过期时间"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires_at = expires_at
+
+    def _evict(self, now: float):
+        """淘汰访问频率最低的十分之一条目（需持有锁）"""
+        ranked = sorted(self._entries.items(), key=lambda item: item[1].decayed_score(now))
+        for key, entry in ranked[:max(1, len(ranked) // 10)]:
+            if not entry.refreshing:
+                del self._entries[key]
+
+    def _ensure_started(self):
+        # 后台线程不能跨 fork 继承，进程变化时重新启动
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop_event.clear()
+            self._executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS,
+                                                thread_name_prefix='parse-refresh')
+            self._thread = threading.Thread(target=self._run, name='parse-refresher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(REFRESH_INTERVAL):
+            try:
+                self.refresh_due()
+            except Exception as e:
+                print(f"预刷新解析结果失败: {str(e)}")
+
+    def _take_budget(self, platform: str, now: float) -> bool:
+        """按平台检查并占用一分钟内的刷新额度（需持有锁）"""
+        recent = self._recent.setdefault(platform, deque())
+        while recent and recent[0] <= now - 60:
+            recent.popleft()
+        if len(recent) >= REFRESH_BUDGET_PER_MINUTE.get(platform, REFRESH_DEFAULT_BUDGET):
+            return False
+        recent.append(now)
+        return True
+
+    def refresh_due(self) -> int:
+        """提交即将过期的热点条目的刷新任务，返回提交数"""
+        now = time.time()
+        submitted = []
+        with self._lock:
+            candidates = []
+            for key, entry in list(self._entries.items()):
+                score = entry.decayed_score(now)
+                if entry.refreshing:
+                    continue
+                if entry.expires_at is not None and entry.expires_at < now and score < HOT_THRESHOLD:
+                    # 已过期且不再热门，停止跟踪
+                    del self._entries[key]
+                    continue
+                if score >= HOT_THRESHOLD and entry.expires_at is not None \
+                        and entry.expires_at - now <= REFRESH_LEAD:
+                    candidates.append((score, entry))
+
+            # 越热门越优先占用额度
+            candidates.sort(key=lambda item: -item[0])
+            for _, entry in candidates:
+                if not self._take_budget(entry.video.platform, now):
+                    self._stats['skipped_budget'] += 1
+                    continue
+                entry.refreshing = True
+                submitted.append(entry)
+
+        for entry in submitted:
+            self._executor.submit(self._refresh, entry)
+        return len(submitted)
+
+    def _refresh(self, entry: _TrackedEntry):
+        try:
+            expires_at = self.refresh_fn(entry.video)
+        except Exception as e:
+            print(f"刷新解析结果失败 {entry.video.key}: {str(e)}")
+            expires_at = None
+        with self._lock:
+            entry.refreshing = False
+            if expires_at is None:
+                self._stats['failed'] += 1
+                # 失败后不再按原过期时间反复重试，等待下一次访问重新登记
+                entry.expires_at = None
+            else:
+                self._stats['refreshed'] += 1
+                entry.expires_at = expires_at
+
+    def stop(self):
+        """停止后台刷新"""
+        self._stop_event.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tracked'] = len(self._entries)
+            stats['hot'] = sum(
+                1 for entry in self._entries.values() if entry.decayed_score(now) >= HOT_THRESHOLD
+            )
+        stats['enabled'] = self.enabled
+        return stats
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+端到端压测工具
+
+用法（在 video-parser 目录下执行）：
+    python -m loadtest.run --target fastapi --workers 1,2,4 --rps 20,50,100
+    python -m loadtest.run --target flask --workers 1 --rps 10,20
+"""
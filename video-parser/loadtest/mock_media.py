@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+模拟 DASH 媒体文件
+
+生成结构与B站 DASH 流一致的分片 MP4：ftyp + moov（初始化段）+ sidx（分段索引）
++ 若干 moof/mdat 分段。样本内容是填充字节（无法解码播放），码率按 SIZE_SCALE
+缩小，只用于验证清单生成、分段索引和按字节范围读取。
+"""
+
+import struct
+from functools import lru_cache
+from typing import List, Tuple
+
+# 媒体数据量缩小的倍数
+SIZE_SCALE = 100
+
+# 视频：25 fps，每个分段 5 秒；音频：AAC 每帧 1024 个采样，每个分段 240 帧（5.12 秒）
+VIDEO_TIMESCALE = 12800
+VIDEO_SAMPLE_DURATION = 512
+VIDEO_SAMPLES_PER_SEGMENT = 125
+AUDIO_TIMESCALE = 48000
+AUDIO_SAMPLE_DURATION = 1024
+AUDIO_SAMPLES_PER_SEGMENT = 240
+
+
+def _box(box_type: str, *payloads: bytes) -> bytes:
+    payload = b''.join(payloads)
+    return struct.pack('>I4s', 8 + len(payload), box_type.encode('ascii')) + payload
+
+
+def _full_box(box_type: str, version: int, flags: int, *payloads: bytes) -> bytes:
+    return _box(box_type, struct.pack('>I', (version << 24) | flags), *payloads)
+
+
+_MATRIX = struct.pack('>9I', 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+
+def _sample_entry(kind: str, codecs: str, width: int, height: int) -> bytes:
+    if kind == 'video':
+        return _box(
+            'avc1',
+            b'\x00' * 6, struct.pack('>H', 1), b'\x00' * 16,
+            struct.pack('>HHIIIH', width, height, 0x00480000, 0x00480000, 0, 1),
+            b'\x00' * 32, struct.pack('>Hh', 0x0018, -1),
+            _box('avcC', bytes([1, 0x64, 0x00, 0x32, 0xFF, 0xE0, 0x00])),
+        )
+    return _box(
+        'mp4a',
+        b'\x00' * 6, struct.pack('>H', 1), b'\x00' * 8,
+        struct.pack('>HHI', 2, 16, 0), struct.pack('>I', AUDIO_TIMESCALE << 16),
+        _full_box('esds', 0, 0, codecs.encode('ascii')),
+    )
+
+
+def _init_segment(kind: str, codecs: str, timescale: int, width: int, height: int) -> bytes:
+    handler = b'vide' if kind == 'video' else b'soun'
+    media_header = _full_box('vmhd', 0, 1, b'\x00' * 8) if kind == 'video' else _full_box('smhd', 0, 0, b'\x00' * 4)
+    stbl = _box(
+        'stbl',
+        _full_box('stsd', 0, 0, struct.pack('>I', 1), _sample_entry(kind, codecs, width, height)),
+        _full_box('stts', 0, 0, struct.pack('>I', 0)),
+        _full_box('stsc', 0, 0, struct.pack('>I', 0)),
+        _full_box('stsz', 0, 0, struct.pack('>II', 0, 0)),
+        _full_box('stco', 0, 0, struct.pack('>I', 0)),
+    )
+    trak = _box(
+        'trak',
+        _full_box('tkhd', 0, 3, struct.pack('>IIIII', 0, 0, 1, 0, 0), b'\x00' * 8,
+                  struct.pack('>hhhH', 0, 0, 0x0100 if kind == 'audio' else 0, 0), _MATRIX,
+                  struct.pack('>II', width << 16, height << 16)),
+        _box(
+            'mdia',
+            _full_box('mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, timescale, 0, 0x55C4, 0)),
+            _full_box('hdlr', 0, 0, struct.pack('>I', 0), handler, b'\x00' * 12, b'mock\x00'),
+            _box('minf', media_header,
+                 _box('dinf', _full_box('dref', 0, 0, struct.pack('>I', 1), _full_box('url ', 0, 1))),
+                 stbl),
+        ),
+    )
+    moov = _box(
+        'moov',
+        _full_box('mvhd', 0, 0, struct.pack('>IIIIIH', 0, 0, 1000, 0, 0x00010000, 0x0100),
+                  b'\x00' * 10, _MATRIX, b'\x00' * 24, struct.pack('>I', 2)),
+        trak,
+        _box('mvex', _full_box('trex', 0, 0, struct.pack('>IIIII', 1, 1, 0, 0, 0))),
+    )
+    return _box('ftyp', b'iso5', struct.pack('>I', 1), b'iso6mp41dash') + moov
+
+
+def _media_segment(sequence: int, base_time: int, sample_duration: int,
+                   sample_sizes: List[int], fill: int) -> bytes:
+    entries = b''.join(struct.pack('>II', sample_duration, size) for size in sample_sizes)
+    # trun 中的 data_offset 从 moof 起始位置算起，指向 mdat 的内容
+    def moof(data_offset: int) -> bytes:
+        return _box(
+            'moof',
+            _full_box('mfhd', 0, 0, struct.pack('>I', sequence)),
+            _box(
+                'traf',
+                _full_box('tfhd', 0, 0x020000, struct.pack('>I', 1)),
+                _full_box('tfdt', 1, 0, struct.pack('>Q', base_time)),
+                _full_box('trun', 0, 0x000301, struct.pack('>Ii', len(sample_sizes), data_offset), entries),
+            ),
+        )
+    header = moof(0)
+    return moof(len(header) + 8) + _box('mdat', bytes([fill]) * sum(sample_sizes))
+
+
+@lru_cache(maxsize=64)
+def build_dash_file(kind: str, codecs: str, bandwidth: int, duration: float,
+                    width: int = 0, height: int = 0) -> Tuple[bytes, str, str]:
+    """生成一个 DASH 表示的完整文件，返回 (文件内容, Initialization 范围, indexRange 范围)"""
+    if kind == 'video':
+        timescale, sample_duration, per_segment = VIDEO_TIMESCALE, VIDEO_SAMPLE_DURATION, VIDEO_SAMPLES_PER_SEGMENT
+    else:
+        timescale, sample_duration, per_segment = AUDIO_TIMESCALE, AUDIO_SAMPLE_DURATION, AUDIO_SAMPLES_PER_SEGMENT
+
+    total_samples = int(duration * timescale / sample_duration)
+    sample_size = max(1, int(bandwidth / 8 * sample_duration / timescale / SIZE_SCALE))
+    segments = []
+    sample = 0
+    while sample < total_samples:
+        count = min(per_segment, total_samples - sample)
+        segments.append((sample * sample_duration, count * sample_duration,
+                         _media_segment(len(segments) + 1, sample * sample_duration, sample_duration,
+                                        [sample_size] * count, len(segments) % 256)))
+        sample += count
+
+    init = _init_segment(kind, codecs, timescale, width, height)
+    references = b''.join(
+        struct.pack('>III', len(data) & 0x7FFFFFFF, segment_duration, 0x90000000)
+        for _, segment_duration, data in segments
+    )
+    sidx = _full_box('sidx', 0, 0, struct.pack('>IIIIHH', 1, timescale, 0, 0, 0, len(segments)), references)
+    content = init + sidx + b''.join(data for _, _, data in segments)
+    return content, f'0-{len(init) - 1}', f'{len(init)}-{len(init) + len(sidx) - 1}'
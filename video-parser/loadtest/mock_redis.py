@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+模拟 Redis 服务
+
+实现 RESP2 协议下缓存后端用到的命令子集（PING、AUTH、SELECT、GET、SET、DEL、
+UNLINK、EXISTS、PTTL、SCAN、FLUSHDB），用于在没有 Redis 的环境中
+验证 redis:// 缓存后端以及多 worker 共享缓存。
+"""
+
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class MockRedisStore:
+    """键值存储，按数据库编号分区，惰性删除过期键"""
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self._dbs: Dict[int, Dict[bytes, Tuple[bytes, Optional[float]]]] = {}
+        self._lock = threading.Lock()
+
+    def db(self, index: int) -> Dict[bytes, Tuple[bytes, Optional[float]]]:
+        return self._dbs.setdefault(index, {})
+
+    def lookup(self, db: Dict, key: bytes) -> Optional[Tuple[bytes, Optional[float]]]:
+        """读取未过期的条目（需持有锁）"""
+        entry = db.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del db[key]
+            return None
+        return entry
+
+
+class MockRedisHandler(socketserver.StreamRequestHandler):
+    """单个客户端连接"""
+
+    store: MockRedisStore = None
+
+    def setup(self):
+        super().setup()
+        self.db_index = 0
+        self.authenticated = self.store.password is None
+
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # 内联命令（如 telnet 中输入的 PING）
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:].strip())):
+            length = int(self.rfile.readline()[1:].strip())
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, Exception):
+            return b'-ERR ' + str(value).encode('utf-8') + b'\r\n'
+        if isinstance(value, str):
+            return b'+' + value.encode('utf-8') + b'\r\n'
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, bytes):
+            return b'$%d\r\n%s\r\n' % (len(value), value)
+        return b'*%d\r\n' % len(value) + b''.join(MockRedisHandler._encode(item) for item in value)
+
+    def handle(self):
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            if not args:
+                continue
+            try:
+                reply = self._dispatch(args[0].upper().decode('ascii'), args[1:])
+            except Exception as e:
+                reply = e
+            try:
+                self.wfile.write(self._encode(reply))
+            except OSError:
+                return
+
+    def _dispatch(self, command: str, args: List[bytes]):
+        if command == 'AUTH':
+            if args and args[-1].decode('utf-8') == self.store.password:
+                self.authenticated = True
+                return 'OK'
+            raise Exception('invalid password')
+        if not self.authenticated:
+            raise Exception('NOAUTH Authentication required.')
+        if command == 'PING':
+            return 'PONG'
+        if command == 'SELECT':
+            self.db_index = int(args[0])
+            return 'OK'
+
+        store = self.store
+        with store._lock:
+            db = store.db(self.db_index)
+            if command == 'GET':
+                entry = store.lookup(db, args[0])
+                return entry[0] if entry else None
+            if command == 'SET':
+                return self._set(db, args)
+            if command == 'INCRBY':
+                entry = store.lookup(db, args[0])
+                value = int(entry[0] if entry else 0) + int(args[1])
+                db[args[0]] = (str(value).encode('ascii'), entry[1] if entry else None)
+                return value
+            if command in ('DEL', 'UNLINK'):
+                return sum(1 for key in args if store.lookup(db, key) and db.pop(key, None))
+            if command == 'EXISTS':
+                return sum(1 for key in args if store.lookup(db, key))
+            if command == 'PTTL':
+                entry = store.lookup(db, args[0])
+                if entry is None:
+                    return -2
+                return -1 if entry[1] is None else int((entry[1] - time.monotonic()) * 1000)
+            if command == 'SCAN':
+                return self._scan(db, args)
+            if command == 'FLUSHDB':
+                db.clear()
+                return 'OK'
+        raise Exception(f"unknown command '{command}'")
+
+    def _set(self, db: Dict, args: List[bytes]):
+        key, value = args[0], args[1]
+        expires_at = None
+        only_new = False
+        options = [arg.upper() for arg in args[2:]]
+        i = 0
+        while i < len(options):
+            if options[i] in (b'EX', b'PX'):
+                amount = int(args[2 + i + 1])
+                expires_at = time.monotonic() + (amount if options[i] == b'EX' else amount / 1000)
+                i += 2
+                continue
+            if options[i] == b'NX':
+                only_new = True
+            i += 1
+        if only_new and self.store.lookup(db, key) is not None:
+            return None
+        db[key] = (value, expires_at)
+        return 'OK'
+
+    def _scan(self, db: Dict, args: List[bytes]):
+        # 游标即排序后键列表中的位置
+        cursor = int(args[0])
+        pattern, count = b'*', 10
+        for i in range(1, len(args) - 1, 2):
+            option = args[i].upper()
+            if option == b'MATCH':
+                pattern = args[i + 1]
+            elif option == b'COUNT':
+                count = int(args[i + 1])
+        keys = sorted(db)
+        batch = keys[cursor:cursor + count]
+        next_cursor = cursor + count if cursor + count < len(keys) else 0
+        matched = [
+            key for key in batch
+            if self.store.lookup(db, key) is not None
+            and fnmatch.fnmatchcase(key.decode('utf-8', 'replace'), pattern.decode('utf-8', 'replace'))
+        ]
+        return [str(next_cursor).encode('ascii'), matched]
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_mock_redis(host: str = '127.0.0.1', port: int = 0,
+                     password: Optional[str] = None) -> socketserver.ThreadingTCPServer:
+    """在后台线程启动模拟 Redis，返回服务器实例（端口见 server.server_address）"""
+    handler = type('ConfiguredMockRedisHandler', (MockRedisHandler,), {
+        'store': MockRedisStore(password)
+    })
+    server = _ThreadingServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟 Redis 服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--password', default=None)
+    args = parser.parse_args()
+
+    server = start_mock_redis(args.host, args.port, args.password)
+    print(f"模拟 Redis 已启动: redis://{args.host}:{server.server_address[1]}/0")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+模拟上游服务
+
+以 http://127.0.0.1:<port>/<原始域名>/<原始路径> 的形式模拟哔哩哔哩、抖音、
+YouTube 以及 DeepSeek 接口，返回结构与真实接口一致的固定数据，
+并按配置注入延迟与错误率。
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from .mock_media import build_dash_file
+
+
+class MockConfig:
+    """模拟上游配置"""
+
+    def __init__(self, latency_ms: float = 80.0, jitter_ms: float = 40.0,
+                 error_rate: float = 0.0, ai_latency_ms: float = 800.0, seed: int = 42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.ai_latency_ms = ai_latency_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, base_ms: float):
+        """按基础延迟加抖动休眠"""
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, base_ms + jitter) / 1000.0)
+
+    def should_fail(self) -> bool:
+        """按错误率决定本次是否返回错误"""
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+def _bilibili_view(query: Dict[str, list]) -> dict:
+    video_id = (query.get('bvid') or query.get('aid') or ['BV1xx411c7mD'])[0]
+    return {
+        'code': 0,
+        'message': '0',
+        'data': {
+            'bvid': video_id,
+            'title': f'模拟视频 {video_id}',
+            'pic': f'https://i0.hdslb.com/bfs/archive/{video_id}.jpg',
+            'duration': 180,
+            'cid': zlib.crc32(video_id.encode('utf-8')) % 10 ** 8,
+            'desc': '模拟上游返回的视频简介',
+        }
+    }
+
+
+# 模拟的 DASH 表示：(清晰度, 码率, 编码, 宽, 高)，以及音频表示 (ID, 码率, 编码)
+MOCK_DASH_VIDEOS = (
+    (80, 2_400_000, 'avc1.640032', 1920, 1080),
+    (64, 1_200_000, 'avc1.64001F', 1280, 720),
+    (32, 600_000, 'avc1.64001E', 852, 480),
+)
+MOCK_DASH_AUDIO = (30280, 192_000, 'mp4a.40.2')
+MOCK_VIDEO_DURATION = 180
+
+
+def _mock_media_file(name: str) -> Optional[bytes]:
+    """按文件名（<视频ID>-<表示ID>.m4s）生成模拟媒体文件"""
+    match = re.fullmatch(r'/[^/]+-(\d+)\.m4s', name)
+    if not match:
+        return None
+    qn = int(match.group(1))
+    for video_qn, bandwidth, codecs, width, height in MOCK_DASH_VIDEOS:
+        if qn == video_qn:
+            return build_dash_file('video', codecs, bandwidth, MOCK_VIDEO_DURATION, width, height)[0]
+    if qn == MOCK_DASH_AUDIO[0]:
+        return build_dash_file('audio', MOCK_DASH_AUDIO[2], MOCK_DASH_AUDIO[1], MOCK_VIDEO_DURATION)[0]
+    return None
+
+
+def _bilibili_playurl(query: Dict[str, list]) -> dict:
+    video_id = (query.get('bvid') or query.get('avid') or ['BV1xx411c7mD'])[0]
+    videos = []
+    for qn, bandwidth, codecs, width, height in MOCK_DASH_VIDEOS:
+        _, initialization, index_range = build_dash_file('video', codecs, bandwidth, MOCK_VIDEO_DURATION,
+                                                         width, height)
+        videos.append({
+            'id': qn,
+            'baseUrl': f'https://upos-sz-mirror.bilivideo.com/{video_id}-{qn}.m4s?deadline={int(time.time()) + 7200}',
+            'bandwidth': bandwidth,
+            'codecs': codecs,
+            'mimeType': 'video/mp4',
+            'width': width,
+            'height': height,
+            'frameRate': '25',
+            'SegmentBase': {'Initialization': initialization, 'indexRange': index_range},
+        })
+    audio_id, audio_bandwidth, audio_codecs = MOCK_DASH_AUDIO
+    _, audio_initialization, audio_index_range = build_dash_file('audio', audio_codecs, audio_bandwidth,
+                                                                 MOCK_VIDEO_DURATION)
+    return {
+        'code': 0,
+        'message': '0',
+        'data': {
+            'quality': 80,
+            'timelength': 180000,
+            'dash': {
+                'duration': MOCK_VIDEO_DURATION,
+                'video': videos,
+                'audio': [{
+                    'id': audio_id,
+                    'baseUrl': f'https://upos-sz-mirror.bilivideo.com/{video_id}-{audio_id}.m4s?deadline={int(time.time()) + 7200}',
+                    'bandwidth': audio_bandwidth,
+                    'codecs': audio_codecs,
+                    'mimeType': 'audio/mp4',
+                    'SegmentBase': {'Initialization': audio_initialization, 'indexRange': audio_index_range},
+                }],
+            },
+        }
+    }
+
+
+def _douyin_iteminfo(query: Dict[str, list]) -> dict:
+    item_id = (query.get('item_ids') or ['7000000000000000000'])[0]
+    return {
+        'status_code': 0,
+        'item_list': [{
+            'aweme_id': item_id,
+            'desc': f'模拟抖音作品 {item_id}',
+            'duration': 15000,
+            'status': {'is_delete': False},
+            'video': {
+                'cover': {'url_list': [f'https://p3.douyinpic.com/{item_id}.jpeg']},
+                'play_addr': {'url_list': [f'https://v26.douyinvod.com/{item_id}/play.mp4?x-expires={int(time.time()) + 3600}']},
+                'download_addr': {'url_list': [f'https://v26.douyinvod.com/{item_id}/download.mp4?x-expires={int(time.time()) + 3600}']},
+                'size': 3_145_728,
+            },
+        }],
+    }
+
+
+def _youtube_oembed(query: Dict[str, list]) -> dict:
+    target = (query.get('url') or [''])[0]
+    return {
+        'title': f'Mock YouTube video {target[-11:]}',
+        'author_name': 'Mock Channel',
+        'author_url': 'https://www.youtube.com/@mock',
+        'thumbnail_url': 'https://i.ytimg.com/vi/mock/hqdefault.jpg',
+    }
+
+
+def _deepseek_completion(body: dict) -> dict:
+    prompt = ''
+    for message in body.get('messages', []):
+        if message.get('role') == 'user':
+            prompt = message.get('content', '')
+    content = json.dumps({
+        'titles': ['模拟标题一', '模拟标题二', '模拟标题三'],
+        'description': '模拟描述',
+        'tags': ['模拟', '压测'],
+        'prompt_chars': len(prompt),
+    }, ensure_ascii=False)
+    return {
+        'id': 'chatcmpl-mock',
+        'model': body.get('model', 'deepseek-chat'),
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': len(prompt) // 2, 'completion_tokens': len(content) // 2,
+                  'total_tokens': (len(prompt) + len(content)) // 2},
+    }
+
+
+# 短链接到落地页的映射规则
+SHORT_LINK_TARGETS = {
+    'b23.tv': lambda code: f'https://www.bilibili.com/video/BV1{code.ljust(9, "x")[:9]}',
+    'v.douyin.com': lambda code: f'https://www.iesdouyin.com/share/video/{7000000000000000000 + zlib.crc32(code.encode("utf-8")) % 10 ** 9}/',
+}
+
+
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    """模拟上游请求处理器"""
+
+    config: MockConfig = MockConfig()
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _split(self) -> Tuple[str, str, Dict[str, list]]:
+        parsed = urlparse(self.path)
+        parts = parsed.path.lstrip('/').split('/', 1)
+        host = parts[0]
+        path = '/' + (parts[1] if len(parts) > 1 else '')
+        return host, path, parse_qs(parsed.query)
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_stream(self, completion: dict, chunk_chars: int = 8, interval_ms: float = 20.0):
+        """以SSE分片返回补全结果，模拟 stream=true"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        content = completion['choices'][0]['message']['content']
+        for i in range(0, len(content), chunk_chars):
+            chunk = {
+                'id': completion['id'],
+                'model': completion['model'],
+                'choices': [{'index': 0, 'delta': {'content': content[i:i + chunk_chars]}}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(interval_ms / 1000.0)
+
+        final = {'id': completion['id'], 'model': completion['model'], 'choices': [], 'usage': completion['usage']}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _send_media(self, content: bytes):
+        """返回媒体文件，支持单个 Range 请求"""
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range') or '')
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else len(content) - 1, len(content) - 1)
+            else:
+                start, end = max(0, len(content) - int(match.group(2))), len(content) - 1
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(content)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = content[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(content)}')
+        else:
+            body = content
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_redirect(self, location: str):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _route(self, body: Optional[dict] = None):
+        host, path, query = self._split()
+
+        if host == 'api.deepseek.com':
+            self.config.delay(self.config.ai_latency_ms)
+        else:
+            self.config.delay(self.config.latency_ms)
+
+        if self.config.should_fail():
+            self._send_json({'code': -500, 'message': 'mock upstream error'}, status=503)
+            return
+
+        if host in SHORT_LINK_TARGETS:
+            self._send_redirect(SHORT_LINK_TARGETS[host](path.strip('/')))
+        elif host == 'api.bilibili.com' and path.startswith('/x/web-interface/view'):
+            self._send_json(_bilibili_view(query))
+        elif host == 'api.bilibili.com' and path.startswith('/x/player/playurl'):
+            self._send_json(_bilibili_playurl(query))
+        elif host == 'www.iesdouyin.com' and path.startswith('/web/api/v2/aweme/iteminfo'):
+            self._send_json(_douyin_iteminfo(query))
+        elif host == 'www.youtube.com' and path.startswith('/oembed'):
+            self._send_json(_youtube_oembed(query))
+        elif host == 'api.deepseek.com' and path.startswith('/v1/chat/completions'):
+            if (body or {}).get('stream'):
+                self._send_stream(_deepseek_completion(body))
+            else:
+                self._send_json(_deepseek_completion(body or {}))
+        elif host.endswith('.bilivideo.com') and _mock_media_file(path) is not None:
+            self._send_media(_mock_media_file(path))
+        elif host in ('www.bilibili.com', 'www.iesdouyin.com', 'www.youtube.com'):
+            # 落地页，短链接重定向的终点
+            self._send_json({'ok': True})
+        else:
+            self._send_json({'code': -404, 'message': f'unknown mock route: {host}{path}'}, status=404)
+
+    def do_HEAD(self):
+        self._route()
+
+    def do_GET(self):
+        self._route()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw.decode('utf-8')) if raw else {}
+        except ValueError:
+            body = {}
+        self._route(body)
+
+
+def start_mock_upstream(host: str = '127.0.0.1', port: int = 0,
+                        config: Optional[MockConfig] = None) -> ThreadingHTTPServer:
+    """在后台线程启动模拟上游，返回服务器实例（端口见 server.server_address）"""
+    handler = type('ConfiguredMockUpstreamHandler', (MockUpstreamHandler,), {
+        'config': config or MockConfig()
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟上游服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency-ms', type=float, default=80.0)
+    parser.add_argument('--jitter-ms', type=float, default=40.0)
+    parser.add_argument('--ai-latency-ms', type=float, default=800.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.ai_latency_ms)
+    server = start_mock_upstream(args.host, args.port, config)
+    print(f"模拟上游已启动: http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+端到端压测驱动
+
+按目标 RPS 以开环方式向 FastAPI（spa-backend/main.py）或 Flask（api/app.py）服务
+发送混合请求（短链接、BV/av 号、抖音分享链接、YouTube 链接、批量请求），
+对每个 worker 数逐级提升 RPS，输出 p50/p95/p99 延迟、错误率与实际吞吐，
+即每个 worker 数下的饱和曲线。
+
+    python -m loadtest.run --target fastapi --workers 1,2,4 --rps 20,50,100 --duration 15
+    python -m loadtest.run --url http://127.0.0.1:8000 --rps 10,20   # 压测已运行的服务
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .mock_upstream import MockConfig, start_mock_upstream
+from .serve import MOCK_ENV, ROOT_DIR
+
+BV_ALPHABET = 'fZodR9XQDSUm21yCkr6zBqiveYah8bt4xsWpHnJE7jL5VG3guMTKNPAwcF'
+
+# 默认流量构成（权重）
+DEFAULT_MIX = {
+    'bilibili_short': 2,
+    'bilibili_bv': 4,
+    'bilibili_av': 1,
+    'douyin_share': 3,
+    'youtube': 2,
+    'batch': 1,
+    'ai': 0,
+}
+
+
+@dataclass
+class Sample:
+    """单次请求的结果"""
+    kind: str
+    latency: float
+    ok: bool
+    status: int
+
+
+@dataclass
+class StepResult:
+    """一个 (worker 数, 目标 RPS) 档位的统计结果"""
+    target: str
+    workers: int
+    target_rps: float
+    duration: float
+    sent: int = 0
+    completed: int = 0
+    errors: int = 0
+    dropped: int = 0
+    achieved_rps: float = 0.0
+    error_rate: float = 0.0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    max_ms: float = 0.0
+    by_kind: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法求百分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Workload:
+    """可复现的请求构造器，视频 ID 按热点分布抽取"""
+
+    def __init__(self, mix: Dict[str, int], seed: int = 2024, catalog_size: int = 500,
+                 hot_fraction: float = 0.1, hot_weight: float = 0.8, batch_size: int = 10):
+        self.kinds = [kind for kind, weight in mix.items() if weight > 0]
+        self.weights = [mix[kind] for kind in self.kinds]
+        if not self.kinds:
+            raise ValueError('流量构成为空')
+        self.random = random.Random(seed)
+        self.catalog_size = catalog_size
+        self.hot_size = max(1, int(catalog_size * hot_fraction))
+        self.hot_weight = hot_weight
+        self.batch_size = batch_size
+
+    def _index(self) -> int:
+        if self.random.random() < self.hot_weight:
+            return self.random.randrange(self.hot_size)
+        return self.random.randrange(self.catalog_size)
+
+    @staticmethod
+    def _bv(index: int) -> str:
+        chars = []
+        value = 100000 + index
+        for _ in range(9):
+            value, rem = divmod(value * 7 + 13, len(BV_ALPHABET))
+            chars.append(BV_ALPHABET[rem])
+        return 'BV1' + ''.join(chars)
+
+    def url(self, kind: str) -> str:
+        index = self._index()
+        if kind == 'bilibili_short':
+            return f'https://b23.tv/{self._bv(index)[3:10]}'
+        if kind == 'bilibili_bv':
+            suffix = self.random.choice(['', '?p=1', '?spm_id_from=333.788&vd_source=loadtest'])
+            return f'https://www.bilibili.com/video/{self._bv(index)}{suffix}'
+        if kind == 'bilibili_av':
+            return f'https://www.bilibili.com/video/av{170001 + index}'
+        if kind == 'douyin_share':
+            return f'https://v.douyin.com/{self._bv(index)[3:11]}/'
+        if kind == 'youtube':
+            video_id = f'{self._bv(index)[3:]}yt'[:11]
+            return self.random.choice([
+                f'https://www.youtube.com/watch?v={video_id}',
+                f'https://youtu.be/{video_id}',
+                f'https://www.youtube.com/shorts/{video_id}',
+            ])
+        raise ValueError(f'未知的请求类型: {kind}')
+
+    def next(self) -> Tuple[str, List[str]]:
+        """返回 (请求类型, 待解析的 URL 列表)"""
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind == 'batch':
+            single_kinds = [k for k in DEFAULT_MIX if k not in ('batch', 'ai')]
+            return kind, [self.url(self.random.choice(single_kinds)) for _ in range(self.batch_size)]
+        if kind == 'ai':
+            return kind, []
+        return kind, [self.url(kind)]
+
+
+async def _parse_one(client: httpx.AsyncClient, base_url: str, url: str) -> Tuple[bool, int]:
+    response = await client.post(f'{base_url}/api/parse', json={'url': url})
+    ok = response.status_code == 200 and bool(response.json().get('success'))
+    return ok, response.status_code
+
+
+async def _ai_one(client: httpx.AsyncClient, base_url: str) -> Tuple[bool, int]:
+    response = await client.post(
+        f'{base_url}/api/ai/generate-content',
+        params={'content_type': 'full'},
+        json={'title': '压测视频', 'description': '压测描述', 'platform': 'bilibili'},
+    )
+    return response.status_code == 200, response.status_code
+
+
+async def _issue(client: httpx.AsyncClient, base_url: str, kind: str, urls: List[str]) -> Sample:
+    start = time.perf_counter()
+    try:
+        if kind == 'ai':
+            ok, status = await _ai_one(client, base_url)
+        elif kind == 'batch':
+            # 批量请求：一个客户端同时提交一组解析，以整组完成时间计延迟
+            results = await asyncio.gather(*(_parse_one(client, base_url, url) for url in urls))
+            ok = all(item[0] for item in results)
+            status = max(item[1] for item in results)
+        else:
+            ok, status = await _parse_one(client, base_url, urls[0])
+    except Exception:
+        ok, status = False, 0
+    return Sample(kind=kind, latency=time.perf_counter() - start, ok=ok, status=status)
+
+
+async def run_step(base_url: str, workload: Workload, rps: float, duration: float,
+                   max_in_flight: int, timeout: float) -> Tuple[List[Sample], int, int, float]:
+    """开环发压：按固定间隔发出请求，不等待前一个请求完成"""
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    samples: List[Sample] = []
+    tasks = []
+    dropped = 0
+    in_flight = 0
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def tracked(kind: str, urls: List[str]):
+            nonlocal in_flight
+            try:
+                samples.append(await _issue(client, base_url, kind, urls))
+            finally:
+                in_flight -= 1
+
+        total = int(rps * duration)
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind, urls = workload.next()
+            if in_flight >= max_in_flight:
+                # 客户端侧并发已满，记为丢弃，避免压测端自身成为瓶颈
+                dropped += 1
+                continue
+            in_flight += 1
+            tasks.append(asyncio.ensure_future(tracked(kind, urls)))
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return samples, total, dropped, elapsed
+
+
+def summarize(target: str, workers: int, rps: float, duration: float, samples: List[Sample],
+              sent: int, dropped: int, elapsed: float) -> StepResult:
+    result = StepResult(target=target, workers=workers, target_rps=rps, duration=duration,
+                        sent=sent, dropped=dropped)
+    result.completed = sum(1 for s in samples if s.ok)
+    result.errors = len(samples) - result.completed
+    result.achieved_rps = result.completed / elapsed if elapsed > 0 else 0.0
+    result.error_rate = (result.errors + dropped) / sent if sent else 0.0
+
+    latencies = sorted(s.latency * 1000 for s in samples)
+    result.p50_ms = percentile(latencies, 50)
+    result.p95_ms = percentile(latencies, 95)
+    result.p99_ms = percentile(latencies, 99)
+    result.max_ms = latencies[-1] if latencies else 0.0
+
+    for kind in sorted({s.kind for s in samples}):
+        kind_samples = [s for s in samples if s.kind == kind]
+        kind_latencies = sorted(s.latency * 1000 for s in kind_samples)
+        result.by_kind[kind] = {
+            'count': len(kind_samples),
+            'error_rate': sum(1 for s in kind_samples if not s.ok) / len(kind_samples),
+            'p50_ms': percentile(kind_latencies, 50),
+            'p99_ms': percentile(kind_latencies, 99),
+        }
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_healthy(base_url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f'{base_url}/health', timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'服务未在 {timeout} 秒内就绪: {base_url}')
+
+
+def launch_service(target: str, workers: int, mock_base: str) -> Tuple[subprocess.Popen, str]:
+    """以子进程启动被测服务"""
+    port = _free_port()
+    env = dict(os.environ)
+    env[MOCK_ENV] = mock_base
+    # 压测流量全部来自本机同一地址，不做客户端限流
+    env.setdefault('RATE_LIMIT_ENABLED', '0')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT_DIR, env.get('PYTHONPATH')]))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'loadtest.serve', target, '--port', str(port), '--workers', str(workers)],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        _wait_healthy(base_url)
+    except Exception:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+def _parse_list(value: str, cast: Callable) -> List:
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def _parse_mix(value: Optional[str]) -> Dict[str, int]:
+    mix = dict(DEFAULT_MIX)
+    if value:
+        for item in value.split(','):
+            kind, _, weight = item.partition('=')
+            if kind not in mix:
+                raise ValueError(f'未知的请求类型: {kind}')
+            mix[kind] = int(weight)
+    return mix
+
+
+def print_table(results: List[StepResult]):
+    header = f"{'target':<8}{'workers':>8}{'rps':>8}{'achieved':>10}{'err%':>8}{'p50':>10}{'p95':>10}{'p99':>10}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r.target:<8}{r.workers:>8}{r.target_rps:>8.0f}{r.achieved_rps:>10.1f}"
+              f"{r.error_rate * 100:>8.2f}{r.p50_ms:>10.1f}{r.p95_ms:>10.1f}{r.p99_ms:>10.1f}")
+
+
+async def _run_steps(target: str, workers: int, base_url: str, args, mix: Dict[str, int]) -> List[StepResult]:
+    results = []
+    for rps in _parse_list(args.rps, float):
+        # 每档使用相同种子，保证不同 worker 数下的请求序列一致
+        workload = Workload(mix, seed=args.seed, catalog_size=args.catalog_size)
+        samples, sent, dropped, elapsed = await run_step(
+            base_url, workload, rps, args.duration, args.max_in_flight, args.timeout
+        )
+        result = summarize(target, workers, rps, args.duration, samples, sent, dropped, elapsed)
+        results.append(result)
+        print_table([result])
+        if args.stop_on_saturation and result.error_rate > args.stop_on_saturation:
+            break
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='视频解析服务端到端压测')
+    parser.add_argument('--target', choices=['fastapi', 'flask'], default='fastapi')
+    parser.add_argument('--url', help='压测已运行的服务，不自动启动（此时 --workers 仅用于标注结果）')
+    parser.add_argument('--workers', default='1', help='逗号分隔的 worker 数列表')
+    parser.add_argument('--rps', default='10,20,50', help='逗号分隔的目标 RPS 列表')
+    parser.add_argument('--duration', type=float, default=10.0, help='每档持续秒数')
+    parser.add_argument('--mix', help='流量构成，如 bilibili_bv=4,douyin_share=3,batch=1')
+    parser.add_argument('--catalog-size', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--max-in-flight', type=int, default=512)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--stop-on-saturation', type=float, default=0.5,
+                        help='错误率超过该值时停止提升 RPS（0 表示不停止）')
+    parser.add_argument('--mock-latency-ms', type=float, default=80.0)
+    parser.add_argument('--mock-error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='结果 JSON 输出路径')
+    args = parser.parse_args()
+
+    mix = _parse_mix(args.mix)
+    results: List[StepResult] = []
+
+    if args.url:
+        for workers in _parse_list(args.workers, int):
+            results.extend(asyncio.run(_run_steps(args.target, workers, args.url.rstrip('/'), args, mix)))
+    else:
+        mock = start_mock_upstream(config=MockConfig(
+            latency_ms=args.mock_latency_ms, error_rate=args.mock_error_rate
+        ))
+        mock_base = f'http://127.0.0.1:{mock.server_address[1]}'
+        try:
+            for workers in _parse_list(args.workers, int):
+                process, base_url = launch_service(args.target, workers, mock_base)
+                try:
+                    results.extend(asyncio.run(_run_steps(args.target, workers, base_url, args, mix)))
+                finally:
+                    process.terminate()
+                    process.wait(timeout=15)
+        finally:
+            mock.shutdown()
+
+    print()
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump([asdict(r) for r in results], f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+压测用服务启动器
+
+在被测进程内把所有上游请求改写到模拟上游（环境变量 LOADTEST_MOCK_UPSTREAM），
+然后按指定的 worker 数启动 FastAPI 或 Flask 服务。FastAPI 服务在临时目录中运行，
+密钥、历史记录等数据写入临时目录，不影响 spa-backend/data 中的正式数据。
+
+    python -m loadtest.serve fastapi --workers 4 --port 18000
+    python -m loadtest.serve flask --workers 2 --port 15000
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+from urllib.parse import urlsplit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SPA_BACKEND_DIR = os.path.join(ROOT_DIR, 'spa-backend')
+FLASK_APP_PATH = os.path.join(ROOT_DIR, 'api', 'app.py')
+
+MOCK_ENV = 'LOADTEST_MOCK_UPSTREAM'
+
+# 需要改写到模拟上游的域名
+UPSTREAM_HOSTS = {
+    'b23.tv',
+    'www.bilibili.com',
+    'api.bilibili.com',
+    'upos-sz-mirror.bilivideo.com',
+    'v.douyin.com',
+    'www.douyin.com',
+    'www.iesdouyin.com',
+    'www.youtube.com',
+    'youtube.com',
+    'api.deepseek.com',
+}
+
+
+def rewrite_url(url: str, mock_base: str) -> str:
+    """https://api.bilibili.com/x/... -> <mock_base>/api.bilibili.com/x/..."""
+    parts = urlsplit(url)
+    if parts.hostname not in UPSTREAM_HOSTS:
+        return url
+    rewritten = f"{mock_base.rstrip('/')}/{parts.hostname}{parts.path or '/'}"
+    if parts.query:
+        rewritten += f"?{parts.query}"
+    return rewritten
+
+
+def install_upstream_redirect(mock_base: str):
+    """让 requests 的所有上游请求（包括重定向跳转）都发往模拟上游"""
+    import requests
+
+    original_send = requests.adapters.HTTPAdapter.send
+
+    def send(self, request, *args, **kwargs):
+        request.url = rewrite_url(request.url, mock_base)
+        return original_send(self, request, *args, **kwargs)
+
+    requests.adapters.HTTPAdapter.send = send
+
+
+def _prepare_process():
+    """每个 worker 进程导入应用前的准备工作"""
+    mock_base = os.environ.get(MOCK_ENV)
+    if mock_base:
+        install_upstream_redirect(mock_base)
+    for path in (SPA_BACKEND_DIR, ROOT_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return mock_base
+
+
+def create_fastapi_app():
+    """uvicorn 工厂函数，在每个 worker 进程中调用"""
+    mock_base = _prepare_process()
+
+    # main.py 以相对路径挂载 static 目录；数据目录同样放在工作目录（main() 中为临时目录）下，
+    # 压测添加的密钥不会写入 spa-backend/data
+    os.makedirs('static', exist_ok=True)
+    os.environ['DATA_DIR'] = os.path.abspath('data')
+
+    import main
+    from api.ai_service import ai_service
+    from api.keys import key_manager
+
+    if mock_base:
+        ai_service.base_url = rewrite_url(ai_service.base_url, mock_base)
+        if not key_manager.has_key('default'):
+            try:
+                key_manager.add_key('default', 'loadtest-key', '压测用密钥')
+            except Exception:
+                # 其他 worker 已经添加
+                pass
+
+    return main.app
+
+
+def create_flask_app():
+    """加载 api/app.py 中的 Flask 应用"""
+    _prepare_process()
+    spec = importlib.util.spec_from_file_location('flask_api_app', FLASK_APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='压测用服务启动器')
+    parser.add_argument('target', choices=['fastapi', 'flask'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18000)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.target == 'fastapi':
+        import uvicorn
+
+        os.chdir(tempfile.mkdtemp(prefix='loadtest-'))
+        uvicorn.run(
+            'loadtest.serve:create_fastapi_app',
+            factory=True,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level='warning',
+            app_dir=ROOT_DIR,
+        )
+    else:
+        app = create_flask_app()
+        if args.workers > 1:
+            app.run(host=args.host, port=args.port, processes=args.workers, threaded=False)
+        else:
+            app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
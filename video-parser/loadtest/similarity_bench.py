@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+本地内容相关性计时检查
+
+以单次请求上限（AI_MAX_MAP_VIDEOS）个合成视频调用 content_similarity，
+输出各阶段耗时；中位耗时超过预算时以非零状态退出，可用于发布前检查。
+
+    python -m loadtest.similarity_bench
+    python -m loadtest.similarity_bench --videos 3000 --budget-ms 2000
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from .serve import ROOT_DIR, SPA_BACKEND_DIR
+
+
+def synthetic_videos(count: int, seed: int = 2024) -> List[Dict[str, Any]]:
+    """生成带重复用词的视频元数据：标题、标签和描述从同一个词库中抽取"""
+    rng = random.Random(seed)
+    chars = [chr(0x4e00 + i) for i in range(2500)]
+    words = [''.join(rng.choice(chars) for _ in range(rng.randint(2, 4))) for _ in range(3000)]
+    tags = [f'tag{i}' for i in range(200)]
+    return [
+        {
+            'title': ''.join(rng.choice(words) for _ in range(rng.randint(4, 10))),
+            'tags': rng.sample(tags, rng.randint(1, 5)),
+            'description': ''.join(rng.choice(words) for _ in range(rng.randint(20, 200))),
+        }
+        for _ in range(count)
+    ]
+
+
+def main():
+    for path in (SPA_BACKEND_DIR, ROOT_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    from api.ai_service import AI_MAX_MAP_VIDEOS, ai_service
+    from api.similarity import TfidfIndex, video_text
+
+    parser = argparse.ArgumentParser(description='本地内容相关性计时检查')
+    parser.add_argument('--videos', type=int, default=AI_MAX_MAP_VIDEOS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=500.0, help='content_similarity 中位耗时上限')
+    args = parser.parse_args()
+
+    videos = synthetic_videos(args.videos)
+    target = videos[0]['title']
+
+    timings = {'index': [], 'matrix': [], 'most_similar': [], 'content_similarity': []}
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        index = TfidfIndex([video_text(video) for video in videos])
+        timings['index'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        index.similarity_matrix()
+        timings['matrix'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        index.most_similar(5)
+        timings['most_similar'].append(time.perf_counter() - started)
+
+        if args.videos <= AI_MAX_MAP_VIDEOS:
+            started = time.perf_counter()
+            ai_service.content_similarity(target, '', videos)
+            timings['content_similarity'].append(time.perf_counter() - started)
+
+    print(f"videos={args.videos} repeat={args.repeat}")
+    for name, values in timings.items():
+        if values:
+            print(f"  {name:<20} median {statistics.median(values) * 1000:8.1f} ms   max {max(values) * 1000:8.1f} ms")
+
+    check = timings['content_similarity'] or timings['most_similar']
+    median_ms = statistics.median(check) * 1000
+    if median_ms > args.budget_ms:
+        print(f"超出预算：{median_ms:.1f} ms > {args.budget_ms:g} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
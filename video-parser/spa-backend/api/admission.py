@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+准入控制中间件模块
+"""
+
+import time
+
+from fastapi.responses import JSONResponse
+
+from core.admission import (
+    AdmissionController, AdmissionRejected, AsyncLane, create_default_controller,
+    MEDIA_LIMIT, MEDIA_MAX_WAIT, MEDIA_QUEUE
+)
+
+
+class AdmissionMiddleware:
+    """ASGI 准入控制中间件
+
+    名额在整个响应发送完毕后才归还；SSE 事件流在响应头发出（取得首个事件）时
+    即归还名额，其后的流式生成由 AI 服务按密钥的并发上限约束，不占用通道。通道饱和时
+    直接返回 429/503 和 Retry-After，不进入路由处理。
+    """
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        lane = self.controller.classify(scope['method'], scope['path'])
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await lane.acquire()
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                status_code=e.status_code,
+                content={"success": False, "error": f"服务繁忙，请 {e.retry_after} 秒后重试"},
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                lane.release(time.monotonic() - start)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start' and _is_event_stream(message):
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
+
+
+def _is_event_stream(message) -> bool:
+    """响应是否为 SSE 事件流"""
+    for name, value in message.get('headers', ()):
+        if name.lower() == b'content-type':
+            return value.startswith(b'text/event-stream')
+    return False
+
+
+def _create_controller() -> AdmissionController:
+    controller = create_default_controller(AsyncLane)
+    # 媒体代理在播放期间持续传输，使用独立通道，不挤占 AI 与截取请求的名额
+    controller.add_lane(AsyncLane('media', MEDIA_LIMIT, MEDIA_QUEUE, MEDIA_MAX_WAIT, reject_status=429))
+    controller.add_rule('POST', r'^/api/parse$', 'interactive')
+    # AI 生成、相关性分析（含批量）和任务提交；任务状态查询与事件流不受限制
+    controller.add_rule('POST', r'^/api/ai/', 'bulk')
+    # 片段截取需要下载和合并媒体数据，与批量任务共用通道
+    controller.add_rule('GET', r'^/api/clip$', 'bulk')
+    controller.add_rule('GET', r'^/api/media$', 'media')
+    return controller
+
+
+# 全局准入控制器实例
+admission_controller = _create_controller()
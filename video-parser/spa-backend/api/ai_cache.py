@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+AI响应缓存模块
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from core.cache import Cache, CacheBackend, get_cache_backend
+
+# 内存缓存条目上限
+AI_CACHE_MAX_ENTRIES = 1024
+
+# 缓存有效期（秒）
+AI_CACHE_TTL = 24 * 3600
+
+# 磁盘缓存目录，未设置时只使用内存缓存
+AI_CACHE_DIR = os.environ.get('AI_CACHE_DIR')
+
+# 磁盘缓存条目上限
+AI_CACHE_DISK_MAX_ENTRIES = 20000
+
+
+def make_cache_key(model: str, temperature: float, max_tokens: int,
+                   system_prompt: str, prompt: str) -> str:
+    """根据生成参数和完整提示词计算内容寻址的缓存键"""
+    payload = json.dumps(
+        [model, temperature, max_tokens, system_prompt, prompt],
+        ensure_ascii=False, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AIResponseCache:
+    """AI响应缓存：内存 LRU + 可选共享层（SQLite/Redis）+ 可选磁盘层，按 TTL 过期
+
+    VIDEO_CACHE_URL 指向共享后端时，多个 worker 进程/容器共用同一份缓存。
+    共享层和磁盘层的访问会阻塞，异步代码应使用 get_async/set_async/contains_async，
+    只有内存层在事件循环中直接访问。
+    """
+
+    def __init__(self, max_entries: int = AI_CACHE_MAX_ENTRIES, ttl: float = AI_CACHE_TTL,
+                 disk_dir: Optional[str] = AI_CACHE_DIR,
+                 disk_max_entries: int = AI_CACHE_DISK_MAX_ENTRIES,
+                 backend: Optional[CacheBackend] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        if backend is None:
+            backend = get_cache_backend()
+        # 进程内后端与内存层重复，只使用共享后端
+        self.shared: Optional[Cache] = Cache(backend, 'ai', ttl) if backend.shared else None
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self._stats = {
+            'hits': 0,
+            'shared_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'expired': 0,
+            'bypassed': 0,
+        }
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]):
+        """写入内存层并淘汰最久未使用的条目（需持有锁）"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if item.get('expires_at', 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return item['expires_at'], item['value']
+
+    def _write_disk(self, key: str, expires_at: float, value: Dict[str, Any]):
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.ai_cache.', suffix='.tmp', dir=self.disk_dir)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"写入AI缓存失败: {str(e)}")
+            return
+
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """删除超出上限的最旧磁盘条目"""
+        try:
+            files = [
+                os.path.join(self.disk_dir, name)
+                for name in os.listdir(self.disk_dir) if name.endswith('.json')
+            ]
+            if len(files) <= self.disk_max_entries:
+                return
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - self.disk_max_entries]:
+                os.remove(path)
+        except OSError as e:
+            print(f"清理AI缓存失败: {str(e)}")
+
+    @property
+    def _has_slow_tiers(self) -> bool:
+        return self.shared is not None or bool(self.disk_dir)
+
+    def _get_memory(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[1]
+                del self._entries[key]
+                self._stats['expired'] += 1
+        return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存，未命中或已过期时返回 None"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        return self._get_slow(key, now)
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """协程版本的 get()，共享层和磁盘层在线程池中查询"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        if not self._has_slow_tiers:
+            return self._get_slow(key, now)
+        return await run_in_threadpool(self._get_slow, key, now)
+
+    def _get_slow(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        """依次查询共享层和磁盘层，命中时回填内存层"""
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                with self._lock:
+                    # 共享层不返回剩余有效期，内存层按完整 TTL 保存
+                    self._remember(key, now + self.ttl, value)
+                    self._stats['hits'] += 1
+                    self._stats['shared_hits'] += 1
+                return value
+
+        if self.disk_dir:
+            item = self._read_disk(key)
+            if item is not None:
+                with self._lock:
+                    self._remember(key, item[0], item[1])
+                    self._stats['hits'] += 1
+                    self._stats['disk_hits'] += 1
+                return item[1]
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def _contains_memory(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.time()
+
+    def contains(self, key: str) -> bool:
+        """是否存在未过期的条目（不计入命中统计，也不调整淘汰顺序）"""
+        return self._contains_memory(key) or self._contains_slow(key)
+
+    async def contains_async(self, key: str) -> bool:
+        """协程版本的 contains()"""
+        if self._contains_memory(key):
+            return True
+        if not self._has_slow_tiers:
+            return False
+        return await run_in_threadpool(self._contains_slow, key)
+
+    def _contains_slow(self, key: str) -> bool:
+        if self.shared is not None and self.shared.contains(key):
+            return True
+        return bool(self.disk_dir) and self._read_disk(key) is not None
+
+    def _set_memory(self, key: str, value: Dict[str, Any]) -> float:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self._stats['stores'] += 1
+        return expires_at
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """写入缓存"""
+        self._set_slow(key, self._set_memory(key, value), value)
+
+    async def set_async(self, key: str, value: Dict[str, Any]):
+        """协程版本的 set()，共享层和磁盘层在线程池中写入"""
+        expires_at = self._set_memory(key, value)
+        if self._has_slow_tiers:
+            await run_in_threadpool(self._set_slow, key, expires_at, value)
+
+    def _set_slow(self, key: str, expires_at: float, value: Dict[str, Any]):
+        if self.shared is not None:
+            self.shared.set(key, value)
+        if self.disk_dir:
+            self._write_disk(key, expires_at, value)
+
+    def record_bypass(self):
+        """记录一次显式跳过缓存的请求"""
+        with self._lock:
+            self._stats['bypassed'] += 1
+
+    def clear(self):
+        """清空内存和磁盘缓存"""
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.json'):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except OSError:
+                        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        stats['disk_enabled'] = bool(self.disk_dir)
+        stats['shared_backend'] = self.shared.backend.name if self.shared is not None else None
+        return stats
+
+
+# 全局AI响应缓存实例
+ai_cache = AIResponseCache()
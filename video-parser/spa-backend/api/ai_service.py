@@ -4,13 +4,85 @@ AI服务模块
 """
 
 import os
+import asyncio
 import httpx
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Set, Tuple
 from pydantic import BaseModel
 from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
 import time
+import zlib
 from .keys import key_manager
+from .ai_cache import ai_cache, make_cache_key
+from .json_stream import IncrementalJSONParser, extract_json_object
+from .similarity import TfidfIndex, round_matrix, video_text
+from .key_pool import (
+    key_pool, is_pool_name, backoff_delay, POOL_MAX_ATTEMPTS, POOL_PREFIX, RETRYABLE_STATUS_CODES
+)
+
+try:
+    import h2  # noqa: F401  HTTP/2 支持需要 httpx[http2]
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 连接池配置
+AI_MAX_CONNECTIONS = 100
+AI_MAX_KEEPALIVE_CONNECTIONS = 20
+AI_KEEPALIVE_EXPIRY = 60.0
+
+# 超时配置（秒）：deepseek-reasoner 先推理再输出，读超时需要明显长于 chat 模型
+AI_CONNECT_TIMEOUT = 5.0
+AI_WRITE_TIMEOUT = 10.0
+AI_POOL_TIMEOUT = 10.0
+AI_READ_TIMEOUTS = {
+    "deepseek-chat": 60.0,
+    "deepseek-reasoner": 180.0,
+}
+AI_DEFAULT_READ_TIMEOUT = 60.0
+
+# 每个API密钥同时进行的上游请求数上限
+AI_MAX_CONCURRENCY_PER_KEY = 4
+
+# 组合文案生成单次请求的分段数上限
+AI_MAX_CONTENT_SECTIONS = 12
+
+# 多视频相关性分析（map-reduce）配置
+AI_MAX_MAP_VIDEOS = 500             # 单次最多分析的视频数
+AI_MAP_CHUNK_TOKENS = 3000          # 每个 map 请求中视频摘要的 token 预算
+AI_MAP_BOUNDARY_MODULUS = 8         # 按内容哈希切分分块，平均每块视频数
+AI_MAP_FIELD_CHARS = 300            # 单个字段保留的最大字符数
+AI_MAP_SUMMARY_TOKENS = 800         # map 输出的 max_tokens
+AI_MAP_CONCURRENCY = 8              # 同时进行的 map 请求数
+AI_REDUCE_INPUT_TOKENS = 6000       # 最终汇总请求中摘要的 token 预算，超出时逐层合并
+
+# 本地内容相似度分析配置
+CONTENT_KEYWORDS_TOP_K = 20         # 返回的关键词数
+CONTENT_MATRIX_MAX_DOCS = 200       # 文档数不超过该值时返回完整相似度矩阵
+CONTENT_NEIGHBORS_TOP_K = 5         # 每个视频返回的最相似视频数
+
+# 视频摘要中不需要的字段
+_DIGEST_SKIP_FIELDS = {'success', 'streams', 'cover', 'url', 'downloadable', 'reason', 'disclaimer'}
+
+# 相关性分析的类型名称和分析维度
+CORRELATION_ASPECTS = {
+    "audience": ("受众分析", """1. 年龄段分布
+2. 性别分布
+3. 兴趣标签（5-10个）
+4. 活跃时段
+5. 内容偏好（按类别和百分比）
+6. 针对性策略建议（3-5条）"""),
+    "content": ("内容相关性分析", """1. 关键词提取和相关性评分
+2. 主题分布和权重
+3. 与对比内容的多维度相似度分析"""),
+    "trend": ("趋势分析", """1. 过去30天的热度变化（每日数据）
+2. 相关话题和趋势变化
+3. 未来1-4周的预测和建议"""),
+}
+
+# 系统提示词
+SYSTEM_PROMPT = "你是一个专业的视频内容分析师和文案写作助手，擅长分析视频内容、撰写吸引人的文案和提供有价值的建议。"
 
 class AIRequest(BaseModel):
     """AI请求模型"""
@@ -25,29 +97,158 @@ class AIResponse(BaseModel):
     model: str
     usage: Dict[str, int]
 
+class ContentSectionsRequest(BaseModel):
+    """组合文案生成请求模型"""
+    video_data: Dict[str, Any]
+    content_types: List[str]
+    platforms: Optional[List[str]] = None
+
+class CorrelationBatchRequest(BaseModel):
+    """多视频相关性分析请求模型，videos 为各视频的解析结果"""
+    videos: List[Dict[str, Any]]
+    analysis_type: str
+    target: Optional[str] = None
+    compare: Optional[str] = None
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中日韩字符约 1 个 token，其余字符约 4 个一个 token"""
+    cjk = sum(1 for c in text if '\u2e80' <= c <= '\u9fff' or '\uac00' <= c <= '\ud7af' or '\uff00' <= c <= '\uffef')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _add_usage(total: Dict[str, int], usage: Dict[str, int]):
+    for key, value in usage.items():
+        if isinstance(value, int):
+            total[key] = total.get(key, 0) + value
+
+
 class AIService:
     """AI服务类"""
 
     def __init__(self):
         self.base_url = "https://api.deepseek.com/v1/chat/completions"
+        self._client: Optional[httpx.AsyncClient] = None
+        self._key_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _key_semaphore(self, api_key_name: str) -> asyncio.Semaphore:
+        """每个API密钥一个信号量，限制对上游的并发请求数"""
+        semaphore = self._key_semaphores.get(api_key_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY_PER_KEY)
+            self._key_semaphores[api_key_name] = semaphore
+        return semaphore
+
+    def _create_client(self) -> httpx.AsyncClient:
+        """创建带连接池的长连接客户端"""
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=AI_MAX_CONNECTIONS,
+                max_keepalive_connections=AI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=AI_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                connect=AI_CONNECT_TIMEOUT,
+                read=AI_DEFAULT_READ_TIMEOUT,
+                write=AI_WRITE_TIMEOUT,
+                pool=AI_POOL_TIMEOUT
+            )
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """共享的HTTP客户端，未经 startup 初始化时按需创建"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    async def startup(self):
+        """应用启动时创建共享客户端"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+
+    async def shutdown(self):
+        """应用关闭时释放连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _timeout_for(self, model: str) -> httpx.Timeout:
+        """按模型确定请求超时"""
+        return httpx.Timeout(
+            connect=AI_CONNECT_TIMEOUT,
+            read=AI_READ_TIMEOUTS.get(model, AI_DEFAULT_READ_TIMEOUT),
+            write=AI_WRITE_TIMEOUT,
+            pool=AI_POOL_TIMEOUT
+        )
+
+    def _cache_key(self, request: AIRequest) -> str:
+        return make_cache_key(
+            request.model, request.temperature, request.max_tokens, SYSTEM_PROMPT, request.prompt
+        )
 
-    async def generate_text(self, request: AIRequest, api_key_name: str = "default") -> AIResponse:
-        """生成文本"""
-        # 获取API密钥
+    def _resolve_api_key(self, api_key_name: str) -> str:
+        """获取API密钥"""
         api_key_obj = key_manager.get_key(api_key_name)
         if not api_key_obj:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail=f"API密钥 '{api_key_name}' 不存在或已失效"
             )
+        return api_key_obj.key
+
+    def _verify_api_key(self, api_key_name: str):
+        """确认密钥或密钥池存在，在读取缓存之前调用，无效的密钥名称不能取得缓存结果
+
+        只检查是否存在，不计入使用次数；使用次数在 _checkout_key 实际取用密钥时登记。
+        """
+        if not is_pool_name(api_key_name):
+            if not key_manager.has_key(api_key_name):
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail=f"API密钥 '{api_key_name}' 不存在或已失效"
+                )
+            return
+        group = api_key_name[len(POOL_PREFIX):]
+        if not key_manager.get_group_names(group):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"密钥池 '{group}' 中没有可用的API密钥"
+            )
+
+    def _checkout_key(self, api_key_name: str, tried: Set[str]) -> Tuple[str, str]:
+        """选出本次请求使用的密钥，返回 (密钥名称, 密钥)
+
+        api_key_name 为 "pool:<组名>" 时从密钥池中选择未尝试过的密钥。
+        """
+        if not is_pool_name(api_key_name):
+            return api_key_name, self._resolve_api_key(api_key_name)
+
+        key_name = key_pool.acquire(api_key_name, exclude=tried)
+        api_key_obj = key_manager.get_key(key_name)
+        if not api_key_obj:
+            key_pool.release(key_name)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"API密钥 '{key_name}' 不存在或已失效"
+            )
+        return key_name, api_key_obj.key
 
-        # 准备请求数据
+    def _checkin_key(self, api_key_name: str, key_name: str, status_code: Optional[int] = None,
+                     headers: Optional[Any] = None, error: bool = False):
+        """登记请求结果，密钥池据此更新在途数、限流信息和冷却时间"""
+        if is_pool_name(api_key_name):
+            key_pool.release(key_name, status_code, headers, error)
+
+    def _build_payload(self, request: AIRequest, stream: bool = False) -> Dict[str, Any]:
+        """准备请求数据"""
         data = {
             "model": request.model,
             "messages": [
                 {
                     "role": "system",
-                    "content": "你是一个专业的视频内容分析师和文案写作助手，擅长分析视频内容、撰写吸引人的文案和提供有价值的建议。"
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
@@ -57,50 +258,243 @@ class AIService:
             "temperature": request.temperature,
             "max_tokens": request.max_tokens
         }
+        if stream:
+            data["stream"] = True
+            data["stream_options"] = {"include_usage": True}
+        return data
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key_obj.key}"
-        }
-
-        # 发送请求
+    def _status_error(self, response: httpx.Response) -> HTTPException:
+        """将上游错误响应转换为HTTP异常"""
+        error_detail = "API请求失败"
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.base_url,
-                    json=data,
-                    headers=headers
+            error_data = response.json()
+            error_detail = error_data.get("error", {}).get("message", error_detail)
+        except:
+            pass
+
+        return HTTPException(
+            status_code=response.status_code,
+            detail=error_detail
+        )
+
+    async def generate_text(self, request: AIRequest, api_key_name: str = "default",
+                            bypass_cache: bool = False) -> AIResponse:
+        """生成文本
+
+        相同模型、参数和提示词的结果会被缓存，bypass_cache=True 时强制重新生成。
+        """
+        self._verify_api_key(api_key_name)
+        cache_key = self._cache_key(request)
+        if bypass_cache:
+            ai_cache.record_bypass()
+        else:
+            cached = await ai_cache.get_async(cache_key)
+            if cached is not None:
+                return AIResponse(**cached)
+
+        payload = self._build_payload(request)
+        attempts = POOL_MAX_ATTEMPTS if is_pool_name(api_key_name) else 1
+        tried: Set[str] = set()
+        last_error: Optional[HTTPException] = None
+
+        for attempt in range(attempts):
+            try:
+                key_name, secret = self._checkout_key(api_key_name, tried)
+            except HTTPException:
+                # 密钥池中已没有可换的密钥，返回上一次的上游错误
+                if last_error is not None:
+                    raise last_error
+                raise
+            tried.add(key_name)
+
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {secret}"
+            }
+
+            # 发送请求
+            try:
+                async with self._key_semaphore(key_name):
+                    response = await self.client.post(
+                        self.base_url,
+                        json=payload,
+                        headers=headers,
+                        timeout=self._timeout_for(request.model)
+                    )
+            except Exception as e:
+                self._checkin_key(api_key_name, key_name, error=True)
+                last_error = HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"生成文本时发生错误: {str(e)}"
                 )
-                response.raise_for_status()
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                raise last_error
+
+            self._checkin_key(api_key_name, key_name, response.status_code, response.headers)
+            if response.status_code >= 400:
+                last_error = self._status_error(response)
+                if response.status_code in RETRYABLE_STATUS_CODES and attempt + 1 < attempts:
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                raise last_error
 
+            try:
                 result = response.json()
 
-                return AIResponse(
+                ai_response = AIResponse(
                     content=result["choices"][0]["message"]["content"],
                     model=result["model"],
                     usage=result.get("usage", {})
                 )
-        except httpx.HTTPStatusError as e:
-            error_detail = "API请求失败"
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"生成文本时发生错误: {str(e)}"
+                )
+
+            await ai_cache.set_async(cache_key, ai_response.dict())
+            return ai_response
+
+        raise last_error
+
+    async def stream_text(self, request: AIRequest, api_key_name: str = "default",
+                          bypass_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成文本
+
+        依次产出 {"type": "reasoning"|"content", "content": 片段}，
+        最后产出 {"type": "done", "response": AIResponse}。缓存命中时直接产出完整内容。
+        """
+        self._verify_api_key(api_key_name)
+        cache_key = self._cache_key(request)
+        if bypass_cache:
+            ai_cache.record_bypass()
+        else:
+            cached = await ai_cache.get_async(cache_key)
+            if cached is not None:
+                response = AIResponse(**cached)
+                yield {"type": "content", "content": response.content}
+                yield {"type": "done", "response": response}
+                return
+
+        payload = self._build_payload(request, stream=True)
+        attempts = POOL_MAX_ATTEMPTS if is_pool_name(api_key_name) else 1
+        tried: Set[str] = set()
+        last_error: Optional[HTTPException] = None
+
+        parts = []
+        model = request.model
+        usage: Dict[str, int] = {}
+
+        # 只在开始推送内容之前换密钥重试，推送开始后出错直接结束
+        for attempt in range(attempts):
             try:
-                error_data = e.response.json()
-                error_detail = error_data.get("error", {}).get("message", error_detail)
-            except:
-                pass
+                key_name, secret = self._checkout_key(api_key_name, tried)
+            except HTTPException:
+                if last_error is not None:
+                    raise last_error
+                raise
+            tried.add(key_name)
 
-            raise HTTPException(
-                status_code=e.response.status_code,
-                detail=error_detail
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"生成文本时发生错误: {str(e)}"
-            )
+            headers = {
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+                "Authorization": f"Bearer {secret}"
+            }
 
-    async def analyze_video_content(self, video_data: Dict[str, Any], api_key_name: str = "default") -> Dict[str, Any]:
-        """分析视频内容"""
-        # 构建分析提示
+            status_code: Optional[int] = None
+            response_headers = None
+            failed = False
+            retry = False
+            finished = False  # 收到 [DONE] 或 finish_reason 为 stop
+            try:
+                async with self._key_semaphore(key_name):
+                    async with self.client.stream(
+                        "POST",
+                        self.base_url,
+                        json=payload,
+                        headers=headers,
+                        timeout=self._timeout_for(request.model)
+                    ) as response:
+                        status_code = response.status_code
+                        response_headers = response.headers
+                        if response.status_code >= 400:
+                            await response.aread()
+                            last_error = self._status_error(response)
+                            if response.status_code not in RETRYABLE_STATUS_CODES or attempt + 1 >= attempts:
+                                raise last_error
+                            retry = True
+                        else:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    finished = True
+                                    break
+
+                                chunk = json.loads(data)
+                                model = chunk.get("model", model)
+                                if chunk.get("usage"):
+                                    usage = chunk["usage"]
+
+                                for choice in chunk.get("choices") or []:
+                                    delta = choice.get("delta") or {}
+                                    if delta.get("reasoning_content"):
+                                        yield {"type": "reasoning", "content": delta["reasoning_content"]}
+                                    if delta.get("content"):
+                                        parts.append(delta["content"])
+                                        yield {"type": "content", "content": delta["content"]}
+                                    if choice.get("finish_reason") == "stop":
+                                        finished = True
+                            if not finished:
+                                # 连接被断开时 aiter_lines 正常结束，内容不完整，不能作为结果返回或缓存
+                                raise HTTPException(
+                                    status_code=status.HTTP_502_BAD_GATEWAY,
+                                    detail="AI服务的响应流意外中断，生成内容不完整"
+                                )
+            except HTTPException:
+                raise
+            except Exception as e:
+                failed = True
+                last_error = HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"生成文本时发生错误: {str(e)}"
+                )
+                if status_code is None and attempt + 1 < attempts:
+                    # 连接阶段失败，尚未产出任何内容，可以换密钥
+                    retry = True
+                else:
+                    raise last_error
+            finally:
+                self._checkin_key(api_key_name, key_name, status_code, response_headers, failed)
+
+            if retry:
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            break
+
+        ai_response = AIResponse(content="".join(parts), model=model, usage=usage)
+        await ai_cache.set_async(cache_key, ai_response.dict())
+        yield {"type": "done", "response": ai_response}
+
+    async def stream_structured(self, request: AIRequest, api_key_name: str = "default",
+                                bypass_cache: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """流式生成JSON结构化结果
+
+        在 stream_text 事件之外，每当顶层字段闭合时额外产出
+        {"type": "field", "key": 字段名, "value": 值}，便于前端提前渲染。
+        """
+        parser = IncrementalJSONParser()
+        async for event in self.stream_text(request, api_key_name, bypass_cache):
+            yield event
+            if event["type"] == "content":
+                for key, value in parser.feed(event["content"]):
+                    yield {"type": "field", "key": key, "value": value}
+
+    def build_analysis_request(self, video_data: Dict[str, Any]) -> AIRequest:
+        """构建视频分析请求"""
         prompt = f"""请分析以下视频内容，提供详细的分析报告：
 
 视频标题：{video_data.get('title', '')}
@@ -117,24 +511,16 @@ class AIService:
 
 请以JSON格式返回分析结果，包含上述所有方面。"""
 
-        # 调用AI生成分析结果
-        response = await self.generate_text(
-            AIRequest(prompt=prompt, model="deepseek-reasoner"),
-            api_key_name=api_key_name
-        )
+        return AIRequest(prompt=prompt, model="deepseek-reasoner")
 
-        # 尝试解析JSON结果
-        try:
-            # 查找JSON部分
-            content = response.content
-            start_idx = content.find('{')
-            end_idx = content.rfind('}') + 1
-
-            if start_idx >= 0 and end_idx > start_idx:
-                json_str = content[start_idx:end_idx]
-                return json.loads(json_str)
-        except:
-            pass
+    def parse_analysis_result(self, response: AIResponse) -> Dict[str, Any]:
+        """解析视频分析结果"""
+        # 尝试解析JSON结果，结尾损坏时保留已闭合的字段
+        result, complete = extract_json_object(response.content)
+        if result is not None:
+            if not complete:
+                result = dict(result, partial=True, analysis=response.content)
+            return result
 
         # 如果无法解析JSON，返回原始内容
         return {
@@ -143,9 +529,19 @@ class AIService:
             "usage": response.usage
         }
 
-    async def generate_content_copy(self, video_data: Dict[str, Any], content_type: str, 
-                               platform: str = None, api_key_name: str = "default") -> Dict[str, Any]:
-        """生成内容文案"""
+    async def analyze_video_content(self, video_data: Dict[str, Any], api_key_name: str = "default",
+                                    bypass_cache: bool = False) -> Dict[str, Any]:
+        """分析视频内容"""
+        response = await self.generate_text(
+            self.build_analysis_request(video_data),
+            api_key_name=api_key_name,
+            bypass_cache=bypass_cache
+        )
+        return self.parse_analysis_result(response)
+
+    def build_content_request(self, video_data: Dict[str, Any], content_type: str,
+                              platform: str = None) -> AIRequest:
+        """构建文案生成请求"""
         # 构建文案生成提示
         platform_text = f"针对{platform}平台" if platform else ""
 
@@ -211,25 +607,18 @@ class AIService:
                 detail=f"不支持的内容类型: {content_type}"
             )
 
-        # 调用AI生成文案
-        response = await self.generate_text(
-            AIRequest(prompt=prompt, model="deepseek-chat"),
-            api_key_name=api_key_name
-        )
+        return AIRequest(prompt=prompt, model="deepseek-chat")
 
+    def parse_content_result(self, response: AIResponse, content_type: str,
+                             platform: str = None) -> Dict[str, Any]:
+        """解析文案生成结果"""
         # 尝试解析结构化结果
         if content_type == "full":
-            try:
-                # 查找JSON部分
-                content = response.content
-                start_idx = content.find('{')
-                end_idx = content.rfind('}') + 1
-
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = content[start_idx:end_idx]
-                    return json.loads(json_str)
-            except:
-                pass
+            result, complete = extract_json_object(response.content)
+            if result is not None:
+                if not complete:
+                    result = dict(result, partial=True, content=response.content)
+                return result
 
         # 返回结果
         return {
@@ -240,6 +629,452 @@ class AIService:
             "usage": response.usage
         }
 
+    async def generate_content_copy(self, video_data: Dict[str, Any], content_type: str, 
+                               platform: str = None, api_key_name: str = "default",
+                               bypass_cache: bool = False) -> Dict[str, Any]:
+        """生成内容文案"""
+        request = self.build_content_request(video_data, content_type, platform)
+
+        # 调用AI生成文案
+        response = await self.generate_text(
+            request,
+            api_key_name=api_key_name,
+            bypass_cache=bypass_cache
+        )
+        return self.parse_content_result(response, content_type, platform)
+
+
+    def build_correlation_request(self, analysis_data: Dict[str, Any], analysis_type: str) -> AIRequest:
+        """构建相关性分析请求"""
+        if analysis_type not in CORRELATION_ASPECTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"不支持的分析类型: {analysis_type}"
+            )
+
+        name, aspects = CORRELATION_ASPECTS[analysis_type]
+        subject = f"分析目标：{analysis_data.get('target', '')}"
+        if analysis_type == "content":
+            subject += f"\n对比内容：{analysis_data.get('compare', '')}"
+
+        prompt = f"""请对以下内容进行{name}：
+
+{subject}
+
+请从以下几个方面进行分析：
+{aspects}
+
+请以JSON格式返回分析结果。"""
+
+        return AIRequest(prompt=prompt, model="deepseek-reasoner")
+
+    def parse_correlation_result(self, response: AIResponse, analysis_type: str) -> Dict[str, Any]:
+        """解析相关性分析结果"""
+        # 尝试解析JSON结果，结尾损坏时保留已闭合的字段
+        result, complete = extract_json_object(response.content)
+        if result is not None:
+            if not complete:
+                result = dict(result, partial=True, analysis=response.content)
+        else:
+            # 如果无法解析JSON，返回原始内容
+            result = {
+                "analysis": response.content,
+                "type": analysis_type
+            }
+
+        return {
+            "result": result,
+            "model": response.model,
+            "usage": response.usage
+        }
+
+    def content_similarity(self, target: str = '', compare: str = '',
+                           videos: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """本地计算内容相关性：关键词权重和相似度，结果确定且不调用上游
+
+        文档依次为分析目标、对比内容（如有）和各视频的标题/标签/描述。
+        """
+        started = time.perf_counter()
+        labels: List[str] = []
+        documents: List[str] = []
+        if target:
+            labels.append("target")
+            documents.append(target)
+        if compare:
+            labels.append("compare")
+            documents.append(compare)
+        if videos and len(videos) > AI_MAX_MAP_VIDEOS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"单次最多分析 {AI_MAX_MAP_VIDEOS} 个视频"
+            )
+        for i, video in enumerate(videos or []):
+            labels.append(f"video:{i}")
+            documents.append(video_text(video))
+        if not documents:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="分析目标不能为空"
+            )
+
+        index = TfidfIndex(documents)
+        result: Dict[str, Any] = {
+            "engine": "tfidf",
+            "documents": labels,
+            "keywords": [
+                {"keyword": term, "weight": weight}
+                for term, weight in index.keywords(CONTENT_KEYWORDS_TOP_K)
+            ]
+        }
+
+        if target and compare:
+            score = float(index.similarity_to(compare)[0])
+            result["similarity"] = {
+                "score": round(score, 4),
+                "shared_keywords": [
+                    {"keyword": term, "weight": weight} for term, weight in index.shared_terms(0, 1)
+                ]
+            }
+
+        if len(documents) <= CONTENT_MATRIX_MAX_DOCS:
+            result["matrix"] = round_matrix(index.similarity_matrix())
+        if videos:
+            offset = len(documents) - len(videos)
+            neighbors = index.most_similar(CONTENT_NEIGHBORS_TOP_K)
+            result["neighbors"] = [
+                {
+                    "document": labels[i],
+                    "similar": [{"document": labels[j], "score": score} for j, score in neighbors[i]]
+                }
+                for i in range(offset, len(documents))
+            ]
+            if target:
+                scores = index.similarity_to(target)[offset:]
+                top = scores.argsort()[::-1][:CONTENT_NEIGHBORS_TOP_K]
+                result["closest_to_target"] = [
+                    {"document": labels[offset + i], "score": round(float(scores[i]), 4)} for i in top
+                ]
+
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    def build_content_narrative_request(self, similarity: Dict[str, Any]) -> AIRequest:
+        """构建内容相关性的文字解读请求，只提供本地计算出的指标"""
+        facts = {key: similarity[key] for key in ("keywords", "similarity", "closest_to_target") if key in similarity}
+        prompt = f"""以下是本地算法计算出的内容相关性指标（关键词权重、相似度得分均为确定值，请勿修改）：
+
+{json.dumps(facts, ensure_ascii=False)}
+
+请基于这些指标，用200字以内概括内容主题、关键词特点以及与对比内容的相似与差异，并给出2-3条优化建议。
+请直接返回文字，不要重复列出数值表格。"""
+
+        return AIRequest(prompt=prompt, model="deepseek-chat", temperature=0.3, max_tokens=600)
+
+    async def correlation_analysis(self, analysis_data: Dict[str, Any], analysis_type: str,
+                                   api_key_name: str = "default",
+                                   bypass_cache: bool = False,
+                                   narrative: bool = True) -> Dict[str, Any]:
+        """相关性分析，返回 {"result", "model", "usage"}
+
+        content 类型的关键词和相似度在本地计算，模型只用于生成文字解读（narrative=False 时不调用模型）。
+        """
+        if analysis_type == "content":
+            # 相似度计算占用 CPU，放到线程池中执行，避免阻塞事件循环
+            result = await run_in_threadpool(
+                self.content_similarity,
+                analysis_data.get('target', ''), analysis_data.get('compare', ''), analysis_data.get('videos')
+            )
+            if not narrative:
+                return {"result": result, "model": "local", "usage": {}}
+            response = await self.generate_text(
+                self.build_content_narrative_request(result),
+                api_key_name=api_key_name,
+                bypass_cache=bypass_cache
+            )
+            result["summary"] = response.content
+            return {"result": result, "model": response.model, "usage": response.usage}
+
+        response = await self.generate_text(
+            self.build_correlation_request(analysis_data, analysis_type),
+            api_key_name=api_key_name,
+            bypass_cache=bypass_cache
+        )
+        return self.parse_correlation_result(response, analysis_type)
+
+
+    def _video_digest(self, video: Dict[str, Any]) -> str:
+        """将单个视频的解析结果压缩为一行文本，只保留对分析有用的字段"""
+        parts = []
+        for key, value in video.items():
+            if key in _DIGEST_SKIP_FIELDS or value is None or value == '' or isinstance(value, dict):
+                continue
+            if isinstance(value, list):
+                value = '、'.join(str(item) for item in value if isinstance(item, (str, int, float)))
+            text = str(value)
+            if len(text) > AI_MAP_FIELD_CHARS:
+                text = text[:AI_MAP_FIELD_CHARS] + '…'
+            parts.append(f"{key}: {text}")
+        return "- " + "；".join(parts)
+
+    def _chunk_texts(self, texts: List[str], budget: int, content_defined: bool = False) -> List[List[str]]:
+        """按 token 预算把文本分块
+
+        content_defined 为真时还会在内容哈希命中的位置切分，
+        增删个别视频只影响其所在分块，其余分块的提示词不变，可以直接命中缓存。
+        """
+        chunks: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if current and current_tokens + tokens > budget:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+            if content_defined and zlib.crc32(text.encode('utf-8')) % AI_MAP_BOUNDARY_MODULUS == 0:
+                chunks.append(current)
+                current, current_tokens = [], 0
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def build_map_request(self, digests: List[str]) -> AIRequest:
+        """构建单个分块的视频摘要请求（与分析类型无关，不同分析类型可共用缓存）"""
+        prompt = f"""请阅读以下{len(digests)}个视频的元数据，提取可用于受众、内容和趋势分析的要点：
+
+{chr(10).join(digests)}
+
+请以JSON格式返回，包含以下字段：
+videos（视频数量）、themes（主要主题及占比）、keywords（高频关键词，最多15个）、
+audience_signals（受众特征线索）、trend_signals（发布时间与热度变化线索）、
+highlights（表现突出的视频及原因，最多3个）。"""
+
+        return AIRequest(prompt=prompt, model="deepseek-chat", temperature=0.3,
+                         max_tokens=AI_MAP_SUMMARY_TOKENS)
+
+    def build_merge_request(self, summaries: List[str]) -> AIRequest:
+        """构建摘要合并请求，摘要过多无法放入一次汇总时逐层使用"""
+        prompt = f"""以下是{len(summaries)}组视频的分析要点（JSON），请合并为一份要点，
+字段与输入相同，videos 为各组之和，其余字段去重并按重要性保留：
+
+{chr(10).join(summaries)}
+
+请以JSON格式返回合并结果。"""
+
+        return AIRequest(prompt=prompt, model="deepseek-chat", temperature=0.3,
+                         max_tokens=AI_MAP_SUMMARY_TOKENS)
+
+    def build_reduce_request(self, summaries: List[str], analysis_type: str, video_count: int,
+                             target: Optional[str] = None, compare: Optional[str] = None,
+                             facts: Optional[Dict[str, Any]] = None) -> AIRequest:
+        """构建多视频相关性分析的最终汇总请求"""
+        if analysis_type not in CORRELATION_ASPECTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"不支持的分析类型: {analysis_type}"
+            )
+
+        name, aspects = CORRELATION_ASPECTS[analysis_type]
+        subject = f"分析目标：{target}\n" if target else ""
+        if analysis_type == "content" and compare:
+            subject += f"对比内容：{compare}\n"
+        if facts:
+            subject += f"本地算法计算的关键词和相似度（确定值，请直接引用）：{json.dumps(facts, ensure_ascii=False)}\n"
+
+        prompt = f"""请基于以下{video_count}个视频的分组分析要点，对这批视频进行整体{name}：
+
+{subject}{chr(10).join(summaries)}
+
+请从以下几个方面进行分析：
+{aspects}
+
+请以JSON格式返回分析结果。"""
+
+        return AIRequest(prompt=prompt, model="deepseek-reasoner")
+
+    def validate_correlation_batch(self, videos: List[Dict[str, Any]], analysis_type: str):
+        """校验多视频分析请求，避免无效请求消耗 map 调用或进入任务队列"""
+        if not videos:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="视频列表不能为空"
+            )
+        if len(videos) > AI_MAX_MAP_VIDEOS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"单次最多分析 {AI_MAX_MAP_VIDEOS} 个视频"
+            )
+        if analysis_type not in CORRELATION_ASPECTS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"不支持的分析类型: {analysis_type}"
+            )
+
+    async def batch_correlation_analysis(self, videos: List[Dict[str, Any]], analysis_type: str,
+                                         target: Optional[str] = None, compare: Optional[str] = None,
+                                         api_key_name: str = "default",
+                                         bypass_cache: bool = False) -> Dict[str, Any]:
+        """多视频相关性分析（map-reduce）
+
+        先把视频按 token 预算分块并发生成摘要（map），摘要总量超出预算时逐层合并，
+        最后一次汇总为分析报告（reduce）。每个分块的摘要按提示词缓存，
+        重新分析时只有内容变化的分块会请求上游。
+        """
+        self.validate_correlation_batch(videos, analysis_type)
+
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(AI_MAP_CONCURRENCY)
+        usage: Dict[str, int] = {}
+        stats = {"videos": len(videos), "chunks": 0, "cached": 0, "failed": 0, "levels": 0}
+        errors: List[Dict[str, Any]] = []
+
+        async def summarize(request: AIRequest) -> str:
+            if not bypass_cache and await ai_cache.contains_async(self._cache_key(request)):
+                stats["cached"] += 1
+            async with semaphore:
+                response = await self.generate_text(request, api_key_name, bypass_cache)
+            _add_usage(usage, response.usage)
+            result, _ = extract_json_object(response.content)
+            if result is None:
+                return response.content.strip()
+            return json.dumps(result, ensure_ascii=False, separators=(',', ':'))
+
+        async def run_level(requests: List[AIRequest], sizes: List[int]) -> List[str]:
+            results = await asyncio.gather(*(summarize(request) for request in requests),
+                                           return_exceptions=True)
+            summaries = []
+            for size, result in zip(sizes, results):
+                if isinstance(result, Exception):
+                    stats["failed"] += 1
+                    errors.append({
+                        "level": stats["levels"],
+                        "videos": size,
+                        "error": result.detail if isinstance(result, HTTPException) else str(result)
+                    })
+                else:
+                    summaries.append(result)
+            if not summaries:
+                # 整层失败时按第一个错误返回，保留原始状态码（如 401/429）
+                first = results[0]
+                if isinstance(first, HTTPException):
+                    raise first
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"多视频分析失败: {str(first)}"
+                )
+            stats["levels"] += 1
+            return summaries
+
+        # map：视频摘要分块
+        chunks = self._chunk_texts([self._video_digest(video) for video in videos],
+                                   AI_MAP_CHUNK_TOKENS, content_defined=True)
+        stats["chunks"] = len(chunks)
+        summaries = await run_level([self.build_map_request(chunk) for chunk in chunks],
+                                    [len(chunk) for chunk in chunks])
+
+        # 摘要总量超出汇总预算时逐层合并
+        while len(summaries) > 1 and sum(estimate_tokens(text) for text in summaries) > AI_REDUCE_INPUT_TOKENS:
+            groups = self._chunk_texts(summaries, AI_REDUCE_INPUT_TOKENS // 2)
+            if len(groups) == len(summaries):
+                # 单条摘要已超出预算，无法继续合并
+                break
+            summaries = await run_level([self.build_merge_request(group) for group in groups],
+                                        [len(group) for group in groups])
+
+        # content 类型的关键词和相似度在本地计算，模型只负责解读
+        local = None
+        facts = None
+        if analysis_type == "content":
+            local = await run_in_threadpool(self.content_similarity, target or '', compare or '', videos)
+            local.pop("matrix", None)
+            facts = {key: local[key] for key in ("keywords", "similarity", "closest_to_target") if key in local}
+
+        # reduce：最终分析
+        response = await self.generate_text(
+            self.build_reduce_request(summaries, analysis_type, len(videos), target, compare, facts),
+            api_key_name=api_key_name,
+            bypass_cache=bypass_cache
+        )
+        _add_usage(usage, response.usage)
+        result = self.parse_correlation_result(response, analysis_type)
+        result["usage"] = usage
+        stats["partial"] = bool(errors)
+        stats["elapsed"] = round(time.perf_counter() - started, 3)
+        result["map"] = stats
+        result["errors"] = errors
+        if local is not None:
+            result["similarity"] = local
+        return result
+
+
+    async def generate_content_sections(self, video_data: Dict[str, Any], content_types: List[str],
+                                        platforms: Optional[List[str]] = None,
+                                        api_key_name: str = "default",
+                                        bypass_cache: bool = False) -> Dict[str, Any]:
+        """并发生成多个文案分段
+
+        每个 (平台, 内容类型) 组合独立请求，并发受每个密钥的信号量约束，
+        总耗时接近最慢的一段。未指定平台时 sections 为 {内容类型: 结果}，
+        指定平台时为 {平台: {内容类型: 结果}}；单段失败记录在 errors 中，不影响其他分段。
+        """
+        content_types = list(dict.fromkeys(content_types))
+        targets = list(dict.fromkeys(platforms)) if platforms else [None]
+        if not content_types:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="内容类型不能为空"
+            )
+        if len(content_types) * len(targets) > AI_MAX_CONTENT_SECTIONS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"单次最多生成 {AI_MAX_CONTENT_SECTIONS} 个文案分段"
+            )
+
+        # 先构建全部请求，不支持的内容类型在发出任何上游请求前报错
+        jobs = [
+            (platform, content_type, self.build_content_request(video_data, content_type, platform))
+            for platform in targets
+            for content_type in content_types
+        ]
+
+        async def run(platform: Optional[str], content_type: str, request: AIRequest) -> Dict[str, Any]:
+            response = await self.generate_text(request, api_key_name, bypass_cache)
+            return self.parse_content_result(response, content_type, platform)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(run(platform, content_type, request) for platform, content_type, request in jobs),
+            return_exceptions=True
+        )
+
+        sections: Dict[str, Any] = {}
+        errors: List[Dict[str, Any]] = []
+        for (platform, content_type, _), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                errors.append({
+                    "platform": platform,
+                    "type": content_type,
+                    "error": result.detail if isinstance(result, HTTPException) else str(result)
+                })
+                continue
+            if platforms:
+                sections.setdefault(platform, {})[content_type] = result
+            else:
+                sections[content_type] = result
+
+        if not sections and errors and all(
+            isinstance(result, HTTPException) for result in results
+        ):
+            # 全部失败时按第一个错误返回，保留原始状态码（如 401/429）
+            raise results[0]
+
+        return {
+            "sections": sections,
+            "errors": errors,
+            "elapsed": round(time.perf_counter() - started, 3)
+        }
+
 
 # 全局AI服务实例
 ai_service = AIService()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+解析/下载历史存储模块
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from .keys import DATA_DIR
+
+# 历史数据库路径
+HISTORY_DB_PATH = os.path.join(DATA_DIR, 'history.db')
+
+# 分页大小
+HISTORY_DEFAULT_LIMIT = 20
+HISTORY_MAX_LIMIT = 100
+
+# 记录类型
+HISTORY_EVENTS = {'parse', 'download'}
+
+
+class HistoryRecord(BaseModel):
+    """客户端上报的历史记录"""
+    event: str = 'download'
+    platform: Optional[str] = None
+    canonical_id: Optional[str] = None
+    url: Optional[str] = None
+    title: Optional[str] = None
+    quality: Optional[str] = None
+    format: Optional[str] = None
+    duration: Optional[int] = None
+    client_id: Optional[str] = None
+
+
+_FIELDS = ('event', 'platform', 'canonical_id', 'url', 'title', 'quality', 'format', 'duration', 'client_id')
+
+
+class HistoryStore:
+    """历史记录存储（SQLite WAL + FTS5 标题全文索引）
+
+    按自增 id 倒序做游标分页（keyset），翻到任意深度都只扫描一页的行；
+    平台、视频ID、客户端的过滤各有 (字段, id) 复合索引，时间范围先换算为 id 区间。
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            event TEXT NOT NULL,
+            platform TEXT,
+            canonical_id TEXT,
+            url TEXT,
+            title TEXT,
+            quality TEXT,
+            format TEXT,
+            duration INTEGER,
+            client_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_created ON history (created_at);
+        CREATE INDEX IF NOT EXISTS idx_history_platform ON history (platform, id);
+        CREATE INDEX IF NOT EXISTS idx_history_canonical ON history (canonical_id, id);
+        CREATE INDEX IF NOT EXISTS idx_history_client ON history (client_id, id);
+        CREATE INDEX IF NOT EXISTS idx_history_event ON history (event, id);
+    """
+
+    _FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+            title, content='history', content_rowid='id', tokenize='{tokenizer}'
+        );
+        CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_fts (rowid, title) VALUES (new.id, new.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+            INSERT INTO history_fts (history_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        END;
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self.fts_enabled = False
+        # trigram 分词（SQLite 3.34+）支持中文子串检索，查询至少需要 3 个字符
+        self.fts_min_chars = 3
+
+    def _connection(self) -> sqlite3.Connection:
+        # 连接不能跨 fork 复用，进程变化时重新打开
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                                   check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            conn.executescript(self._SCHEMA)
+            self._init_fts(conn)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _init_fts(self, conn: sqlite3.Connection):
+        """创建全文索引；SQLite 不支持 FTS5 时退回 LIKE 检索"""
+        for tokenizer, min_chars in (('trigram', 3), ('unicode61', 1)):
+            try:
+                conn.executescript(self._FTS_SCHEMA.format(tokenizer=tokenizer))
+            except sqlite3.OperationalError:
+                continue
+            self.fts_enabled = True
+            self.fts_min_chars = min_chars
+            return
+        print("SQLite 不支持 FTS5，历史记录检索将使用 LIKE")
+
+    def record(self, item: Dict[str, Any]) -> int:
+        """写入一条历史记录，返回记录 id"""
+        values = [item.get(field) for field in _FIELDS]
+        with self._lock:
+            cursor = self._connection().execute(
+                f'INSERT INTO history (created_at, {", ".join(_FIELDS)}) '
+                f'VALUES (?, {", ".join("?" for _ in _FIELDS)})',
+                [item.get('created_at') or time.time()] + values
+            )
+        return cursor.lastrowid
+
+    def _id_bound(self, conn: sqlite3.Connection, sql: str, value: float) -> Optional[int]:
+        row = conn.execute(sql, (value,)).fetchone()
+        return row[0] if row else None
+
+    def query(self, cursor: Optional[int] = None, limit: int = HISTORY_DEFAULT_LIMIT,
+              q: Optional[str] = None, platform: Optional[str] = None,
+              canonical_id: Optional[str] = None, client_id: Optional[str] = None,
+              event: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None) -> Dict[str, Any]:
+        """分页查询，cursor 为上一页返回的 next_cursor"""
+        limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+        conditions: List[str] = []
+        params: List[Any] = []
+        q = (q or '').strip()
+
+        with self._lock:
+            # 先打开连接：是否支持全文索引在首次连接时才确定
+            conn = self._connection()
+            use_fts = bool(q) and self.fts_enabled and len(q) >= self.fts_min_chars
+            # 全文检索时按 FTS 的 rowid 排序和翻页，避免先取出全部匹配再排序
+            id_column = 'f.rowid' if use_fts else 'h.id'
+
+            # 记录时间由服务端写入，与 id 同序；时间范围经索引换算为 id 区间，走主键范围扫描
+            if since is not None:
+                lower = self._id_bound(conn, 'SELECT id FROM history WHERE created_at >= ? ORDER BY created_at LIMIT 1', since)
+                if lower is None:
+                    return {"items": [], "next_cursor": None}
+                conditions.append(f'{id_column} >= ?')
+                params.append(lower)
+            if until is not None:
+                upper = self._id_bound(conn, 'SELECT id FROM history WHERE created_at < ? ORDER BY created_at DESC LIMIT 1', until)
+                if upper is None:
+                    return {"items": [], "next_cursor": None}
+                conditions.append(f'{id_column} <= ?')
+                params.append(upper)
+            if cursor is not None:
+                conditions.append(f'{id_column} < ?')
+                params.append(cursor)
+            for column, value in (('platform', platform), ('canonical_id', canonical_id),
+                                  ('client_id', client_id), ('event', event)):
+                if value:
+                    conditions.append(f'h.{column} = ?')
+                    params.append(value)
+
+            source = 'history h'
+            if use_fts:
+                source = 'history_fts f JOIN history h ON h.id = f.rowid'
+                conditions.append('history_fts MATCH ?')
+                # 作为短语检索，避免用户输入被解析为 FTS 语法
+                params.append('title:"' + q.replace('"', '""') + '"')
+            elif q:
+                conditions.append("h.title LIKE ? ESCAPE '\\'")
+                escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                params.append(f'%{escaped}%')
+
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            rows = conn.execute(
+                f'SELECT h.* FROM {source} {where} ORDER BY {id_column} DESC LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = items[-1]['id'] if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def stats(self, since: Optional[float] = None, client_id: Optional[str] = None) -> Dict[str, Any]:
+        """按平台和日期聚合的次数，供数据分析页面使用"""
+        conditions: List[str] = []
+        params: List[Any] = []
+        if since is not None:
+            conditions.append('created_at >= ?')
+            params.append(since)
+        if client_id:
+            conditions.append('client_id = ?')
+            params.append(client_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with self._lock:
+            conn = self._connection()
+            platforms = conn.execute(
+                f'SELECT platform, event, COUNT(*) AS count FROM history {where} '
+                f'GROUP BY platform, event ORDER BY count DESC', params
+            ).fetchall()
+            daily = conn.execute(
+                f"SELECT date(created_at, 'unixepoch', 'localtime') AS day, COUNT(*) AS count "
+                f'FROM history {where} GROUP BY day ORDER BY day', params
+            ).fetchall()
+        return {
+            "platforms": [dict(row) for row in platforms],
+            "daily": [dict(row) for row in daily]
+        }
+
+    def delete(self, client_id: str) -> int:
+        """删除一个客户端的全部历史记录"""
+        if not client_id:
+            raise ValueError("client_id 不能为空")
+        with self._lock:
+            cursor = self._connection().execute('DELETE FROM history WHERE client_id = ?', (client_id,))
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+# 全局历史记录存储实例
+history_store = HistoryStore(HISTORY_DB_PATH)
@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+AI异步任务模块
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from .keys import DATA_DIR
+from .key_pool import RETRYABLE_STATUS_CODES
+
+# 任务数据库路径
+AI_JOBS_DB_PATH = os.path.join(DATA_DIR, 'ai_jobs.db')
+
+# 每个进程同时执行的任务数
+AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', '2'))
+
+# 单个任务最多执行次数（含首次）
+AI_JOB_MAX_ATTEMPTS = 3
+
+# 重试等待（秒），按次数指数增长
+AI_JOB_RETRY_BASE = 5.0
+AI_JOB_RETRY_MAX = 60.0
+
+# 没有本进程通知时检查数据库的间隔（秒），用于发现其他 worker 提交或更新的任务
+AI_JOB_POLL_INTERVAL = 1.0
+
+# 已结束任务的保留时间（秒）
+AI_JOB_RETENTION = 7 * 24 * 3600
+
+# 执行中任务的租约时长（秒）：执行进程定期续约，租约过期的任务视为中断，重新排队
+AI_JOB_LEASE = float(os.environ.get('AI_JOB_LEASE', '60'))
+
+# 续约和检查中断任务的间隔（秒）
+AI_JOB_HEARTBEAT_INTERVAL = AI_JOB_LEASE / 4
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+FINISHED_STATUSES = {JOB_SUCCEEDED, JOB_FAILED}
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def _process_start(pid: int) -> Optional[str]:
+    """进程的启动时间（/proc/<pid>/stat 第 22 个字段），进程不存在或无法读取时返回 None"""
+    try:
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # 进程名可能包含空格，从最后一个右括号之后开始切分
+    fields = stat[stat.rfind(')') + 2:].split()
+    return fields[19] if len(fields) > 19 else None
+
+
+def _instance_id() -> str:
+    """当前进程的实例标识：主机名 + PID + 进程启动时间
+
+    容器重启后新进程通常复用相同的 PID（如 PID 1），但启动时间不同，
+    因此可以区分上一次启动遗留的任务；无法读取启动时间时使用随机值。
+    """
+    return f'{socket.gethostname()}:{os.getpid()}:{_process_start(os.getpid()) or uuid.uuid4().hex}'
+
+
+def _instance_alive(instance_id: str) -> bool:
+    """实例是否仍在运行；其他主机上的实例无法判断，视为存活（由租约判断）"""
+    hostname, pid, start = (instance_id.rsplit(':', 2) + ['', ''])[:3]
+    if hostname != socket.gethostname() or not pid.isdigit():
+        return True
+    return _process_start(int(pid)) == start
+
+
+class JobStore:
+    """任务持久化（SQLite WAL），多个 uvicorn worker 共享同一任务表
+
+    领取任务时记录执行进程的实例标识和租约到期时间，执行期间定期续约；
+    实例已退出或租约过期的执行中任务由 recover() 放回队列。
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS ai_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            result TEXT,
+            error TEXT,
+            error_status INTEGER,
+            worker_pid INTEGER,
+            worker_id TEXT,
+            lease_until REAL,
+            available_at REAL NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            finished_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_ai_jobs_queue ON ai_jobs (status, available_at, created_at);
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # 连接不能跨 fork 复用，进程变化时重新打开
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                                   check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            conn.executescript(self._SCHEMA)
+            self._migrate(conn)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """为旧版本创建的任务表补充租约字段"""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(ai_jobs)')}
+        for column, column_type in (('worker_id', 'TEXT'), ('lease_until', 'REAL')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE ai_jobs ADD COLUMN {column} {column_type}')
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    def create(self, kind: str, params: Dict[str, Any], max_attempts: int) -> Dict[str, Any]:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._connection().execute(
+                'INSERT INTO ai_jobs (id, kind, params, status, max_attempts, available_at, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(params, ensure_ascii=False), JOB_QUEUED, max_attempts, now, now, now)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection().execute('SELECT * FROM ai_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim(self, worker_id: str, lease: float = AI_JOB_LEASE) -> Optional[Dict[str, Any]]:
+        """取出最早的一个可执行任务并标记为执行中，多进程间不会重复领取"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT id FROM ai_jobs WHERE status = ? AND available_at <= ? '
+                    'ORDER BY created_at LIMIT 1',
+                    (JOB_QUEUED, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                conn.execute(
+                    'UPDATE ai_jobs SET status = ?, attempts = attempts + 1, worker_pid = ?, worker_id = ?, '
+                    'lease_until = ?, updated_at = ? WHERE id = ?',
+                    (JOB_RUNNING, os.getpid(), worker_id, now + lease, now, row['id'])
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return self.get(row['id'])
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """记录结果；任务已不属于 worker_id（租约过期后被恢复）时不写入并返回 False"""
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                'UPDATE ai_jobs SET status = ?, result = ?, error = NULL, error_status = NULL, '
+                'worker_pid = NULL, worker_id = NULL, lease_until = NULL, updated_at = ?, finished_at = ? '
+                'WHERE id = ? AND status = ? AND worker_id = ?',
+                (JOB_SUCCEEDED, json.dumps(result, ensure_ascii=False), now, now, job_id, JOB_RUNNING, worker_id)
+            )
+        return cursor.rowcount > 0
+
+    def fail(self, job_id: str, worker_id: str, error: str, error_status: Optional[int],
+             retry_delay: Optional[float] = None) -> bool:
+        """记录失败；给出 retry_delay 时重新排队，否则任务结束。任务已不属于 worker_id 时返回 False"""
+        now = time.time()
+        with self._lock:
+            if retry_delay is None:
+                cursor = self._connection().execute(
+                    'UPDATE ai_jobs SET status = ?, error = ?, error_status = ?, worker_pid = NULL, '
+                    'worker_id = NULL, lease_until = NULL, updated_at = ?, finished_at = ? '
+                    'WHERE id = ? AND status = ? AND worker_id = ?',
+                    (JOB_FAILED, error, error_status, now, now, job_id, JOB_RUNNING, worker_id)
+                )
+            else:
+                cursor = self._connection().execute(
+                    'UPDATE ai_jobs SET status = ?, error = ?, error_status = ?, worker_pid = NULL, '
+                    'worker_id = NULL, lease_until = NULL, available_at = ?, updated_at = ? '
+                    'WHERE id = ? AND status = ? AND worker_id = ?',
+                    (JOB_QUEUED, error, error_status, now + retry_delay, now, job_id, JOB_RUNNING, worker_id)
+                )
+        return cursor.rowcount > 0
+
+    def requeue(self, job_id: str, worker_id: Optional[str]) -> bool:
+        """把执行中被打断的任务放回队列，不计入执行次数；任务已不属于 worker_id 时返回 False"""
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                'UPDATE ai_jobs SET status = ?, attempts = MAX(attempts - 1, 0), worker_pid = NULL, '
+                'worker_id = NULL, lease_until = NULL, available_at = ?, updated_at = ? '
+                'WHERE id = ? AND status = ? AND worker_id IS ?',
+                (JOB_QUEUED, now, now, job_id, JOB_RUNNING, worker_id)
+            )
+        return cursor.rowcount > 0
+
+    def renew(self, job_ids: List[str], worker_id: str, lease: float = AI_JOB_LEASE):
+        """延长本实例执行中任务的租约"""
+        if not job_ids:
+            return
+        with self._lock:
+            self._connection().execute(
+                f'UPDATE ai_jobs SET lease_until = ? WHERE status = ? AND worker_id = ? '
+                f'AND id IN ({", ".join("?" for _ in job_ids)})',
+                [time.time() + lease, JOB_RUNNING, worker_id] + list(job_ids)
+            )
+
+    def recover(self) -> int:
+        """将执行实例已退出或租约已过期的执行中任务放回队列，返回恢复的任务数"""
+        now = time.time()
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT id, worker_id, lease_until FROM ai_jobs WHERE status = ?', (JOB_RUNNING,)
+            ).fetchall()
+        orphaned = [
+            row for row in rows
+            if not row['worker_id'] or (row['lease_until'] or 0) < now or not _instance_alive(row['worker_id'])
+        ]
+        # 按读取时的执行实例放回，期间已被重新领取的任务不受影响
+        return sum(self.requeue(row['id'], row['worker_id']) for row in orphaned)
+
+    def prune(self, finished_before: float) -> int:
+        with self._lock:
+            cursor = self._connection().execute(
+                'DELETE FROM ai_jobs WHERE finished_at IS NOT NULL AND finished_at < ?', (finished_before,)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class JobQueue:
+    """AI异步任务队列
+
+    提交后立即返回任务ID，由固定数量的后台协程按提交顺序执行；
+    上游限流、5xx 或网络错误时延迟重试，结果写入 SQLite，
+    服务重启或客户端断线后仍可查询。
+    """
+
+    def __init__(self, store: Optional[JobStore] = None, workers: int = AI_JOB_WORKERS,
+                 max_attempts: int = AI_JOB_MAX_ATTEMPTS):
+        self.store = store or JobStore(AI_JOBS_DB_PATH)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.instance_id = _instance_id()
+        self._handlers: Dict[str, JobHandler] = {}
+        self._active: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._changed: Optional[asyncio.Event] = None
+
+    def register(self, kind: str, handler: JobHandler):
+        """注册任务类型的执行函数，handler 接收提交时的参数并返回可序列化为JSON的结果"""
+        self._handlers[kind] = handler
+
+    def _notify(self):
+        """唤醒等待状态变化的订阅者"""
+        if self._changed is not None:
+            changed, self._changed = self._changed, asyncio.Event()
+            changed.set()
+
+    async def start(self):
+        """恢复中断的任务并启动后台执行协程"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._changed = asyncio.Event()
+        recovered = await run_in_threadpool(self.store.recover)
+        if recovered:
+            print(f"恢复了 {recovered} 个中断的AI任务")
+        await run_in_threadpool(self.store.prune, time.time() - AI_JOB_RETENTION)
+        self._tasks = [
+            asyncio.create_task(self._run_worker(), name=f'ai-job-worker-{i}')
+            for i in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._run_heartbeat(), name='ai-job-heartbeat'))
+
+    async def stop(self):
+        """停止后台协程，执行中的任务放回队列，下次启动时继续"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """提交任务，返回任务记录"""
+        if kind not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        job = await run_in_threadpool(self.store.create, kind, params, self.max_attempts)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await run_in_threadpool(self.store.get, job_id)
+
+    async def wait_for_update(self, job_id: str, updated_at: float,
+                              timeout: float) -> Optional[Dict[str, Any]]:
+        """等待任务在 updated_at 之后发生变化，超时返回当前记录"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            if job is None or job['updated_at'] != updated_at:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            # 本进程内的变化立即唤醒，其他 worker 的变化靠定时检查发现
+            changed = self._changed or asyncio.Event()
+            try:
+                await asyncio.wait_for(changed.wait(), min(remaining, AI_JOB_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+
+    def _retry_delay(self, job: Dict[str, Any], error: Exception) -> Optional[float]:
+        if job['attempts'] >= job['max_attempts']:
+            return None
+        if isinstance(error, HTTPException) and error.status_code not in RETRYABLE_STATUS_CODES:
+            return None
+        return min(AI_JOB_RETRY_MAX, AI_JOB_RETRY_BASE * (2 ** (job['attempts'] - 1)))
+
+    async def _run_heartbeat(self):
+        """定期为执行中的任务续约，并把其他实例遗留的中断任务放回队列"""
+        while True:
+            await asyncio.sleep(AI_JOB_HEARTBEAT_INTERVAL)
+            try:
+                await run_in_threadpool(self.store.renew, list(self._active), self.instance_id)
+                recovered = await run_in_threadpool(self.store.recover)
+            except sqlite3.Error as e:
+                print(f"AI任务续约失败: {str(e)}")
+                continue
+            if recovered:
+                print(f"恢复了 {recovered} 个中断的AI任务")
+                self._wakeup.set()
+
+    async def _run_worker(self):
+        while True:
+            try:
+                job = await run_in_threadpool(self.store.claim, self.instance_id)
+            except sqlite3.Error as e:
+                print(f"领取AI任务失败: {str(e)}")
+                await asyncio.sleep(AI_JOB_POLL_INTERVAL)
+                continue
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), AI_JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            self._notify()
+            self._active.add(job['id'])
+            try:
+                await self._execute(job)
+            finally:
+                self._active.discard(job['id'])
+            self._notify()
+
+    async def _update(self, action: str, fn: Callable, job_id: str, *args):
+        """写入任务结果；写入失败时只记录日志，任务停止续约，租约过期后重新排队。
+        租约已失效、任务已被恢复或由其他实例接管时不覆盖其状态"""
+        try:
+            updated = await run_in_threadpool(fn, job_id, self.instance_id, *args)
+        except sqlite3.Error as e:
+            print(f"{action}失败（任务 {job_id}）: {str(e)}")
+            return
+        if not updated:
+            print(f"{action}已忽略（任务 {job_id}）: 租约已失效，任务已被恢复")
+
+    async def _execute(self, job: Dict[str, Any]):
+        handler = self._handlers.get(job['kind'])
+        if handler is None:
+            await self._update("记录AI任务失败", self.store.fail, job['id'], f"未注册的任务类型: {job['kind']}", None)
+            return
+
+        try:
+            result = await handler(job['params'])
+        except asyncio.CancelledError:
+            # 服务停止时放回队列；写入失败时由租约过期恢复
+            try:
+                await run_in_threadpool(self.store.requeue, job['id'], self.instance_id)
+            except sqlite3.Error as e:
+                print(f"AI任务放回队列失败（任务 {job['id']}）: {str(e)}")
+            raise
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            error_status = e.status_code if isinstance(e, HTTPException) else None
+            await self._update("记录AI任务失败", self.store.fail, job['id'], detail, error_status,
+                               self._retry_delay(job, e))
+            return
+
+        await self._update("保存AI任务结果", self.store.complete, job['id'], result)
+
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """任务记录的对外表示"""
+    return {
+        "id": job['id'],
+        "kind": job['kind'],
+        "status": job['status'],
+        "attempts": job['attempts'],
+        "max_attempts": job['max_attempts'],
+        "result": job['result'],
+        "error": job['error'],
+        "error_status": job['error_status'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+        "finished_at": job['finished_at']
+    }
+
+
+# 全局AI任务队列实例
+job_queue = JobQueue()
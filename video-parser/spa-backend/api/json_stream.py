@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+AI结构化输出的增量JSON解析模块
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+_WHITESPACE = ' \t\r\n'
+
+
+class IncrementalJSONParser:
+    """增量解析流式输出中的顶层JSON对象
+
+    逐段喂入模型输出，每当顶层对象的某个字段值闭合时立即产出 (字段名, 值)。
+    对象之前的说明文字、```json 代码块标记会被跳过；
+    即使结尾被截断或格式错误，已闭合的字段也会保留下来。
+    """
+
+    def __init__(self):
+        self._text: List[str] = []
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # key -> key_string -> colon -> value -> in_value -> after_value
+        self._expect = 'key'
+        self._key_start = 0
+        self._key: Optional[str] = None
+        self._value_start = 0
+        self._value_is_string = False
+        self.fields: Dict[str, Any] = {}
+        self.errors: List[str] = []
+
+    @property
+    def complete(self) -> bool:
+        """顶层对象是否已完整闭合"""
+        return self._done
+
+    def _slice(self, start: int, end: int) -> str:
+        return ''.join(self._text)[start:end]
+
+    def _emit(self, value_text: str, events: List[Tuple[str, Any]]):
+        try:
+            value = json.loads(value_text)
+        except ValueError:
+            self.errors.append(f"字段 '{self._key}' 无法解析")
+            return
+        self.fields[self._key] = value
+        events.append((self._key, value))
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """喂入一段输出，返回本段中新闭合的字段"""
+        events: List[Tuple[str, Any]] = []
+        if self._done or not chunk:
+            return events
+
+        base = self._pos
+        self._text.append(chunk)
+        self._pos += len(chunk)
+
+        for offset, c in enumerate(chunk):
+            i = base + offset
+            if self._done:
+                break
+
+            if not self._started:
+                if c == '{':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == 'key_string':
+                        try:
+                            self._key = json.loads(self._slice(self._key_start, i + 1))
+                        except ValueError:
+                            self._key = self._slice(self._key_start + 1, i)
+                        self._expect = 'colon'
+                    elif self._depth == 1 and self._expect == 'in_value' and self._value_is_string:
+                        self._emit(self._slice(self._value_start, i + 1), events)
+                        self._expect = 'after_value'
+                continue
+
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == 'key':
+                    self._key_start = i
+                    self._expect = 'key_string'
+                elif self._depth == 1 and self._expect == 'value':
+                    self._value_start = i
+                    self._value_is_string = True
+                    self._expect = 'in_value'
+                continue
+
+            if self._depth > 1:
+                if c in '{[':
+                    self._depth += 1
+                elif c in '}]':
+                    self._depth -= 1
+                    if self._depth == 1:
+                        self._emit(self._slice(self._value_start, i + 1), events)
+                        self._expect = 'after_value'
+                continue
+
+            # 顶层对象内部
+            if self._expect == 'colon':
+                if c == ':':
+                    self._expect = 'value'
+            elif self._expect == 'value':
+                if c in _WHITESPACE:
+                    continue
+                self._value_start = i
+                self._value_is_string = False
+                if c in '{[':
+                    self._depth += 1
+                self._expect = 'in_value'
+            elif self._expect == 'in_value':
+                # 数字、true/false/null 等标量在逗号或右括号处结束
+                if c in ',}':
+                    self._emit(self._slice(self._value_start, i).strip(), events)
+                    self._expect = 'key'
+                    if c == '}':
+                        self._done = True
+            elif c == '}':
+                self._done = True
+            elif c == ',' and self._expect == 'after_value':
+                self._expect = 'key'
+
+        return events
+
+
+def extract_json_object(content: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """从模型输出中提取JSON对象
+
+    返回 (结果, 是否完整)。整体无法解析时退回增量解析，保留已闭合的字段；
+    一个字段都没有时返回 (None, False)。
+    """
+    start_idx = content.find('{')
+    end_idx = content.rfind('}') + 1
+
+    if start_idx >= 0 and end_idx > start_idx:
+        try:
+            result = json.loads(content[start_idx:end_idx])
+            if isinstance(result, dict):
+                return result, True
+        except ValueError:
+            pass
+
+    parser = IncrementalJSONParser()
+    parser.feed(content)
+    if parser.fields:
+        return parser.fields, False
+    return None, False
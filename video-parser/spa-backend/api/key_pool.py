@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+AI密钥池模块
+"""
+
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import HTTPException, status
+
+from .keys import key_manager
+
+# 以该前缀传入 api_key_name 时启用密钥池，如 "pool:deepseek"
+POOL_PREFIX = "pool:"
+
+# 密钥池模式下单次请求最多尝试的密钥数
+POOL_MAX_ATTEMPTS = 3
+
+# 失败后的冷却时间（秒）
+COOLDOWN_ON_429 = 30.0
+COOLDOWN_ON_5XX = 5.0
+COOLDOWN_ON_ERROR = 5.0
+
+# 重试退避（秒），实际等待时间带随机抖动
+RETRY_BACKOFF_BASE = 0.2
+RETRY_BACKOFF_MAX = 2.0
+
+# 上游返回这些状态码时换一个密钥重试
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+
+
+def is_pool_name(api_key_name: str) -> bool:
+    """api_key_name 是否指向密钥池"""
+    return api_key_name.startswith(POOL_PREFIX)
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After / x-ratelimit-reset-* 中的时长，支持 "12"、"1.5s"、"6m0s"、"250ms" """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间（指数退避加抖动）"""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.5)
+
+
+class KeyState:
+    """单个密钥在本进程内的调度状态"""
+
+    def __init__(self):
+        self.outstanding = 0
+        self.cooldown_until = 0.0
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests = 0
+        self.failures = 0
+        self.last_status: Optional[int] = None
+
+
+class KeyPool:
+    """按组调度多个API密钥
+
+    选择在途请求最少且不在冷却期的密钥；上游返回 429/5xx 时
+    让该密钥进入冷却，调用方换下一个密钥重试。
+    """
+
+    def __init__(self):
+        self._states: Dict[str, KeyState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key_name: str) -> KeyState:
+        state = self._states.get(key_name)
+        if state is None:
+            state = KeyState()
+            self._states[key_name] = state
+        return state
+
+    def acquire(self, api_key_name: str, exclude: Optional[Set[str]] = None) -> str:
+        """为一次请求选出密钥并登记在途数，调用方必须配对调用 release"""
+        group = api_key_name[len(POOL_PREFIX):]
+        names = [name for name in key_manager.get_group_names(group) if name not in (exclude or set())]
+        if not names:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=f"密钥池 '{group}' 中没有可用的API密钥"
+            )
+
+        now = time.monotonic()
+        with self._lock:
+            available = [name for name in names if self._state(name).cooldown_until <= now]
+            if not available:
+                retry_after = min(self._state(name).cooldown_until for name in names) - now
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail=f"密钥池 '{group}' 中的密钥均在限流冷却中",
+                    headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+                )
+
+            # 在途请求最少优先，其次剩余配额多的优先，相同时随机打散
+            random.shuffle(available)
+            chosen = min(
+                available,
+                key=lambda name: (
+                    self._states[name].outstanding,
+                    -(self._states[name].remaining_requests or 0)
+                )
+            )
+            state = self._states[chosen]
+            state.outstanding += 1
+            state.requests += 1
+            return chosen
+
+    def release(self, key_name: str, status_code: Optional[int] = None,
+                headers: Optional[Any] = None, error: bool = False):
+        """请求结束时登记结果，更新限流信息和冷却时间"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key_name)
+            state.outstanding = max(0, state.outstanding - 1)
+            state.last_status = status_code
+
+            if headers is not None:
+                remaining = headers.get('x-ratelimit-remaining-requests')
+                if remaining is not None and remaining.isdigit():
+                    state.remaining_requests = int(remaining)
+                    if state.remaining_requests == 0:
+                        reset = parse_duration(headers.get('x-ratelimit-reset-requests'))
+                        if reset:
+                            state.cooldown_until = max(state.cooldown_until, now + reset)
+                remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+                if remaining_tokens is not None and remaining_tokens.isdigit():
+                    state.remaining_tokens = int(remaining_tokens)
+
+            if status_code == 429:
+                state.failures += 1
+                retry_after = parse_duration(headers.get('retry-after')) if headers is not None else None
+                state.cooldown_until = max(state.cooldown_until, now + (retry_after or COOLDOWN_ON_429))
+            elif status_code is not None and status_code >= 500:
+                state.failures += 1
+                state.cooldown_until = max(state.cooldown_until, now + COOLDOWN_ON_5XX)
+            elif error:
+                state.failures += 1
+                state.cooldown_until = max(state.cooldown_until, now + COOLDOWN_ON_ERROR)
+
+    def stats(self, group: str) -> List[Dict[str, Any]]:
+        """密钥组内各密钥的调度状态"""
+        now = time.monotonic()
+        result = []
+        with self._lock:
+            for name in key_manager.get_group_names(group):
+                state = self._state(name)
+                result.append({
+                    "name": name,
+                    "outstanding": state.outstanding,
+                    "cooldown": round(max(0.0, state.cooldown_until - now), 3),
+                    "remaining_requests": state.remaining_requests,
+                    "remaining_tokens": state.remaining_tokens,
+                    "requests": state.requests,
+                    "failures": state.failures,
+                    "last_status": state.last_status
+                })
+        return result
+
+
+# 全局密钥池实例
+key_pool = KeyPool()
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+API密钥存储后端
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+
+class KeyStorage(ABC):
+    """API密钥存储后端基类
+
+    记录以字典形式存取，字段与 APIKey 模型一致。
+    """
+
+    @abstractmethod
+    def load_all(self) -> Dict[str, dict]:
+        """加载全部密钥记录"""
+        pass
+
+    @abstractmethod
+    def get(self, name: str) -> Optional[dict]:
+        """按名称查询单条密钥记录"""
+        pass
+
+    @abstractmethod
+    def add(self, record: dict) -> bool:
+        """新增密钥记录，名称已存在时返回 False"""
+        pass
+
+    @abstractmethod
+    def update(self, name: str, key: str, description: Optional[str],
+               group: Optional[str] = None) -> bool:
+        """更新密钥内容，记录不存在时返回 False"""
+        pass
+
+    @abstractmethod
+    def delete(self, name: str) -> bool:
+        """删除密钥记录，记录不存在时返回 False"""
+        pass
+
+    @abstractmethod
+    def record_usage(self, usage: Dict[str, Tuple[int, str]]):
+        """累加使用统计，usage 为 {名称: (新增次数, 最后使用时间)}"""
+        pass
+
+    @abstractmethod
+    def version(self) -> int:
+        """密钥集合的版本号，增删改后变化，用于判断缓存是否过期"""
+        pass
+
+    def close(self):
+        """释放存储资源"""
+        pass
+
+
+class JSONFileKeyStorage(KeyStorage):
+    """JSON 文件存储（单进程部署使用）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write(self, data: Dict[str, dict]):
+        """临时文件写入后原子替换"""
+        fd, tmp_path = tempfile.mkstemp(
+            prefix='.api_keys.', suffix='.tmp', dir=os.path.dirname(self.path)
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def load_all(self) -> Dict[str, dict]:
+        with self._lock:
+            return self._read()
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            return self._read().get(name)
+
+    def add(self, record: dict) -> bool:
+        with self._lock:
+            data = self._read()
+            if record['name'] in data:
+                return False
+            data[record['name']] = record
+            self._write(data)
+            return True
+
+    def update(self, name: str, key: str, description: Optional[str],
+               group: Optional[str] = None) -> bool:
+        with self._lock:
+            data = self._read()
+            if name not in data:
+                return False
+            data[name]['key'] = key
+            if description is not None:
+                data[name]['description'] = description
+            if group is not None:
+                data[name]['group'] = group
+            self._write(data)
+            return True
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            data = self._read()
+            if name not in data:
+                return False
+            del data[name]
+            self._write(data)
+            return True
+
+    def record_usage(self, usage: Dict[str, Tuple[int, str]]):
+        with self._lock:
+            data = self._read()
+            for name, (count, last_used) in usage.items():
+                if name in data:
+                    data[name]['usage_count'] = data[name].get('usage_count', 0) + count
+                    data[name]['last_used'] = last_used
+            self._write(data)
+
+    def version(self) -> int:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+
+class SQLiteKeyStorage(KeyStorage):
+    """SQLite（WAL 模式）存储，多个 uvicorn worker 可共享同一数据库文件"""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS api_keys (
+            name TEXT PRIMARY KEY,
+            key TEXT NOT NULL,
+            description TEXT,
+            created_at TEXT NOT NULL,
+            last_used TEXT,
+            usage_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (name, value) VALUES ('keys_version', 0);
+    """
+
+    _COLUMNS = ('name', 'key', 'description', 'created_at', 'last_used', 'usage_count', 'key_group')
+
+    def __init__(self, path: str, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # 连接不能跨 fork 复用，进程变化时重新打开
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000,
+                                   check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+            conn.executescript(self._SCHEMA)
+            self._migrate(conn)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """为旧版数据库补充后续新增的列"""
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(api_keys)')}
+        if 'key_group' not in columns:
+            try:
+                conn.execute('ALTER TABLE api_keys ADD COLUMN key_group TEXT')
+            except sqlite3.OperationalError:
+                # 其他 worker 已经完成迁移
+                pass
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_api_keys_group ON api_keys (key_group)')
+
+    def _bump_version(self, conn: sqlite3.Connection):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'keys_version'")
+
+    def _row_to_record(self, row: sqlite3.Row) -> dict:
+        record = {column: row[column] for column in self._COLUMNS}
+        record['group'] = record.pop('key_group')
+        return record
+
+    def load_all(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._connection().execute('SELECT * FROM api_keys').fetchall()
+        return {row['name']: self._row_to_record(row) for row in rows}
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection().execute(
+                'SELECT * FROM api_keys WHERE name = ?', (name,)
+            ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def add(self, record: dict) -> bool:
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'INSERT INTO api_keys (name, key, description, created_at, last_used, usage_count, key_group) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (record['name'], record['key'], record.get('description'), record['created_at'],
+                     record.get('last_used'), record.get('usage_count', 0), record.get('group'))
+                )
+                self._bump_version(conn)
+                conn.execute('COMMIT')
+                return True
+            except sqlite3.IntegrityError:
+                conn.execute('ROLLBACK')
+                return False
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def update(self, name: str, key: str, description: Optional[str],
+               group: Optional[str] = None) -> bool:
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.execute(
+                    'UPDATE api_keys SET key = ?, description = COALESCE(?, description), '
+                    'key_group = COALESCE(?, key_group) WHERE name = ?',
+                    (key, description, group, name)
+                )
+                if cursor.rowcount:
+                    self._bump_version(conn)
+                conn.execute('COMMIT')
+                return cursor.rowcount > 0
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = conn.execute('DELETE FROM api_keys WHERE name = ?', (name,))
+                if cursor.rowcount:
+                    self._bump_version(conn)
+                conn.execute('COMMIT')
+                return cursor.rowcount > 0
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def record_usage(self, usage: Dict[str, Tuple[int, str]]):
+        """在单个事务中累加各 worker 的计数，不会互相覆盖"""
+        if not usage:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    'UPDATE api_keys SET usage_count = usage_count + ?, '
+                    'last_used = MAX(COALESCE(last_used, \'\'), ?) WHERE name = ?',
+                    [(count, last_used, name) for name, (count, last_used) in usage.items()]
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def version(self) -> int:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM meta WHERE name = 'keys_version'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            row = self._connection().execute('SELECT 1 FROM api_keys LIMIT 1').fetchone()
+        return row is None
+
+    def import_records(self, records: Dict[str, dict]):
+        """批量导入记录（从 JSON 文件迁移时使用）"""
+        for record in records.values():
+            self.add(record)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -4,14 +4,34 @@ API密钥管理模块
 """
 
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from pydantic import BaseModel
-from fastapi import HTTPException, status
-import json
+from fastapi import Header, HTTPException, status
+import atexit
+import hmac
+import threading
 import time
 
+from .key_storage import KeyStorage, JSONFileKeyStorage, SQLiteKeyStorage
+
+# 数据目录（密钥、历史记录、AI 任务），默认为 spa-backend/data
+DATA_DIR = os.environ.get('DATA_DIR') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
 # 密钥存储文件路径
-KEYS_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'api_keys.json')
+KEYS_FILE_PATH = os.path.join(DATA_DIR, 'api_keys.json')
+KEYS_DB_PATH = os.path.join(DATA_DIR, 'api_keys.db')
+
+# 存储后端：sqlite（多 worker 安全）或 json（单进程）
+KEY_STORAGE_BACKEND = os.environ.get('API_KEY_STORAGE', 'sqlite')
+
+# 使用统计批量落盘的间隔（秒）
+USAGE_FLUSH_INTERVAL = 30.0
+
+# 检查其他 worker 是否修改过密钥的最短间隔（秒）
+KEYS_REFRESH_INTERVAL = 1.0
+
+# 管理接口（如清空 AI 缓存）的令牌，通过 X-Admin-Token 请求头传入；未配置时管理接口不可用
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
 
 class APIKey(BaseModel):
     """API密钥模型"""
@@ -21,51 +41,133 @@ class APIKey(BaseModel):
     created_at: str
     last_used: Optional[str] = None
     usage_count: int = 0
+    group: Optional[str] = None
+
+
+def create_key_storage(backend: str = KEY_STORAGE_BACKEND) -> KeyStorage:
+    """按配置创建密钥存储后端"""
+    if backend == 'json':
+        return JSONFileKeyStorage(KEYS_FILE_PATH)
+
+    if backend == 'sqlite':
+        storage = SQLiteKeyStorage(KEYS_DB_PATH)
+        # 首次启用 SQLite 时迁移已有的 JSON 密钥文件
+        if storage.is_empty() and os.path.exists(KEYS_FILE_PATH):
+            try:
+                storage.import_records(JSONFileKeyStorage(KEYS_FILE_PATH).load_all())
+            except Exception as e:
+                print(f"迁移API密钥失败: {str(e)}")
+        return storage
+
+    raise ValueError(f"不支持的密钥存储后端: {backend}")
+
 
 class APIKeyManager:
-    """API密钥管理器"""
+    """API密钥管理器
 
-    def __init__(self):
+    密钥在进程内缓存，读取为纯内存操作；缓存按存储版本号失效，
+    使用统计在内存中累加后批量写入存储。
+    """
+
+    def __init__(self, storage: Optional[KeyStorage] = None,
+                 flush_interval: float = USAGE_FLUSH_INTERVAL,
+                 refresh_interval: float = KEYS_REFRESH_INTERVAL):
         self._ensure_data_dir()
-        self._keys = self._load_keys()
+        self._storage = storage or create_key_storage()
+        self._lock = threading.RLock()
+        self._refresh_interval = refresh_interval
+        self._version = -1
+        self._last_refresh = 0.0
+        self._keys: Dict[str, APIKey] = {}
+
+        # 尚未落盘的使用统计 {名称: (次数, 最后使用时间)}
+        self._pending_usage: Dict[str, Tuple[int, str]] = {}
+        self._load_keys()
+
+        self._flush_interval = flush_interval
+        self._flush_stop = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+        atexit.register(self.flush)
 
     def _ensure_data_dir(self):
         """确保数据目录存在"""
-        data_dir = os.path.dirname(KEYS_FILE_PATH)
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
+        if not os.path.exists(DATA_DIR):
+            os.makedirs(DATA_DIR, exist_ok=True)
 
-    def _load_keys(self) -> Dict[str, APIKey]:
-        """加载API密钥"""
+    def _load_keys(self):
+        """从存储加载API密钥到缓存"""
         try:
-            if not os.path.exists(KEYS_FILE_PATH):
-                return {}
+            version = self._storage.version()
+            records = self._storage.load_all()
+        except Exception as e:
+            print(f"加载API密钥失败: {str(e)}")
+            return
 
-            with open(KEYS_FILE_PATH, 'r', encoding='utf-8') as f:
-                keys_data = json.load(f)
+        keys = {name: APIKey(**record) for name, record in records.items()}
+        with self._lock:
+            # 叠加本进程尚未落盘的使用统计
+            for name, (count, last_used) in self._pending_usage.items():
+                if name in keys:
+                    keys[name].usage_count += count
+                    keys[name].last_used = last_used
+            self._keys = keys
+            self._version = version
+            self._last_refresh = time.monotonic()
 
-            return {
-                name: APIKey(**key_data) 
-                for name, key_data in keys_data.items()
-            }
+    def _refresh_if_changed(self):
+        """按间隔检查存储版本号，其他 worker 修改过密钥时重新加载"""
+        if time.monotonic() - self._last_refresh < self._refresh_interval:
+            return
+        try:
+            version = self._storage.version()
         except Exception as e:
-            print(f"加载API密钥失败: {str(e)}")
-            return {}
+            print(f"检查API密钥版本失败: {str(e)}")
+            return
+        if version != self._version:
+            self._load_keys()
+        else:
+            self._last_refresh = time.monotonic()
+
+    def flush(self):
+        """将内存中累积的使用统计写入存储"""
+        with self._lock:
+            pending, self._pending_usage = self._pending_usage, {}
+        if not pending:
+            return
 
-    def _save_keys(self):
-        """保存API密钥"""
         try:
-            with open(KEYS_FILE_PATH, 'w', encoding='utf-8') as f:
-                json.dump(
-                    {name: key.dict() for name, key in self._keys.items()}, 
-                    f, 
-                    ensure_ascii=False, 
-                    indent=2
-                )
+            self._storage.record_usage(pending)
         except Exception as e:
-            print(f"保存API密钥失败: {str(e)}")
+            print(f"保存API密钥使用统计失败: {str(e)}")
+            # 写入失败时合并回待写队列，下次重试
+            with self._lock:
+                for name, (count, last_used) in pending.items():
+                    current_count, current_last_used = self._pending_usage.get(name, (0, last_used))
+                    self._pending_usage[name] = (count + current_count, max(last_used, current_last_used))
+
+    def _flush_loop(self):
+        while not self._flush_stop.wait(self._flush_interval):
+            self.flush()
+
+    def start_usage_flusher(self):
+        """启动后台定时落盘线程"""
+        if self._flush_thread and self._flush_thread.is_alive():
+            return
+        self._flush_stop.clear()
+        self._flush_thread = threading.Thread(
+            target=self._flush_loop, name='api-key-usage-flusher', daemon=True
+        )
+        self._flush_thread.start()
 
-    def add_key(self, name: str, key: str, description: str = None) -> APIKey:
+    def stop_usage_flusher(self):
+        """停止后台落盘线程并写入剩余的使用统计"""
+        self._flush_stop.set()
+        if self._flush_thread:
+            self._flush_thread.join(timeout=5)
+            self._flush_thread = None
+        self.flush()
+
+    def add_key(self, name: str, key: str, description: str = None, group: str = None) -> APIKey:
         """添加API密钥"""
         if not name or not key:
             raise HTTPException(
@@ -73,60 +175,112 @@ class APIKeyManager:
                 detail="密钥名称和密钥不能为空"
             )
 
-        if name in self._keys:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail=f"密钥名称 '{name}' 已存在"
-            )
-
         api_key = APIKey(
             name=name,
             key=key,
             description=description,
-            created_at=time.strftime("%Y-%m-%d %H:%M:%S")
+            created_at=time.strftime("%Y-%m-%d %H:%M:%S"),
+            group=group
         )
 
-        self._keys[name] = api_key
-        self._save_keys()
+        if not self._storage.add(api_key.dict()):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"密钥名称 '{name}' 已存在"
+            )
 
+        self._load_keys()
         return api_key
 
+    def _lookup(self, name: str) -> Optional[APIKey]:
+        """按名称查找密钥，不更新使用统计"""
+        self._refresh_if_changed()
+
+        with self._lock:
+            key = self._keys.get(name)
+
+        if key is None:
+            # 缓存未命中时按名称查一次存储，避免其他 worker 刚添加的密钥不可见
+            record = self._storage.get(name)
+            if record is None:
+                return None
+            key = APIKey(**record)
+            with self._lock:
+                key = self._keys.setdefault(name, key)
+        return key
+
+    def has_key(self, name: str) -> bool:
+        """密钥是否存在（不计入使用次数）"""
+        return self._lookup(name) is not None
+
     def get_key(self, name: str) -> Optional[APIKey]:
-        """获取API密钥"""
-        key = self._keys.get(name)
-        if key:
+        """获取API密钥（读取进程内缓存，使用统计延迟落盘）"""
+        key = self._lookup(name)
+        if key is None:
+            return None
+
+        with self._lock:
             # 更新使用时间和次数
-            key.last_used = time.strftime("%Y-%m-%d %H:%M:%S")
+            now = time.strftime("%Y-%m-%d %H:%M:%S")
+            key.last_used = now
             key.usage_count += 1
-            self._save_keys()
+            count, _ = self._pending_usage.get(name, (0, now))
+            self._pending_usage[name] = (count + 1, now)
 
         return key
 
+    def get_group_names(self, group: str) -> List[str]:
+        """获取密钥组内的全部密钥名称（读取进程内缓存）"""
+        self._refresh_if_changed()
+        with self._lock:
+            return sorted(name for name, key in self._keys.items() if key.group == group)
+
     def list_keys(self) -> Dict[str, APIKey]:
         """列出所有API密钥"""
-        return {name: APIKey(**key.dict(exclude={'key'})) for name, key in self._keys.items()}
+        self._load_keys()
+        with self._lock:
+            keys = dict(self._keys)
+        return {name: APIKey(**key.dict(exclude={'key'})) for name, key in keys.items()}
 
     def delete_key(self, name: str) -> bool:
         """删除API密钥"""
-        if name not in self._keys:
+        if not self._storage.delete(name):
             return False
 
-        del self._keys[name]
-        self._save_keys()
+        with self._lock:
+            self._pending_usage.pop(name, None)
+        self._load_keys()
         return True
 
-    def update_key(self, name: str, new_key: str, description: str = None) -> Optional[APIKey]:
+    def update_key(self, name: str, new_key: str, description: str = None,
+                   group: str = None) -> Optional[APIKey]:
         """更新API密钥"""
-        if name not in self._keys:
+        if not self._storage.update(name, new_key, description, group):
             return None
 
-        self._keys[name].key = new_key
-        if description is not None:
-            self._keys[name].description = description
+        self._load_keys()
+        with self._lock:
+            return self._keys.get(name)
 
-        self._save_keys()
-        return self._keys[name]
+    def close(self):
+        """停止后台任务并释放存储"""
+        self.stop_usage_flusher()
+        self._storage.close()
 
 
 # 全局API密钥管理器实例
 key_manager = APIKeyManager()
+
+
+def verify_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """校验管理令牌，作为管理接口的路由依赖"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="管理接口未启用，请配置 ADMIN_TOKEN"
+        )
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="管理令牌无效"
+        )
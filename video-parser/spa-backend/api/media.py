@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+播放清单与媒体代理路由
+
+由解析结果生成 DASH MPD / HLS 播放列表，播放器可直接从 CDN 或经由本服务的
+媒体代理（附带平台要求的 Referer，转发 Range 请求）按需加载分段；
+也可以按时间段截取片段，只下载覆盖该时间段的分段。
+"""
+
+import os
+import re
+from functools import partial
+from typing import Callable, Optional
+from urllib.parse import quote
+
+import requests
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from core.clip import ClipError, extract_clip
+from core.deadline import clamp_timeout
+from core.manifest import build_hls_master, build_hls_media, build_mpd, hls_supported
+from core.media import (
+    MediaError, get_segment_index_loader, open_media, sign_media_url, use_signing_key_file, verify_media_token
+)
+from core.mp4 import MP4Error
+from core.parser import MediaRepresentation, VideoMetadata, get_parser_engine
+
+from .keys import DATA_DIR
+
+router = APIRouter()
+
+DASH_MEDIA_TYPE = 'application/dash+xml'
+HLS_MEDIA_TYPE = 'application/vnd.apple.mpegurl'
+
+# 代理转发的上游响应头
+PROXY_RESPONSE_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges',
+                          'Content-Encoding', 'Last-Modified', 'ETag')
+
+PROXY_CHUNK_SIZE = 64 * 1024
+
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w.-]')
+
+# 未配置 MEDIA_SIGNING_KEY 时使用的签名密钥文件，同一主机上的 worker 共用
+MEDIA_SIGNING_KEY_PATH = os.path.join(DATA_DIR, 'media_signing.key')
+
+
+def init_media_signing():
+    """启动时加载媒体代理的签名密钥"""
+    use_signing_key_file(MEDIA_SIGNING_KEY_PATH)
+
+
+async def _load_metadata(url: str) -> VideoMetadata:
+    """解析视频（通常命中解析缓存），没有 DASH 音视频流时返回 404"""
+    if not url:
+        raise HTTPException(status_code=400, detail="URL cannot be empty")
+    engine = get_parser_engine()
+    result = await run_in_threadpool(engine.parse_video, url, clamp_timeout(None))
+    if isinstance(result, dict):
+        raise HTTPException(status_code=400, detail=result.get('reason') or "Unsupported video platform")
+    if not result.representations:
+        raise HTTPException(status_code=404,
+                            detail=result.reason or "该视频没有 DASH 音视频流")
+    return result
+
+
+def _media_url(proxy: bool) -> Callable[[str], str]:
+    """清单中的媒体地址：CDN 原链接，或本服务的媒体代理地址（附带签名令牌）"""
+    if not proxy:
+        return lambda url: url
+    return lambda url: f"/api/media?url={quote(url, safe='')}&token={sign_media_url(url)}"
+
+
+@router.get("/manifest.mpd")
+async def get_dash_manifest(url: str, proxy: bool = False):
+    """生成 DASH MPD；proxy=true 时媒体地址指向本服务的媒体代理"""
+    metadata = await _load_metadata(url)
+    return Response(content=build_mpd(metadata, _media_url(proxy)), media_type=DASH_MEDIA_TYPE)
+
+
+@router.get("/manifest.m3u8")
+async def get_hls_master_playlist(url: str, proxy: bool = False):
+    """生成 HLS 主播放列表"""
+    metadata = await _load_metadata(url)
+    if not hls_supported(metadata):
+        raise HTTPException(status_code=404, detail="该视频的音视频流缺少分段索引，无法生成 HLS 播放列表")
+
+    def playlist_url(representation: MediaRepresentation) -> str:
+        return (f"/api/manifest/{quote(representation.id, safe='')}.m3u8"
+                f"?url={quote(url, safe='')}&proxy={str(proxy).lower()}")
+
+    return Response(content=build_hls_master(metadata, playlist_url), media_type=HLS_MEDIA_TYPE)
+
+
+@router.get("/manifest/{representation_id}.m3u8")
+async def get_hls_media_playlist(representation_id: str, url: str, proxy: bool = False):
+    """生成一个音视频表示的 HLS 媒体播放列表（读取其 sidx 分段索引）"""
+    metadata = await _load_metadata(url)
+    representation = next(
+        (item for item in metadata.representations if item.id == representation_id), None
+    )
+    if representation is None or not hls_supported(metadata):
+        raise HTTPException(status_code=404, detail="Representation not found")
+    try:
+        index = await run_in_threadpool(get_segment_index_loader().load, representation,
+                                        metadata.canonical_id)
+    except (MediaError, MP4Error, requests.RequestException) as e:
+        raise HTTPException(status_code=502, detail=f"读取分段索引失败: {str(e)}")
+    return Response(content=build_hls_media(representation, index, _media_url(proxy)),
+                    media_type=HLS_MEDIA_TYPE)
+
+
+@router.get("/media")
+async def proxy_media(url: str, token: str, request: Request, timeout: Optional[float] = None):
+    """媒体代理：只转发播放清单中签发过的 CDN 链接，附带 Referer 并透传 Range 请求"""
+    try:
+        verify_media_token(url, token)
+    except MediaError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+    try:
+        upstream = await run_in_threadpool(open_media, url, request.headers.get('range'), clamp_timeout(timeout))
+    except MediaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except requests.RequestException as e:
+        raise HTTPException(status_code=502, detail=f"媒体文件请求失败: {str(e)}")
+    if upstream.status_code >= 300:
+        upstream.close()
+        raise HTTPException(status_code=502, detail=f"媒体文件请求失败: HTTP {upstream.status_code}")
+
+    return StreamingResponse(
+        # 不解压内容编码，保证与转发的 Content-Length/Content-Range 一致
+        iterate_in_threadpool(upstream.raw.stream(PROXY_CHUNK_SIZE, decode_content=False)),
+        status_code=upstream.status_code,
+        headers={name: upstream.headers[name] for name in PROXY_RESPONSE_HEADERS if name in upstream.headers},
+        background=BackgroundTask(upstream.close)
+    )
+
+
+@router.get("/clip")
+async def get_clip(url: str, start: float, end: float, quality: Optional[str] = None):
+    """截取 [start, end) 秒的片段，返回音视频合并后的 MP4
+
+    只下载覆盖该时间段的分段；起止时间扩展到分段边界，实际范围见 X-Clip-Start / X-Clip-End。
+    """
+    metadata = await _load_metadata(url)
+    try:
+        clip = await run_in_threadpool(extract_clip, metadata, start, end, quality)
+    except ClipError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (MediaError, MP4Error, requests.RequestException) as e:
+        raise HTTPException(status_code=502, detail=f"截取片段失败: {str(e)}")
+
+    name = _UNSAFE_FILENAME_CHARS.sub('_', metadata.canonical_id or 'clip')
+    return StreamingResponse(
+        iterate_in_threadpool(iter(partial(clip.file.read, PROXY_CHUNK_SIZE), b'')),
+        media_type='video/mp4',
+        headers={
+            'Content-Length': str(clip.size),
+            'Content-Disposition': f'attachment; filename="{name}_{clip.start:g}-{clip.end:g}.mp4"',
+            'X-Clip-Start': f'{clip.start:.3f}',
+            'X-Clip-End': f'{clip.end:.3f}',
+        },
+        background=BackgroundTask(clip.file.close)
+    )
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+客户端限流中间件模块
+"""
+
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from core.ratelimit import RateLimiter, RateLimitExceeded, client_identity, create_default_limiter
+
+
+class RateLimitMiddleware:
+    """ASGI 客户端限流中间件
+
+    超过每分钟请求数或每日配额时直接返回 429 和 Retry-After，不进入准入控制和路由处理。
+    """
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.limiter.classify(scope['method'], scope['path'])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get('client')
+        identity, multiplier = client_identity(Headers(scope=scope), client[0] if client else None)
+        try:
+            if self.limiter.shared:
+                # 共享后端（sqlite/redis）的访问会阻塞，放到线程池中执行
+                await run_in_threadpool(self.limiter.check, policy, identity, multiplier)
+            else:
+                self.limiter.check(policy, identity, multiplier)
+        except RateLimitExceeded as e:
+            response = JSONResponse(
+                status_code=e.status_code,
+                content={"success": False, "error": f"{str(e)}，请 {e.retry_after} 秒后重试"},
+                headers={"Retry-After": str(e.retry_after), "X-RateLimit-Limit": str(e.limit)}
+            )
+            await response(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+
+def _create_limiter() -> RateLimiter:
+    limiter = create_default_limiter()
+    limiter.add_rule('POST', r'^/api/parse$', 'parse')
+    # 生成播放清单需要解析视频，与解析共用额度
+    limiter.add_rule('GET', r'^/api/manifest', 'parse')
+    limiter.add_rule('GET', r'^/api/clip$', 'clip')
+    limiter.add_rule('GET', r'^/api/media$', 'media')
+    # 批量分析（含任务提交）单独计数，其余 AI 生成与分析共用一个策略
+    limiter.add_rule('POST', r'^/api/ai/correlation-analysis/batch', 'batch')
+    limiter.add_rule('POST', r'^/api/ai/', 'ai')
+    return limiter
+
+
+# 全局限流器实例
+rate_limiter = _create_limiter()
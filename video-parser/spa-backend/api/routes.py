@@ -3,28 +3,93 @@
 API路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Any, List, Optional, AsyncIterator, Callable
 from pydantic import BaseModel
+import json
+import time
 
-from .keys import key_manager, APIKey
-from .ai_service import ai_service, AIRequest
+from .keys import key_manager, verify_admin_token, APIKey
+from .ai_service import (
+    ai_service, AIRequest, AIResponse, ContentSectionsRequest, CorrelationBatchRequest
+)
+from .ai_cache import ai_cache
+from .key_pool import key_pool
+from .jobs import job_queue, job_view, FINISHED_STATUSES
+from .history import history_store, HistoryRecord, HISTORY_DEFAULT_LIMIT, HISTORY_EVENTS
+from .admission import admission_controller
+from .ratelimit import rate_limiter
 
 router = APIRouter()
 
+# SSE订阅任务状态时的心跳间隔（秒）
+JOB_EVENTS_HEARTBEAT = 15.0
+
+job_queue.register(
+    "correlation",
+    lambda params: ai_service.correlation_analysis(**params)
+)
+job_queue.register(
+    "correlation_batch",
+    lambda params: ai_service.batch_correlation_analysis(**params)
+)
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条SSE事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_response(events: AsyncIterator[Dict[str, Any]],
+                        finalize: Callable[[AIResponse], Dict[str, Any]]) -> StreamingResponse:
+    """将AI流式事件转换为SSE响应
+
+    先取出第一个事件再返回响应，密钥缺失、上游拒绝等错误仍以普通HTTP错误返回；
+    开始推送后的错误以 error 事件告知客户端。
+    """
+    first = await events.__anext__()
+
+    async def body():
+        event = first
+        try:
+            while True:
+                if event["type"] == "done":
+                    yield _sse_event("done", finalize(event["response"]))
+                    return
+                yield _sse_event(event["type"], {k: v for k, v in event.items() if k != "type"})
+                event = await events.__anext__()
+        except StopAsyncIteration:
+            pass
+        except HTTPException as e:
+            yield _sse_event("error", {"success": False, "error": e.detail})
+        except Exception as e:
+            yield _sse_event("error", {"success": False, "error": str(e)})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # API密钥相关路由
 @router.post("/keys", response_model=Dict[str, Any])
-async def create_api_key(name: str, key: str, description: Optional[str] = None):
-    """创建API密钥"""
+async def create_api_key(name: str, key: str, description: Optional[str] = None,
+                         group: Optional[str] = None):
+    """创建API密钥（group 用于组成密钥池）"""
     try:
-        api_key = key_manager.add_key(name, key, description)
+        api_key = key_manager.add_key(name, key, description, group)
         return {
             "success": True,
             "message": "API密钥创建成功",
             "key": {
                 "name": api_key.name,
                 "description": api_key.description,
-                "created_at": api_key.created_at
+                "created_at": api_key.created_at,
+                "group": api_key.group
             }
         }
     except HTTPException:
@@ -51,10 +116,11 @@ async def list_api_keys():
         )
 
 @router.put("/keys/{key_name}", response_model=Dict[str, Any])
-async def update_api_key(key_name: str, new_key: str, description: Optional[str] = None):
+async def update_api_key(key_name: str, new_key: str, description: Optional[str] = None,
+                         group: Optional[str] = None):
     """更新API密钥"""
     try:
-        api_key = key_manager.update_key(key_name, new_key, description)
+        api_key = key_manager.update_key(key_name, new_key, description, group)
         if not api_key:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -103,10 +169,22 @@ async def delete_api_key(key_name: str):
 
 # AI服务相关路由
 @router.post("/ai/generate", response_model=Dict[str, Any])
-async def generate_text(request: AIRequest, api_key_name: str = "default"):
-    """生成文本"""
+async def generate_text(request: AIRequest, api_key_name: str = "default",
+                        bypass_cache: bool = False, stream: bool = False):
+    """生成文本（stream=true 时以SSE推送）"""
     try:
-        response = await ai_service.generate_text(request, api_key_name)
+        if stream:
+            return await _sse_response(
+                ai_service.stream_text(request, api_key_name, bypass_cache),
+                lambda response: {
+                    "success": True,
+                    "content": response.content,
+                    "model": response.model,
+                    "usage": response.usage
+                }
+            )
+
+        response = await ai_service.generate_text(request, api_key_name, bypass_cache)
         return {
             "success": True,
             "content": response.content,
@@ -122,10 +200,22 @@ async def generate_text(request: AIRequest, api_key_name: str = "default"):
         )
 
 @router.post("/ai/analyze-video", response_model=Dict[str, Any])
-async def analyze_video(video_data: Dict[str, Any], api_key_name: str = "default"):
-    """分析视频内容"""
+async def analyze_video(video_data: Dict[str, Any], api_key_name: str = "default",
+                        bypass_cache: bool = False, stream: bool = False):
+    """分析视频内容（stream=true 时以SSE推送）"""
     try:
-        result = await ai_service.analyze_video_content(video_data, api_key_name)
+        if stream:
+            return await _sse_response(
+                ai_service.stream_structured(
+                    ai_service.build_analysis_request(video_data), api_key_name, bypass_cache
+                ),
+                lambda response: {
+                    "success": True,
+                    "result": ai_service.parse_analysis_result(response)
+                }
+            )
+
+        result = await ai_service.analyze_video_content(video_data, api_key_name, bypass_cache)
         return {
             "success": True,
             "result": result
@@ -143,12 +233,52 @@ async def generate_content(
     video_data: Dict[str, Any], 
     content_type: str, 
     platform: Optional[str] = None, 
-    api_key_name: str = "default"
+    api_key_name: str = "default",
+    bypass_cache: bool = False,
+    stream: bool = False
 ):
-    """生成内容文案"""
+    """生成内容文案（stream=true 时以SSE推送）"""
     try:
+        if stream:
+            # 完整文案为JSON结构，逐字段推送
+            stream_method = ai_service.stream_structured if content_type == "full" else ai_service.stream_text
+            return await _sse_response(
+                stream_method(
+                    ai_service.build_content_request(video_data, content_type, platform),
+                    api_key_name,
+                    bypass_cache
+                ),
+                lambda response: {
+                    "success": True,
+                    "result": ai_service.parse_content_result(response, content_type, platform)
+                }
+            )
+
         result = await ai_service.generate_content_copy(
-            video_data, content_type, platform, api_key_name
+            video_data, content_type, platform, api_key_name, bypass_cache
+        )
+        return {
+            "success": True,
+            "result": result
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"生成内容文案失败: {str(e)}"
+        )
+
+@router.post("/ai/generate-content/sections", response_model=Dict[str, Any])
+async def generate_content_sections(
+    request: ContentSectionsRequest,
+    api_key_name: str = "default",
+    bypass_cache: bool = False
+):
+    """并发生成多个文案分段（可同时针对多个平台）"""
+    try:
+        result = await ai_service.generate_content_sections(
+            request.video_data, request.content_types, request.platforms, api_key_name, bypass_cache
         )
         return {
             "success": True,
@@ -166,94 +296,283 @@ async def generate_content(
 async def correlation_analysis(
     analysis_data: Dict[str, Any], 
     analysis_type: str, 
-    api_key_name: str = "default"
+    api_key_name: str = "default",
+    bypass_cache: bool = False,
+    narrative: bool = True
 ):
-    """相关性分析"""
+    """相关性分析（耗时较长时建议使用 /ai/correlation-analysis/jobs 异步提交）
+
+    content 类型在本地计算关键词和相似度，narrative=false 时不调用模型生成文字解读。
+    """
     try:
-        # 构建分析提示
-        if analysis_type == "audience":
-            prompt = f"""请对以下内容进行受众分析：
+        result = await ai_service.correlation_analysis(
+            analysis_data, analysis_type, api_key_name, bypass_cache, narrative
+        )
+        return {"success": True, **result}
 
-分析目标：{analysis_data.get('target', '')}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"相关性分析失败: {str(e)}"
+        )
 
-请从以下几个方面进行分析：
-1. 年龄段分布
-2. 性别分布
-3. 兴趣标签（5-10个）
-4. 活跃时段
-5. 内容偏好（按类别和百分比）
-6. 针对性策略建议（3-5条）
+@router.post("/ai/correlation-analysis/jobs", response_model=Dict[str, Any],
+             status_code=status.HTTP_202_ACCEPTED)
+async def submit_correlation_analysis(
+    analysis_data: Dict[str, Any],
+    analysis_type: str,
+    api_key_name: str = "default",
+    bypass_cache: bool = False,
+    narrative: bool = True
+):
+    """异步提交相关性分析，通过 /ai/jobs/{job_id} 轮询或 /ai/jobs/{job_id}/events 订阅结果"""
+    try:
+        # 提交前校验分析类型，避免无效任务进入队列
+        ai_service.build_correlation_request(analysis_data, analysis_type)
+        job = await job_queue.submit("correlation", {
+            "analysis_data": analysis_data,
+            "analysis_type": analysis_type,
+            "api_key_name": api_key_name,
+            "bypass_cache": bypass_cache,
+            "narrative": narrative
+        })
+        return {
+            "success": True,
+            "job": job_view(job)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"提交相关性分析任务失败: {str(e)}"
+        )
 
-请以JSON格式返回分析结果。"""
+@router.post("/ai/correlation-analysis/batch", response_model=Dict[str, Any])
+async def batch_correlation_analysis(
+    request: CorrelationBatchRequest,
+    api_key_name: str = "default",
+    bypass_cache: bool = False
+):
+    """多视频相关性分析（分块摘要后汇总），视频较多时建议使用 /ai/correlation-analysis/batch/jobs"""
+    try:
+        result = await ai_service.batch_correlation_analysis(
+            request.videos, request.analysis_type, request.target, request.compare,
+            api_key_name, bypass_cache
+        )
+        return {"success": True, **result}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"多视频相关性分析失败: {str(e)}"
+        )
 
-        elif analysis_type == "content":
-            prompt = f"""请对以下内容进行内容相关性分析：
+@router.post("/ai/correlation-analysis/batch/jobs", response_model=Dict[str, Any],
+             status_code=status.HTTP_202_ACCEPTED)
+async def submit_batch_correlation_analysis(
+    request: CorrelationBatchRequest,
+    api_key_name: str = "default",
+    bypass_cache: bool = False
+):
+    """异步提交多视频相关性分析"""
+    try:
+        ai_service.validate_correlation_batch(request.videos, request.analysis_type)
+        job = await job_queue.submit("correlation_batch", dict(
+            request.dict(), api_key_name=api_key_name, bypass_cache=bypass_cache
+        ))
+        return {
+            "success": True,
+            "job": job_view(job)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"提交多视频相关性分析任务失败: {str(e)}"
+        )
 
-分析目标：{analysis_data.get('target', '')}
-对比内容：{analysis_data.get('compare', '')}
+async def _get_job_or_404(job_id: str) -> Dict[str, Any]:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"任务 '{job_id}' 不存在"
+        )
+    return job
 
-请从以下几个方面进行分析：
-1. 关键词提取和相关性评分
-2. 主题分布和权重
-3. 与对比内容的多维度相似度分析
+@router.get("/ai/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_ai_job(job_id: str):
+    """查询异步任务状态和结果"""
+    return {
+        "success": True,
+        "job": job_view(await _get_job_or_404(job_id))
+    }
 
-请以JSON格式返回分析结果。"""
+@router.get("/ai/jobs/{job_id}/events")
+async def subscribe_ai_job(job_id: str):
+    """以SSE订阅异步任务：状态变化时推送 status 事件，结束时推送 done 事件"""
+    job = await _get_job_or_404(job_id)
 
-        elif analysis_type == "trend":
-            prompt = f"""请对以下内容进行趋势分析：
+    async def body():
+        current = job
+        while True:
+            if current["status"] in FINISHED_STATUSES:
+                yield _sse_event("done", {"success": True, "job": job_view(current)})
+                return
+            yield _sse_event("status", {"job": job_view(current)})
 
-分析目标：{analysis_data.get('target', '')}
+            updated = await job_queue.wait_for_update(job_id, current["updated_at"], JOB_EVENTS_HEARTBEAT)
+            if updated is None:
+                yield _sse_event("error", {"success": False, "error": f"任务 '{job_id}' 不存在"})
+                return
+            if updated["updated_at"] == current["updated_at"]:
+                # 长时间无变化时发送注释行保持连接
+                yield ": keep-alive\n\n"
+            current = updated
 
-请从以下几个方面进行分析：
-1. 过去30天的热度变化（每日数据）
-2. 相关话题和趋势变化
-3. 未来1-4周的预测和建议
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-请以JSON格式返回分析结果。"""
+@router.get("/ai/cache/stats", response_model=Dict[str, Any])
+async def get_ai_cache_stats():
+    """获取AI响应缓存统计"""
+    return {
+        "success": True,
+        "stats": ai_cache.stats()
+    }
 
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"不支持的分析类型: {analysis_type}"
-            )
+@router.get("/admission/stats", response_model=Dict[str, Any])
+async def get_admission_stats():
+    """获取各准入通道的并发、排队和拒绝统计"""
+    return {
+        "success": True,
+        "lanes": admission_controller.stats()
+    }
 
-        # 调用AI生成分析结果
-        request = AIRequest(prompt=prompt, model="deepseek-reasoner")
-        response = await ai_service.generate_text(request, api_key_name)
+@router.get("/ratelimit/stats", response_model=Dict[str, Any])
+async def get_rate_limit_stats():
+    """获取各限流策略的上限、放行和拒绝统计"""
+    return {
+        "success": True,
+        "stats": rate_limiter.stats()
+    }
 
-        # 尝试解析JSON结果
-        try:
-            # 查找JSON部分
-            content = response.content
-            start_idx = content.find('{')
-            end_idx = content.rfind('}') + 1
-
-            if start_idx >= 0 and end_idx > start_idx:
-                json_str = content[start_idx:end_idx]
-                return {
-                    "success": True,
-                    "result": json.loads(json_str),
-                    "model": response.model,
-                    "usage": response.usage
-                }
-        except:
-            pass
+@router.get("/ai/key-pools/{group}", response_model=Dict[str, Any])
+async def get_key_pool_stats(group: str):
+    """获取密钥池内各密钥的调度状态，AI接口传入 api_key_name=pool:<组名> 时使用该密钥池"""
+    keys = key_pool.stats(group)
+    if not keys:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"密钥池 '{group}' 不存在"
+        )
+    return {
+        "success": True,
+        "group": group,
+        "keys": keys
+    }
 
-        # 如果无法解析JSON，返回原始内容
+@router.delete("/ai/cache", response_model=Dict[str, Any], dependencies=[Depends(verify_admin_token)])
+async def clear_ai_cache():
+    """清空AI响应缓存（需要 X-Admin-Token 请求头）"""
+    try:
+        await run_in_threadpool(ai_cache.clear)
         return {
             "success": True,
-            "result": {
-                "analysis": response.content,
-                "type": analysis_type
-            },
-            "model": response.model,
-            "usage": response.usage
+            "message": "AI响应缓存已清空"
         }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"清空AI响应缓存失败: {str(e)}"
+        )
 
-    except HTTPException:
-        raise
+# 历史记录相关路由
+@router.post("/history", response_model=Dict[str, Any])
+async def record_history(record: HistoryRecord):
+    """上报一条历史记录（如下载）"""
+    if record.event not in HISTORY_EVENTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的记录类型: {record.event}"
+        )
+    try:
+        record_id = await run_in_threadpool(history_store.record, record.dict())
+        return {
+            "success": True,
+            "id": record_id
+        }
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"相关性分析失败: {str(e)}"
+            detail=f"保存历史记录失败: {str(e)}"
+        )
+
+@router.get("/history", response_model=Dict[str, Any])
+async def list_history(
+    cursor: Optional[int] = None,
+    limit: int = HISTORY_DEFAULT_LIMIT,
+    q: Optional[str] = None,
+    platform: Optional[str] = None,
+    canonical_id: Optional[str] = None,
+    client_id: str = Query(..., min_length=1),
+    event: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None
+):
+    """分页查询一个客户端的历史记录（按时间倒序），q 为标题全文检索，翻页时传入上一页的 next_cursor"""
+    try:
+        page = await run_in_threadpool(
+            history_store.query, cursor=cursor, limit=limit, q=q, platform=platform, canonical_id=canonical_id,
+            client_id=client_id, event=event, since=since, until=until
+        )
+        return {
+            "success": True,
+            **page
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查询历史记录失败: {str(e)}"
+        )
+
+@router.get("/history/stats", response_model=Dict[str, Any])
+async def get_history_stats(days: int = 30, client_id: Optional[str] = None,
+                            x_admin_token: Optional[str] = Header(None)):
+    """最近 days 天按平台和日期聚合的次数；不传 client_id 时为全部客户端的汇总，需要 X-Admin-Token"""
+    if not client_id:
+        verify_admin_token(x_admin_token)
+    try:
+        since = time.time() - days * 86400 if days > 0 else None
+        return {
+            "success": True,
+            "stats": await run_in_threadpool(history_store.stats, since, client_id)
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"获取历史统计失败: {str(e)}"
+        )
+
+@router.delete("/history", response_model=Dict[str, Any])
+async def clear_history(client_id: str = Query(..., min_length=1)):
+    """清空一个客户端的历史记录"""
+    try:
+        deleted = await run_in_threadpool(history_store.delete, client_id)
+        return {
+            "success": True,
+            "deleted": deleted
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"清空历史记录失败: {str(e)}"
         )
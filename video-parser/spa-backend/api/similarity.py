@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+本地文本相似度模块
+"""
+
+import heapq
+import re
+import unicodedata
+from collections import Counter
+from itertools import chain, repeat
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 词表上限，按文档频率保留最常见的特征
+SIMILARITY_MAX_FEATURES = 8192
+
+# 中文等连续字符取 n-gram 的长度范围
+SIMILARITY_NGRAM_RANGE = (2, 3)
+
+# 分块计算相似度时每块的文档数，控制稠密化后的内存占用
+SIMILARITY_BLOCK_ROWS = 1024
+
+# 稠密化后的整个语料不超过该字节数时缓存复用，超过时每次按块重新稠密化
+SIMILARITY_DENSE_MAX_BYTES = 256 * 1024 * 1024
+
+# 中日韩字符连续段或字母数字单词
+_TOKEN_RUN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af]+|[a-z0-9]+(?:[\'\-][a-z0-9]+)*')
+_CJK_CHAR = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af]')
+
+
+def extract_terms(text: str, ngram_range: Tuple[int, int] = SIMILARITY_NGRAM_RANGE) -> List[str]:
+    """切分特征：中日韩字符取字符 n-gram（无需分词词典），其他文字按单词"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    low, high = ngram_range
+    terms: List[str] = []
+    for run in _TOKEN_RUN.findall(text):
+        if not _CJK_CHAR.match(run):
+            terms.append(run)
+            continue
+        if len(run) < low:
+            terms.append(run)
+            continue
+        for n in range(low, high + 1):
+            terms.extend([run[i:i + n] for i in range(len(run) - n + 1)])
+    return terms
+
+
+class TfidfIndex:
+    """字符 n-gram TF-IDF 索引
+
+    文档向量以 CSR 稀疏格式保存（indptr/indices/data），已做 L2 归一化，
+    余弦相似度即为向量点积。两两相似度按行块与语料块分块稠密化后用矩阵乘法计算，
+    内存占用与块大小成正比；语料稠密化后不超过 SIMILARITY_DENSE_MAX_BYTES 时只稠密化一次。
+    """
+
+    def __init__(self, documents: List[str], max_features: int = SIMILARITY_MAX_FEATURES,
+                 ngram_range: Tuple[int, int] = SIMILARITY_NGRAM_RANGE):
+        self.ngram_range = ngram_range
+        doc_terms = [extract_terms(doc, ngram_range) for doc in documents]
+        self.size = len(documents)
+
+        # 统计文档频率，超出上限时保留最常见的特征
+        document_frequency: Dict[str, int] = Counter(chain.from_iterable(map(set, doc_terms)))
+        vocabulary = list(document_frequency)
+        if len(vocabulary) > max_features:
+            # 只对入选的特征排序：文档频率高于第 max_features 名的全部保留，与其相同的按特征补足
+            df = np.fromiter(document_frequency.values(), dtype=np.int64, count=len(vocabulary))
+            threshold = np.partition(df, len(df) - max_features)[len(df) - max_features]
+            above = [vocabulary[i] for i in np.flatnonzero(df > threshold)]
+            ties = heapq.nsmallest(max_features - len(above),
+                                   (vocabulary[i] for i in np.flatnonzero(df == threshold)))
+            vocabulary = above + ties
+        vocabulary = sorted(vocabulary, key=lambda term: (-document_frequency[term], term))
+        self.terms = vocabulary
+        self.vocabulary = {term: i for i, term in enumerate(vocabulary)}
+
+        df = np.array([document_frequency[term] for term in vocabulary], dtype=np.float32)
+        # 平滑 idf，与 sklearn 的 smooth_idf 一致
+        self.idf = np.log((1.0 + self.size) / (1.0 + df)) + 1.0
+
+        # 整个语料一次性向量化：以 (文档, 特征) 组合键计数，避免逐文档循环
+        vocab_size = max(len(vocabulary), 1)
+        doc_ids = np.repeat(np.arange(self.size, dtype=np.int64), [len(terms) for terms in doc_terms])
+        term_ids = np.fromiter(
+            map(self.vocabulary.get, chain.from_iterable(doc_terms), repeat(-1)),
+            dtype=np.int64, count=len(doc_ids)
+        )
+        keep = term_ids >= 0
+        keys, counts = np.unique(doc_ids[keep] * vocab_size + term_ids[keep], return_counts=True)
+        rows, self.indices = keys // vocab_size, (keys % vocab_size).astype(np.int32)
+        # 次线性 tf，避免标题中重复词权重过高
+        self.data = ((1.0 + np.log(counts)) * self.idf[self.indices]).astype(np.float32)
+        norms = np.sqrt(np.bincount(rows, weights=self.data.astype(np.float64) ** 2, minlength=self.size))
+        self.data /= np.where(norms > 0, norms, 1.0)[rows].astype(np.float32)
+        self.indptr = np.zeros(self.size + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum(np.bincount(rows, minlength=self.size))
+        self._dense_corpus: Optional[List[Tuple[int, int, np.ndarray]]] = None
+
+    def _vectorize(self, terms: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """把特征列表转换为归一化的稀疏向量 (indices, data)"""
+        ids = np.fromiter(
+            (self.vocabulary[term] for term in terms if term in self.vocabulary), dtype=np.int32
+        )
+        if ids.size == 0:
+            return np.zeros(0, np.int32), np.zeros(0, np.float32)
+        indices, counts = np.unique(ids, return_counts=True)
+        # 次线性 tf，避免标题中重复词权重过高
+        data = ((1.0 + np.log(counts)) * self.idf[indices]).astype(np.float32)
+        norm = np.linalg.norm(data)
+        if norm > 0:
+            data /= norm
+        return indices.astype(np.int32), data
+
+    def _dense_rows(self, start: int, stop: int) -> np.ndarray:
+        """将第 start..stop 行稠密化"""
+        block = np.zeros((stop - start, len(self.terms)), dtype=np.float32)
+        lo, hi = self.indptr[start], self.indptr[stop]
+        row_ids = np.repeat(np.arange(stop - start), np.diff(self.indptr[start:stop + 1]))
+        block[row_ids, self.indices[lo:hi]] = self.data[lo:hi]
+        return block
+
+    def _blocks(self):
+        """按文档分块稠密化的语料 (起始行, 结束行, 行块)；总量不超过内存上限时缓存复用，
+        否则每次遍历时重新稠密化"""
+        if self._dense_corpus is not None:
+            return self._dense_corpus
+        blocks = (
+            (start, min(start + SIMILARITY_BLOCK_ROWS, self.size),
+             self._dense_rows(start, min(start + SIMILARITY_BLOCK_ROWS, self.size)))
+            for start in range(0, self.size, SIMILARITY_BLOCK_ROWS)
+        )
+        if self.size * len(self.terms) * 4 > SIMILARITY_DENSE_MAX_BYTES:
+            return blocks
+        self._dense_corpus = list(blocks)
+        return self._dense_corpus
+
+    def _scores(self, dense: np.ndarray) -> np.ndarray:
+        """稠密行块（r×V）与全部文档的点积（r×N）"""
+        scores = np.empty((dense.shape[0], self.size), dtype=np.float32)
+        for start, stop, block in self._blocks():
+            scores[:, start:stop] = dense @ block.T
+        return scores
+
+    def keywords(self, top_k: int = 20) -> List[Tuple[str, float]]:
+        """整体关键词及权重（各文档 TF-IDF 之和，归一化到最大值为 1）"""
+        if not self.terms:
+            return []
+        weights = np.bincount(self.indices, weights=self.data, minlength=len(self.terms))
+        top = np.argsort(-weights, kind='stable')[:top_k]
+        scale = weights[top[0]] or 1.0
+        return [(self.terms[i], round(float(weights[i] / scale), 4)) for i in top if weights[i] > 0]
+
+    def document_keywords(self, index: int, top_k: int = 5) -> List[Tuple[str, float]]:
+        """单个文档的关键词及权重"""
+        lo, hi = self.indptr[index], self.indptr[index + 1]
+        order = np.argsort(-self.data[lo:hi], kind='stable')[:top_k]
+        return [(self.terms[self.indices[lo + i]], round(float(self.data[lo + i]), 4)) for i in order]
+
+    def similarity_matrix(self) -> np.ndarray:
+        """全部文档两两之间的余弦相似度（N×N）"""
+        matrix = np.zeros((self.size, self.size), dtype=np.float32)
+        for row_start, row_stop, rows in self._blocks():
+            matrix[row_start:row_stop] = self._scores(rows)
+        return matrix
+
+    def most_similar(self, top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """每个文档最相似的 top_k 个其他文档，不生成完整矩阵，适合大量文档"""
+        top_k = min(top_k, self.size - 1)
+        result: List[List[Tuple[int, float]]] = []
+        if top_k <= 0:
+            return [[] for _ in range(self.size)]
+
+        for row_start, row_stop, rows in self._blocks():
+            scores = self._scores(rows)
+            # 排除自身
+            scores[np.arange(row_stop - row_start), np.arange(row_start, row_stop)] = -1.0
+            candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1, kind='stable')
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            candidate_scores = np.round(np.take_along_axis(candidate_scores, order, axis=1).astype(np.float64), 4)
+            result.extend(
+                list(zip(row.tolist(), row_scores.tolist()))
+                for row, row_scores in zip(candidates, candidate_scores)
+            )
+        return result
+
+    def similarity_to(self, text: str) -> np.ndarray:
+        """查询文本与全部文档的余弦相似度"""
+        indices, data = self._vectorize(extract_terms(text, self.ngram_range))
+        query = np.zeros((1, len(self.terms)), dtype=np.float32)
+        query[0, indices] = data
+        return self._scores(query)[0]
+
+    def shared_terms(self, first: int, second: int, top_k: int = 10) -> List[Tuple[str, float]]:
+        """两个文档共有的特征，按两侧权重乘积排序"""
+        a_lo, a_hi = self.indptr[first], self.indptr[first + 1]
+        b_lo, b_hi = self.indptr[second], self.indptr[second + 1]
+        common, a_pos, b_pos = np.intersect1d(
+            self.indices[a_lo:a_hi], self.indices[b_lo:b_hi], assume_unique=True, return_indices=True
+        )
+        weights = self.data[a_lo:a_hi][a_pos] * self.data[b_lo:b_hi][b_pos]
+        order = np.argsort(-weights, kind='stable')[:top_k]
+        return [(self.terms[common[i]], round(float(weights[i]), 4)) for i in order]
+
+
+def round_matrix(matrix: np.ndarray, digits: int = 4) -> List[List[float]]:
+    """将矩阵转换为保留指定小数位的嵌套列表，便于JSON序列化"""
+    return matrix.astype(np.float64).round(digits).tolist()
+
+
+def video_text(video: Dict, description_chars: Optional[int] = 500) -> str:
+    """视频用于相似度计算的文本：标题、标签和描述"""
+    tags = video.get('tags') or []
+    if isinstance(tags, str):
+        tags = [tags]
+    description = str(video.get('description') or '')
+    if description_chars is not None:
+        description = description[:description_chars]
+    return ' '.join([str(video.get('title') or ''), ' '.join(str(tag) for tag in tags), description])
@@ -7,7 +7,9 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import logging
 from typing import Dict, Any, List, Optional
 import os
@@ -19,21 +21,54 @@ logger = logging.getLogger(__name__)
 # 导入核心解析器
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from core.parser import parse_video_url, PlatformType
+from core.parser import parse_video_url, get_parser_engine, PlatformType
+from core.deadline import clamp_timeout
 
 # 导入API路由
 from api.routes import router as api_router
+from api.media import router as media_router, init_media_signing
+from api.keys import key_manager
+from api.ai_service import ai_service
+from api.jobs import job_queue
+from api.history import history_store
+from api.admission import AdmissionMiddleware, admission_controller
+from api.ratelimit import RateLimitMiddleware, rate_limiter
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后台任务，关闭时释放资源"""
+    key_manager.start_usage_flusher()
+    init_media_signing()
+    # 预先创建 CPU 进程池的工作进程，避免首个请求承担启动开销
+    await run_in_threadpool(get_parser_engine().start)
+    await ai_service.startup()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await ai_service.shutdown()
+    get_parser_engine().shutdown()
+    key_manager.stop_usage_flusher()
+
 
 app = FastAPI(
     title="多平台视频链接解析与下载引擎 API",
     description="合规、可扩展、可维护的视频链接解析与下载系统",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# 添加准入控制中间件（需在CORS中间件之前添加，使拒绝响应也带有CORS头）
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# 添加客户端限流中间件（在准入控制之外，超限的客户端不占用通道名额）
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 # 添加CORS中间件
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # 在生产环境中应该设置具体的允许来源
+    # 在生产环境中应通过 CORS_ALLOW_ORIGINS（逗号分隔）设置具体的允许来源
+    allow_origins=os.environ.get('CORS_ALLOW_ORIGINS', '*').split(','),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -44,10 +79,13 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # 包含API路由
 app.include_router(api_router, prefix="/api", tags=["API"])
+app.include_router(media_router, prefix="/api", tags=["Media"])
 
 # 定义请求模型
 class ParseRequest(BaseModel):
     url: str
+    timeout: Optional[float] = None  # 解析时限（秒），未指定时使用 PARSE_DEFAULT_TIMEOUT
+    client_id: Optional[str] = None  # 客户端标识，用于按客户端查询和清空解析历史
 
 # 定义响应模型
 class StreamInfo(BaseModel):
@@ -58,6 +96,19 @@ class StreamInfo(BaseModel):
     size: Optional[int] = None
     duration: Optional[int] = None
 
+class RepresentationInfo(BaseModel):
+    id: str
+    kind: str
+    url: str
+    mime_type: str
+    codecs: str
+    bandwidth: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    frame_rate: Optional[str] = None
+    initialization: Optional[str] = None
+    index_range: Optional[str] = None
+
 class ParseResponse(BaseModel):
     success: bool
     platform: Optional[str] = None
@@ -67,6 +118,9 @@ class ParseResponse(BaseModel):
     streams: Optional[List[StreamInfo]] = None
     downloadable: Optional[bool] = None
     reason: Optional[str] = None
+    canonical_id: Optional[str] = None
+    stale: Optional[bool] = None
+    representations: Optional[List[RepresentationInfo]] = None
     disclaimer: Optional[str] = None
 
 class PlatformInfo(BaseModel):
@@ -88,18 +142,42 @@ async def parse_video(request: ParseRequest):
 
         # 解析视频
         logger.info(f"解析视频URL: {url}")
-        result = parse_video_url(url)
+        # 解析会阻塞在上游请求上，放到线程池中执行，避免阻塞事件循环
+        result = await run_in_threadpool(parse_video_url, url, clamp_timeout(request.timeout))
 
         # 添加免责声明
         if result.get('success') and result.get('downloadable'):
             result['disclaimer'] = "本工具仅解析平台允许下载的公开视频内容，请遵守原平台版权与使用协议"
 
+        # 记录解析历史，失败不影响解析结果
+        if result.get('success'):
+            try:
+                await run_in_threadpool(history_store.record, {
+                    'event': 'parse',
+                    'platform': result.get('platform'),
+                    'canonical_id': result.get('canonical_id'),
+                    'url': url,
+                    'title': result.get('title'),
+                    'duration': result.get('duration'),
+                    'client_id': request.client_id
+                })
+            except Exception as e:
+                logger.error(f"记录解析历史失败: {str(e)}")
+
         return result
 
     except Exception as e:
         logger.error(f"解析视频时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.get("/api/parse/cache/stats")
+async def get_parse_cache_stats():
+    """获取解析结果缓存、短链接缓存、热点预刷新和 CPU 进程池的统计信息"""
+    return {
+        'success': True,
+        'stats': get_parser_engine().cache_stats()
+    }
+
 @app.get("/api/platforms", response_model=PlatformsResponse)
 async def get_supported_platforms():
     """获取支持的平台列表"""
@@ -177,7 +255,9 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         content={
             'success': False,
             'error': exc.detail
-        }
+        },
+        # 保留 Retry-After 等异常附带的响应头
+        headers=getattr(exc, 'headers', None)
     )
 
 @app.exception_handler(Exception)
@@ -13,14 +13,14 @@ const API_BASE_URL = process.env.NODE_ENV === 'production'
  * @param {string} url - 视频URL
  * @returns {Promise} - 解析结果
  */
-export const parseVideoUrl = async (url) => {
+export const parseVideoUrl = async (url, clientId) => {
   try {
     const response = await fetch(`${API_BASE_URL}/api/parse`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ url }),
+      body: JSON.stringify({ url, client_id: clientId }),
     });
 
     if (!response.ok) {
@@ -73,3 +73,169 @@ export const healthCheck = async () => {
     throw error;
   }
 };
+
+/**
+ * 以SSE方式调用AI接口（/ai/generate、/ai/generate-content、/ai/analyze-video）
+ * @param {string} path - 接口路径，如 '/api/ai/generate-content'
+ * @param {Object} body - 请求体
+ * @param {Object} params - 查询参数，会自动附加 stream=true
+ * @param {Object} handlers - 事件回调：onContent(片段)、onReasoning(片段)、onField(字段名, 值)
+ * @returns {Promise} - done 事件中的最终结果
+ */
+export const streamAIRequest = async (path, body, params = {}, handlers = {}) => {
+  const query = new URLSearchParams({ ...params, stream: 'true' });
+  const response = await fetch(`${API_BASE_URL}${path}?${query}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
+    },
+    body: JSON.stringify(body),
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.error || 'AI请求失败');
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder('utf-8');
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE事件以空行分隔
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary >= 0) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+
+      const payload = JSON.parse(data);
+      if (event === 'content' && handlers.onContent) handlers.onContent(payload.content);
+      else if (event === 'reasoning' && handlers.onReasoning) handlers.onReasoning(payload.content);
+      else if (event === 'field' && handlers.onField) handlers.onField(payload.key, payload.value);
+      else if (event === 'error') throw new Error(payload.error || 'AI请求失败');
+      else if (event === 'done') return payload;
+    }
+  }
+
+  throw new Error('AI流式响应意外中断');
+};
+
+/**
+ * 提交异步AI任务（如 /api/ai/correlation-analysis/jobs）
+ * @param {string} path - 提交接口路径
+ * @param {Object} body - 请求体
+ * @param {Object} params - 查询参数
+ * @returns {Promise} - 任务记录，包含 id 和 status
+ */
+export const submitAIJob = async (path, body, params = {}) => {
+  const query = new URLSearchParams(params);
+  const response = await fetch(`${API_BASE_URL}${path}?${query}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(body),
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.error || '提交任务失败');
+  }
+
+  return (await response.json()).job;
+};
+
+/**
+ * 轮询异步AI任务直到结束，页面刷新后可凭任务ID继续等待
+ * @param {string} jobId - 任务ID
+ * @param {Object} options - interval 轮询间隔（毫秒）、onStatus(任务记录) 状态回调
+ * @returns {Promise} - 任务成功时的结果
+ */
+export const waitForAIJob = async (jobId, { interval = 2000, onStatus } = {}) => {
+  while (true) {
+    const response = await fetch(`${API_BASE_URL}/api/ai/jobs/${jobId}`);
+    if (!response.ok) {
+      const errorData = await response.json();
+      throw new Error(errorData.error || '查询任务失败');
+    }
+
+    const { job } = await response.json();
+    if (onStatus) onStatus(job);
+    if (job.status === 'succeeded') return job.result;
+    if (job.status === 'failed') throw new Error(job.error || '任务执行失败');
+
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+};
+
+/**
+ * 上报一条历史记录
+ * @param {Object} record - 记录内容：event、title、platform、quality、format、client_id 等
+ * @returns {Promise} - 保存结果
+ */
+export const recordHistory = async (record) => {
+  const response = await fetch(`${API_BASE_URL}/api/history`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(record),
+  });
+
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.error || '保存历史记录失败');
+  }
+
+  return await response.json();
+};
+
+/**
+ * 分页查询服务端历史记录（按时间倒序）
+ * @param {Object} params - 查询参数：client_id（必填）、q（标题检索）、platform、event、cursor（上一页的 next_cursor）、limit
+ * @returns {Promise} - { items, next_cursor }
+ */
+export const fetchHistory = async (params = {}) => {
+  const query = new URLSearchParams(
+    Object.entries(params).filter(([, value]) => value !== undefined && value !== null && value !== '')
+  );
+  const response = await fetch(`${API_BASE_URL}/api/history?${query}`);
+
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.error || '查询历史记录失败');
+  }
+
+  return await response.json();
+};
+
+/**
+ * 清空服务端历史记录
+ * @param {string} clientId - 客户端标识，只清空该客户端的记录
+ * @returns {Promise} - 删除结果
+ */
+export const clearServerHistory = async (clientId) => {
+  const query = new URLSearchParams({ client_id: clientId });
+  const response = await fetch(`${API_BASE_URL}/api/history?${query}`, { method: 'DELETE' });
+
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.error || '清空历史记录失败');
+  }
+
+  return await response.json();
+};
@@ -3,11 +3,25 @@
  * 下载历史管理
  */
 
-import { ref, watch } from 'vue';
+import { computed, ref } from 'vue';
+import { recordHistory, fetchHistory, clearServerHistory } from '../api/api';
 
 const STORAGE_KEY = 'video_parser_download_history';
+const CLIENT_ID_KEY = 'video_parser_client_id';
 const history = ref([]);
-const MAX_HISTORY = 100; // 最大保存100条记录
+const MAX_HISTORY = 100; // 本地最多缓存100条记录，完整历史保存在服务端
+const SERVER_PAGE_SIZE = 50;
+const serverCursor = ref(null); // 服务端历史下一页的游标，为空表示没有更多记录
+
+// 客户端标识，用于在服务端区分各浏览器的历史记录
+const getClientId = () => {
+  let clientId = localStorage.getItem(CLIENT_ID_KEY);
+  if (!clientId) {
+    clientId = `${Date.now().toString(36)}${Math.random().toString(36).slice(2, 10)}`;
+    localStorage.setItem(CLIENT_ID_KEY, clientId);
+  }
+  return clientId;
+};
 
 // 从本地存储加载历史记录
 const loadHistory = () => {
@@ -25,7 +39,7 @@ const loadHistory = () => {
 // 保存历史记录到本地存储
 const saveHistory = () => {
   try {
-    localStorage.setItem(STORAGE_KEY, JSON.stringify(history.value));
+    localStorage.setItem(STORAGE_KEY, JSON.stringify(history.value.slice(0, MAX_HISTORY)));
   } catch (error) {
     console.error('保存下载历史失败:', error);
   }
@@ -44,24 +58,66 @@ const addToHistory = (item) => {
   }
 
   saveHistory();
+
+  // 同步到服务端，失败时只保留本地记录
+  recordHistory({
+    event: 'download',
+    title: item.title,
+    platform: item.platform,
+    quality: item.quality,
+    format: item.format,
+    client_id: getClientId()
+  }).catch((error) => console.error('同步下载历史失败:', error));
+};
+
+// 服务端记录转换为本地记录的格式
+const fromServerRecord = (record) => ({
+  id: `server-${record.id}`,
+  title: record.title,
+  platform: record.platform,
+  quality: record.quality,
+  format: record.format,
+  timestamp: new Date(record.created_at * 1000).toISOString()
+});
+
+// 从服务端加载下载历史；more 为 true 时加载下一页并追加，否则用第一页替换本地缓存
+const loadServerHistory = async (more = false) => {
+  if (more && !serverCursor.value) return;
+  try {
+    const page = await fetchHistory({
+      client_id: getClientId(),
+      event: 'download',
+      limit: SERVER_PAGE_SIZE,
+      cursor: more ? serverCursor.value : undefined
+    });
+    const items = page.items.map(fromServerRecord);
+    history.value = more ? history.value.concat(items) : items;
+    serverCursor.value = page.next_cursor;
+    saveHistory();
+  } catch (error) {
+    // 服务端不可用时继续使用本地缓存
+    console.error('加载服务端历史失败:', error);
+  }
 };
 
 // 清空历史记录
 const clearHistory = () => {
   history.value = [];
+  serverCursor.value = null;
   saveHistory();
+  clearServerHistory(getClientId()).catch((error) => console.error('清空服务端历史失败:', error));
 };
 
 // 初始化时加载历史记录
 loadHistory();
 
-// 监听历史记录变化，自动保存
-watch(history, saveHistory, { deep: true });
-
 export function useDownloadHistory() {
   return {
     history,
+    hasMoreServerHistory: computed(() => Boolean(serverCursor.value)),
     addToHistory,
-    clearHistory
+    clearHistory,
+    loadServerHistory,
+    getClientId
   };
 }